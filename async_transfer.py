@@ -0,0 +1,676 @@
+# -*- coding: utf-8 -*-
+from concurrent import futures
+import abc
+import asyncio
+import contextlib
+import functools
+import importlib.util
+import io
+import logging
+import posixpath
+import ssl
+import time
+from urllib import parse
+
+import compress
+import integrity
+import metrics
+import registry
+import retry
+import throttle
+import transfer
+
+# Parameters of the async engine, for messages with many small files, where the
+# time goes into the latency of each request rather than into the bytes
+# files in flight at the same time
+ASYNC_CONCURRENCY = 200
+# sessions opened to each FTP/FTPS host, as each runs one transfer at a time
+ASYNC_SESSIONS = 8
+# files larger than this fail instead of being held in memory
+ASYNC_MAX_SIZE = 8 * 1024 * 1024
+# threads sending the S3 requests, as many as the connections of a boto3 client
+ASYNC_S3_THREADS = 10
+# package, and the module checked for it, used on each scheme
+ASYNC_PACKAGES = {
+    "ftp": ("aioftp", "aioftp"),
+    "ftps": ("aioftp", "aioftp"),
+    "sftp": ("asyncssh", "asyncssh"),
+    "gs": ("gcloud-aio-storage", "gcloud.aio.storage"),
+}
+
+
+async def pace(bucket, size):
+    # waits, without blocking the event loop, for the bandwidth of the host
+    if bucket is not None:
+        wait = bucket.reserve(size)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+async def run_sync(function, *args, executor=None):
+    # blocking calls go to a thread, as asyncio.to_thread needs Python 3.9
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, function, *args)
+
+
+# Abstract base class for the async file transfers
+class AsyncFileTransfer(object, metaclass=abc.ABCMeta):
+    def __init__(
+        self, connection_string, service_account: str = None, options: dict = None
+    ):
+        self.conn_str = connection_string
+        self.service_account = service_account
+        self.options = options or {}
+
+    @abc.abstractmethod
+    async def connect(self):
+        raise NotImplementedError("Abstract method")
+
+    @abc.abstractmethod
+    async def disconnect(self):
+        # called even when connect failed halfway
+        raise NotImplementedError("Abstract method")
+
+    @abc.abstractmethod
+    async def read_file(self, file_path: str):
+        # returns the whole content of the file
+        raise NotImplementedError("Abstract method")
+
+    @abc.abstractmethod
+    async def write_file(self, file_name: str, data: bytes, digest=None):
+        # checks the written file against the digest, when given
+        raise NotImplementedError("Abstract method")
+
+
+class AsyncSftpFileTransfer(AsyncFileTransfer):
+    """
+    SFTP through asyncssh, whose requests are multiplexed over a single
+    connection, reconnected once for all the files in flight when it drops
+    """
+
+    def __init__(
+        self, connection_string, service_account: str = None, options: dict = None
+    ):
+        super().__init__(connection_string, service_account, options)
+        self.ssh = None
+        self.sftp = None
+        # created in connect, as asyncio objects bind to the loop running then
+        self.lock = None
+        self.folders = set()
+        self.release_session = None
+        self.bucket = None
+
+    async def connect(self):
+        self.lock = asyncio.Lock()
+        # the session and bandwidth limits shared with the sync connections
+        await run_sync(transfer.acquire_host_session, self)
+        await self._client()
+        logging.info("Connected to SFTP: " + self.conn_str.netloc)
+
+    async def _client(self):
+        async with self.lock:
+            if self.sftp is None:
+                import asyncssh
+
+                # parsing the query parameters to a dictionary for the login components
+                auth_info = dict(parse.parse_qs(self.conn_str.query))
+                self.ssh = await asyncssh.connect(
+                    self.conn_str.hostname,
+                    port=self.conn_str.port or 22,
+                    username=auth_info["username"][0],
+                    password=auth_info["password"][0],
+                    # ignoring known_hosts
+                    known_hosts=None,
+                )
+                self.sftp = await self.ssh.start_sftp_client()
+            return self.sftp
+
+    async def _call(self, operation):
+        sftp = await self._client()
+        try:
+            return await operation(sftp)
+        except Exception as error:
+            import asyncssh
+
+            dropped = (asyncssh.DisconnectError, asyncssh.SFTPConnectionLost)
+            if isinstance(error, dropped) and self.sftp is sftp:
+                # the next call opens a new connection
+                self._close()
+            raise
+
+    def _close(self):
+        ssh, self.ssh, self.sftp = self.ssh, None, None
+        if ssh is not None:
+            ssh.close()
+
+    async def disconnect(self):
+        ssh = self.ssh
+        self._close()
+        if ssh is not None:
+            await ssh.wait_closed()
+        transfer.release_host_session(self)
+        logging.info("Disconnected from SFTP: " + self.conn_str.netloc)
+
+    async def read_file(self, file_path):
+        async def read(sftp):
+            async with sftp.open(file_path, "rb") as f:
+                return await f.read()
+
+        data = await self._call(read)
+        await pace(self.bucket, len(data))
+        return data
+
+    async def write_file(self, file_name, data, digest=None):
+        remote_path = posixpath.join(self.conn_str.path, file_name)
+        folder_path = posixpath.dirname(remote_path)
+        await pace(self.bucket, len(data))
+
+        async def write(sftp):
+            # creating the subfolders of recursive transfers, once each
+            if folder_path not in self.folders:
+                await sftp.makedirs(folder_path, exist_ok=True)
+                self.folders.add(folder_path)
+            async with sftp.open(remote_path, "wb") as f:
+                await f.write(data)
+            if digest is not None:
+                attrs = await sftp.stat(remote_path)
+                integrity.check_size(remote_path, attrs.size, digest.size)
+
+        await self._call(write)
+
+
+class AsyncFtpFileTransfer(AsyncFileTransfer):
+    """
+    FTP through aioftp. A session runs one transfer at a time, so the files in
+    flight share async_sessions of them, each reopened after a failure that
+    may have left it out of sync
+    """
+
+    def __init__(
+        self, connection_string, service_account: str = None, options: dict = None
+    ):
+        super().__init__(connection_string, service_account, options)
+        # created in connect, as asyncio objects bind to the loop running then
+        self.idle = None
+        self.clients = []
+        self.releases = []
+        self.folders = set()
+        self.bucket = None
+
+    def _ssl(self):
+        return None
+
+    async def connect(self):
+        self.idle = asyncio.Queue()
+        host = self.conn_str.hostname
+        bandwidth_limit, max_sessions = throttle.host_options(
+            self.conn_str, self.options
+        )
+        self.bucket = throttle.HOST_LIMITS.bucket(host, bandwidth_limit)
+        sessions = max(self.options.get("async_sessions", ASYNC_SESSIONS), 1)
+        for _ in range(sessions):
+            # the session limits shared with the sync connections
+            release = await run_sync(
+                throttle.HOST_LIMITS.acquire_session,
+                host,
+                max_sessions,
+                self.options.get("session_timeout", throttle.SESSION_TIMEOUT),
+            )
+            if release is not None:
+                self.releases.append(release)
+
+        results = await asyncio.gather(
+            *[self._login() for _ in range(sessions)], return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+        for client in results:
+            self.idle.put_nowait(client)
+        logging.info(
+            "Connected to %s with %s sessions: %s"
+            % (self.conn_str.scheme.upper(), sessions, self.conn_str.netloc)
+        )
+
+    async def _login(self):
+        import aioftp
+
+        client = aioftp.Client(ssl=self._ssl())
+        # registering before connecting so a half open session is still closed
+        self.clients.append(client)
+        await client.connect(self.conn_str.hostname, self.conn_str.port or 21)
+        # parsing the query parameters to a dictionary for the login components
+        auth_info = dict(parse.parse_qs(self.conn_str.query))
+        await client.login(auth_info["username"][0], auth_info["password"][0])
+        return client
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        import aioftp
+
+        client = await self.idle.get()
+        try:
+            if client is None:
+                # reopening a session dropped after a failure
+                client = await self._login()
+            yield client
+        except Exception as error:
+            # a rejected command leaves the session usable
+            if client is not None and not isinstance(error, aioftp.StatusCodeError):
+                self._close(client)
+                client = None
+            raise
+        finally:
+            self.idle.put_nowait(client)
+
+    def _close(self, client):
+        self.clients.remove(client)
+        client.close()
+
+    async def disconnect(self):
+        clients, self.clients = self.clients, []
+        for client in clients:
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
+        releases, self.releases = self.releases, []
+        for release in releases:
+            release()
+        logging.info("Disconnected from %s" % self.conn_str.netloc)
+
+    async def read_file(self, file_path):
+        async with self.session() as client:
+            async with client.download_stream(file_path) as stream:
+                data = b"".join([block async for block in stream.iter_by_block()])
+        await pace(self.bucket, len(data))
+        return data
+
+    async def write_file(self, file_name, data, digest=None):
+        remote_path = posixpath.join(self.conn_str.path, file_name)
+        folder_path = posixpath.dirname(remote_path)
+        await pace(self.bucket, len(data))
+        async with self.session() as client:
+            # creating the subfolders of recursive transfers, once each
+            if folder_path not in self.folders:
+                await client.make_directory(folder_path)
+                self.folders.add(folder_path)
+            async with client.upload_stream(remote_path) as stream:
+                await stream.write(data)
+            if digest is not None:
+                info = await client.stat(remote_path)
+                integrity.check_size(remote_path, int(info["size"]), digest.size)
+
+
+class AsyncFtpsFileTransfer(AsyncFtpFileTransfer):
+    def _ssl(self):
+        # implicit TLS, like the sync FTPS connections
+        return ssl._create_stdlib_context(ssl.PROTOCOL_TLSv1_2)
+
+
+class AsyncGcsFileTransfer(AsyncFileTransfer):
+    """GCS through gcloud-aio-storage, over a pool of async_concurrency connections"""
+
+    def __init__(
+        self, connection_string, service_account: str = None, options: dict = None
+    ):
+        super().__init__(connection_string, service_account, options)
+        self.storage = None
+
+    async def connect(self):
+        import aiohttp
+        from gcloud.aio.storage import Storage
+
+        service_file = None
+        if self.service_account:
+            # the key is loaded in memory instead of being written to /tmp
+            key = await run_sync(transfer.read_gcs_object, self.service_account)
+            service_file = io.StringIO(key.decode("utf-8"))
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.options.get("async_concurrency", ASYNC_CONCURRENCY)
+            )
+        )
+        self.storage = Storage(service_file=service_file, session=session)
+        logging.info("Connected to GCS bucket: " + self.conn_str.netloc)
+
+    async def disconnect(self):
+        storage, self.storage = self.storage, None
+        if storage is not None:
+            await storage.close()
+
+    async def read_file(self, file_path):
+        # removing the leading / so as to not create a folder with it
+        return await self.storage.download(self.conn_str.netloc, file_path[1:])
+
+    async def write_file(self, file_name, data, digest=None):
+        name = self.conn_str.path[1:] + file_name
+        blob = await self.storage.upload(self.conn_str.netloc, name, data)
+        if digest is not None:
+            # the metadata of the object comes in the response of the upload
+            integrity.check_size(name, int(blob["size"]), digest.size)
+            integrity.check_checksum(
+                name, "MD5", blob["md5Hash"], digest.md5_base64()
+            )
+
+
+class AsyncS3FileTransfer(AsyncFileTransfer):
+    """
+    S3 through the boto3 client of the sync engine, its blocking requests
+    running on a pool of threads, as aiobotocore can't be installed along with
+    the boto3 version pinned
+    """
+
+    def __init__(
+        self, connection_string, service_account: str = None, options: dict = None
+    ):
+        super().__init__(connection_string, service_account, options)
+        # gs:// URI of the JSON with the access keys, given as a query parameter
+        auth_info = dict(parse.parse_qs(connection_string.query))
+        self.config_file = auth_info.get("config_file", [None])[0]
+        self.executor = None
+        self.s3 = None
+
+    async def connect(self):
+        self.executor = futures.ThreadPoolExecutor(max_workers=ASYNC_S3_THREADS)
+        self.s3 = await run_sync(
+            transfer.s3_client, self.config_file, executor=self.executor
+        )
+        logging.info("Connected to S3 bucket: " + self.conn_str.netloc)
+
+    async def disconnect(self):
+        executor, self.executor = self.executor, None
+        self.s3 = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    async def read_file(self, file_path):
+        def read():
+            # listed paths are the keys with a leading /
+            response = self.s3.get_object(
+                Bucket=self.conn_str.netloc, Key=file_path[1:]
+            )
+            return response["Body"].read()
+
+        return await run_sync(read, executor=self.executor)
+
+    async def write_file(self, file_name, data, digest=None):
+        # S3 itself rejects a body that doesn't match its Content-MD5
+        await run_sync(
+            functools.partial(
+                self.s3.put_object,
+                Bucket=self.conn_str.netloc,
+                Key=posixpath.join(self.conn_str.path[1:], file_name),
+                Body=data,
+                ContentMD5=transfer.content_md5(data),
+            ),
+            executor=self.executor,
+        )
+
+
+def get_async_transfer_types():
+    return registry.Registry(
+        {
+            "ftp": AsyncFtpFileTransfer,
+            "ftps": AsyncFtpsFileTransfer,
+            "sftp": AsyncSftpFileTransfer,
+            "gs": AsyncGcsFileTransfer,
+            "s3": AsyncS3FileTransfer,
+        }
+    )
+
+
+ASYNC_TRANSFER_TYPES = get_async_transfer_types()
+
+
+def prepare_file(name, data, compression, verify):
+    # compresses and checksums the content, blocking for as long as it takes
+    if compression is not None:
+        name, chunks = compression.compress_stream(
+            io.BytesIO(data), name, size=len(data)
+        )
+        data = b"".join(chunks)
+    digest = None
+    if verify:
+        digest = integrity.StreamDigest()
+        digest.update(data)
+    return name, data, digest
+
+
+def unpack_file(decompression, folder_path, file_name, data):
+    # archives hand out their files one at a time
+    return [
+        (compress.member_path(folder_path, name), b"".join(chunks))
+        for name, chunks in decompression.decompress_members(
+            io.BytesIO(data), file_name
+        )
+    ]
+
+
+async def write_file(destination, file_path, data, compression, verify, file_metrics):
+    folder_path, name = posixpath.split(file_path)
+    # on a thread, so the other files in flight go on meanwhile
+    name, data, digest = await run_sync(prepare_file, name, data, compression, verify)
+
+    started = time.perf_counter()
+    await destination.write_file(posixpath.join(folder_path, name), data, digest)
+    file_metrics.record("write", time.perf_counter() - started, size=len(data))
+
+
+async def move_file(
+    source,
+    destinations,
+    file,
+    file_metrics,
+    compressions=None,
+    decompression=None,
+    verify=True,
+    max_size=ASYNC_MAX_SIZE,
+):
+    # reads the file whole and writes it to every destination at the same time
+    if file.size is not None and file.size > max_size:
+        raise ValueError(
+            "File %s has %s bytes, over the %s of the async engine"
+            % (file.path, file.size, max_size)
+        )
+    compressions = compressions or [None] * len(destinations)
+
+    started = time.perf_counter()
+    data = await source.read_file(file.path)
+    file_metrics.record("read", time.perf_counter() - started, size=len(data))
+    if verify:
+        # a connection dropped halfway may look like the end of the file
+        integrity.check_size(file.path, file.size, len(data))
+
+    # recursive transfers keep the subfolder the file was in
+    folder_path, file_name = posixpath.split(file.relative_name())
+    if decompression is None:
+        members = [(posixpath.join(folder_path, file_name), data)]
+    else:
+        members = await run_sync(
+            unpack_file, decompression, folder_path, file_name, data
+        )
+
+    results = await asyncio.gather(
+        *[
+            write_file(destination, path, content, compression, verify, file_metrics)
+            for path, content in members
+            for destination, compression in zip(destinations, compressions)
+        ],
+        return_exceptions=True,
+    )
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        raise RuntimeError(
+            "Error writing file %s: %s of %s writes failed"
+            % (file_name, len(failed), len(results))
+        ) from failed[0]
+
+
+async def run_transfers(
+    files,
+    source,
+    destinations,
+    concurrency=ASYNC_CONCURRENCY,
+    on_success=None,
+    retry_policy=None,
+    transfer_metrics=None,
+    on_completed=None,
+    **kwargs
+):
+    """
+    Moves the files with at most `concurrency` of them in flight, starting the
+    next one as soon as any finishes. Raises once all of them were tried, like
+    main.transfer_concurrently
+    """
+    errors = {}
+    pending = {}
+    # the listing, the manifests and the cleanup go through the sync
+    # connections, so they run on a thread of their own, one call at a time
+    executor = futures.ThreadPoolExecutor(max_workers=1)
+
+    async def work(file):
+        with transfer_metrics.file(file.path):
+            await retry_policy.call_async(
+                lambda: move_file(
+                    source, destinations, file, transfer_metrics, **kwargs
+                )
+            )
+
+        if on_success is not None:
+            await run_sync(on_success, file, executor=executor)
+
+    async def wait(return_when):
+        done, _ = await asyncio.wait(pending, return_when=return_when)
+        for task in done:
+            file = pending.pop(task)
+            try:
+                task.result()
+                logging.info("File %s transferred successfully" % file.path)
+            except Exception as error:
+                logging.exception("Error transferring file %s" % file.path)
+                errors[file.path] = error
+            if on_completed is not None:
+                await run_sync(on_completed, executor=executor)
+
+    tried = 0
+    files = iter(files)
+    try:
+        # the listing is consumed as the transfers go, like in the sync engine
+        while True:
+            file = await run_sync(next, files, None, executor=executor)
+            if file is None:
+                break
+            if len(pending) >= concurrency:
+                await wait(asyncio.FIRST_COMPLETED)
+            pending[asyncio.ensure_future(work(file))] = file
+            tried += 1
+        if pending:
+            await wait(asyncio.ALL_COMPLETED)
+    finally:
+        executor.shutdown(wait=True)
+
+    if errors:
+        raise RuntimeError(
+            "Error transferring %s of %s files: %s"
+            % (len(errors), tried, ", ".join(sorted(errors)))
+        ) from next(iter(errors.values()))
+
+
+async def transfer_async(source, destinations, files, **kwargs):
+    connections = [source] + destinations
+    try:
+        results = await asyncio.gather(
+            *[conn.connect() for conn in connections], return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+        await run_transfers(files, source, destinations, **kwargs)
+    finally:
+        for conn in connections:
+            try:
+                await conn.disconnect()
+            except Exception:
+                logging.exception("Error while disconnecting")
+
+
+def check_schemes(conn_strs):
+    """
+    Raises before anything is transferred if a scheme is not supported by the
+    engine or its optional package is not installed
+    """
+    missing = set()
+    for conn_str in conn_strs:
+        if conn_str.scheme not in ASYNC_TRANSFER_TYPES:
+            raise LookupError(
+                "Type %s not supported by the async engine" % conn_str.scheme
+            )
+        if conn_str.scheme not in ASYNC_PACKAGES:
+            # registered by the deployment, along with what it needs
+            continue
+        package, module = ASYNC_PACKAGES[conn_str.scheme]
+        try:
+            found = importlib.util.find_spec(module) is not None
+        except ImportError:
+            # a parent package is missing
+            found = False
+        if not found:
+            missing.add(package)
+    if missing:
+        raise ImportError(
+            "The async engine needs %s, add it to requirements.txt"
+            % ", ".join(sorted(missing))
+        )
+
+
+def transfer_files(
+    files,
+    source_conn_str,
+    dest_conn_strs,
+    transfer_info,
+    on_success=None,
+    retry_policy=None,
+    transfer_metrics=None,
+    on_completed=None,
+    compressions=None,
+    decompression=None,
+    verify=True,
+    **kwargs
+):
+    """
+    Runs the async engine on the calling thread until every file was tried,
+    reading and writing each file whole in memory over asyncssh, aioftp and
+    HTTP sessions. The files are listed, and on_success and on_completed called,
+    on a single thread besides the event loop, so the sync connections they go
+    through are never used by two threads at once
+    """
+    check_schemes([source_conn_str] + list(dest_conn_strs))
+    types = [
+        ASYNC_TRANSFER_TYPES[conn_str.scheme]
+        for conn_str in [source_conn_str] + list(dest_conn_strs)
+    ]
+
+    source = types[0](
+        source_conn_str, transfer_info.get("service_account"), transfer_info
+    )
+    destinations = [
+        destination_type(dest_conn_str, None, transfer_info)
+        for dest_conn_str, destination_type in zip(dest_conn_strs, types[1:])
+    ]
+    asyncio.run(
+        transfer_async(
+            source,
+            destinations,
+            files,
+            concurrency=transfer_info.get("async_concurrency", ASYNC_CONCURRENCY),
+            on_success=on_success,
+            retry_policy=retry_policy or retry.RetryPolicy(attempts=1),
+            transfer_metrics=transfer_metrics or metrics.Metrics(sinks=[]),
+            on_completed=on_completed,
+            compressions=compressions,
+            decompression=decompression,
+            verify=verify,
+            max_size=transfer_info.get("async_max_size", ASYNC_MAX_SIZE),
+        )
+    )
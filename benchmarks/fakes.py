@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import posixpath
+import shutil
+import uuid
+
+import integrity
+import transfer
+
+# folder holding one subfolder per bucket of the fake object stores
+OBJECT_ROOT_ENV = "BENCH_OBJECT_ROOT"
+
+
+class LocalObjectStore(transfer.FileTransfer):
+    """
+    Filesystem backed stand-in for GCS and S3: the bucket is a folder under
+    BENCH_OBJECT_ROOT and the keys are the paths below it. It has no network
+    cost, so benchmarks using it measure the function itself
+    """
+
+    def __init__(self, connection_string, service_account=None, options=None):
+        transfer.FileTransfer.__init__(
+            self, connection_string, service_account, options
+        )
+        self.conn_str = connection_string
+        self.root = os.path.join(os.environ[OBJECT_ROOT_ENV], connection_string.netloc)
+
+    def _local(self, path):
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def _destination(self, file_name):
+        return self._local(posixpath.join(self.conn_str.path, file_name))
+
+    def connect(self):
+        os.makedirs(self.root, exist_ok=True)
+
+    def disconnect(self):
+        pass
+
+    def download_file(self, file_path):
+        file_name = file_path.split("/")[-1]
+        shutil.copyfile(self._local(file_path), "/tmp/" + file_name)
+        return file_name
+
+    def upload_file(self, file_path, remote_name=None):
+        local_path = self._destination(remote_name or file_path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        shutil.copyfile("/tmp/" + file_path, local_path)
+
+    def list_files(self):
+        if transfer.is_recursive(self.conn_str.path, self.options):
+            return transfer.walk_files(self.conn_str.path, self.list_folder)
+        folder, _ = transfer.split_pattern(self.conn_str.path)
+        entries, _ = self.list_folder(folder)
+        return transfer.match_entries(entries, self.conn_str.path)
+
+    def list_folder(self, folder_path):
+        entries, folders = [], []
+        local_folder = self._local(folder_path)
+        if not os.path.isdir(local_folder):
+            return entries, folders
+        for name in sorted(os.listdir(local_folder)):
+            path = posixpath.join(folder_path, name)
+            if os.path.isdir(os.path.join(local_folder, name)):
+                folders.append(path)
+            else:
+                entries.append(self.file_metadata(path))
+        return entries, folders
+
+    def remove_file(self, file_path):
+        os.remove(self._local(file_path))
+
+    def rename_file(self, file_path, new_path):
+        os.renames(self._local(file_path), self._local(new_path))
+
+    def open_read(self, file_path):
+        return open(self._local(file_path), "rb")
+
+    def open_write(self, file_name):
+        return LocalObjectWriter(self._destination(file_name))
+
+    def file_metadata(self, file_path):
+        stat = os.stat(self._local(file_path))
+        return transfer.FileEntry(file_path, stat.st_size, stat.st_mtime, None)
+
+    def verify_file(self, file_name, digest):
+        local_path = self._destination(file_name)
+        integrity.check_size(local_path, os.path.getsize(local_path), digest.size)
+        md5 = hashlib.md5()
+        with open(local_path, "rb") as r:
+            for chunk in iter(lambda: r.read(transfer.CHUNK_SIZE), b""):
+                md5.update(chunk)
+        integrity.check_checksum(
+            local_path, "MD5", md5.hexdigest(), digest.md5.hexdigest()
+        )
+
+    def can_copy_to(self, destination):
+        # a local file copy says nothing of a server side copy, so gs and s3
+        # sources go through the read and write path the other sources take
+        return False
+
+
+class LocalObjectWriter(object):
+    """
+    Writes to a temporary file renamed on a successful exit, so failed writes
+    leave nothing behind, like an object store upload
+    """
+
+    def __init__(self, local_path):
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        self.local_path = local_path
+        self.temp_path = "%s.%s.tmp" % (local_path, uuid.uuid4().hex)
+        self.file = open(self.temp_path, "wb")
+
+    def write(self, b):
+        return self.file.write(b)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            os.replace(self.temp_path, self.local_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.temp_path)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the cold start cost of the function per combination of source,
+destination and compression: the time a fresh interpreter takes to import
+main, plus the third party modules the providers of the combination import on
+first use. Each combination is measured in new processes, --runs times, and the
+median is reported next to the cost of importing every provider up front.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --sources ftp sftp --destinations gs
+"""
+import argparse
+import ast
+import importlib.util
+import inspect
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# read by transfer on import, here and in the measured interpreters
+os.environ.setdefault("PROJECT", "benchmark")
+
+import compress  # noqa: E402
+import transfer  # noqa: E402
+
+
+def imported_name(module, name):
+    # "from module import name" imports a submodule or an attribute of module
+    try:
+        if importlib.util.find_spec(module + "." + name) is None:
+            return module
+    except ImportError:
+        # either way not installed, so only reported as missing
+        pass
+    return module + "." + name
+
+
+def lazy_modules(providers, name):
+    """
+    Modules the provider registered under name imports on first use: its own
+    module when registered as "module:Class", and the imports inside its
+    methods and inside the functions of its module they call, including those
+    only some messages reach, as the GCS client reading S3 config files
+    """
+    modules = set()
+    if isinstance(providers.providers[name], str):
+        modules.add(providers.providers[name].partition(":")[0])
+    provider = providers[name]
+
+    tree = ast.parse(inspect.getsource(sys.modules[provider.__module__]))
+    classes = {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+    functions = {
+        node.name: node for node in tree.body if isinstance(node, ast.FunctionDef)
+    }
+    pending = [
+        classes[cls.__name__]
+        for cls in provider.__mro__
+        if cls.__module__ == provider.__module__ and cls.__name__ in classes
+    ]
+    seen = set()
+    while pending:
+        for node in ast.walk(pending.pop()):
+            if isinstance(node, ast.Import):
+                modules.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and not node.level:
+                modules.update(
+                    imported_name(node.module, alias.name) for alias in node.names
+                )
+            elif isinstance(node, ast.Name) and node.id in functions:
+                if node.id not in seen:
+                    seen.add(node.id)
+                    pending.append(functions[node.id])
+    return sorted(modules)
+
+
+def provider_modules(providers):
+    return {name: lazy_modules(providers, name) for name in providers}
+
+
+# third party modules each provider imports the first time it is used, read
+# from the providers themselves so new ones are measured without listing them
+SCHEME_MODULES = provider_modules(transfer.get_transfer_types())
+COMPRESSION_MODULES = dict(
+    provider_modules(compress.get_compression_types()), none=[]
+)
+
+# run in a fresh interpreter, printing the seconds spent importing main and the
+# providers, and the providers that are not installed
+CHILD = """
+import importlib, json, sys, time
+sys.path.insert(0, %r)
+started = time.perf_counter()
+import main
+loaded = time.perf_counter()
+missing = []
+for name in %r:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        missing.append(name)
+print(json.dumps([loaded - started, time.perf_counter() - loaded, missing]))
+"""
+
+
+def measure(modules, runs):
+    main_times, provider_times = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD % (ROOT, modules)],
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        main_time, provider_time, missing = json.loads(output)
+        main_times.append(main_time)
+        provider_times.append(provider_time)
+    return {
+        "main_ms": round(statistics.median(main_times) * 1000, 1),
+        "providers_ms": round(statistics.median(provider_times) * 1000, 1),
+        "missing": missing,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sources", nargs="+", default=list(SCHEME_MODULES))
+    parser.add_argument("--destinations", nargs="+", default=["gs", "s3", "sftp"])
+    parser.add_argument("--compressions", nargs="+", default=["none"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="JSON file to write the results to")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = []
+    every_provider = sorted(
+        set(itertools.chain(*SCHEME_MODULES.values(), *COMPRESSION_MODULES.values()))
+    )
+    combinations = [("all providers up front", every_provider)] + [
+        (
+            "%s -> %s (%s)" % (source, destination, compression),
+            SCHEME_MODULES[source]
+            + SCHEME_MODULES[destination]
+            + COMPRESSION_MODULES[compression],
+        )
+        for source, destination, compression in itertools.product(
+            args.sources, args.destinations, args.compressions
+        )
+    ]
+    for name, modules in combinations:
+        result = dict(measure(sorted(set(modules)), args.runs), name=name)
+        results.append(result)
+        print(
+            "%-32s main %7.1f ms  providers %7.1f ms  total %7.1f ms%s"
+            % (
+                name,
+                result["main_ms"],
+                result["providers_ms"],
+                result["main_ms"] + result["providers_ms"],
+                "  (missing %s)" % ", ".join(result["missing"])
+                if result["missing"]
+                else "",
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
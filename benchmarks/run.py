@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks transfer_file against local stand-ins of its connections: FTP and
+implicit FTPS served by pyftpdlib, an in-process SFTP server and a filesystem
+backed fake of GCS and S3. Each scenario of the matrix of sources, file
+sizes/counts and compressions runs in its own process, so its peak RSS is its
+own, and reports throughput, per file latency and peak RSS.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/run.py --quick --output results.json
+    python benchmarks/run.py --baseline results.json
+
+With --baseline, scenarios whose throughput dropped or whose peak RSS grew by
+more than --tolerance are reported as regressions and the exit code is 1.
+"""
+import argparse
+import base64
+import collections
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("PROJECT", "benchmark")
+
+MB = 1024 * 1024
+# (number of files, size of each file)
+SIZES = collections.OrderedDict(
+    [("small", (200, 64 * 1024)), ("medium", (16, 4 * MB)), ("large", (2, 64 * MB))]
+)
+SOURCES = ["ftp", "ftps", "sftp", "gs", "s3"]
+COMPRESSIONS = ["none", "gzip", "pigz", "zstd", "lz4"]
+QUICK = {
+    "sources": ["ftp", "sftp", "gs"],
+    "sizes": ["small", "medium"],
+    "compressions": ["none", "gzip"],
+}
+# optional packages some compressions need
+OPTIONAL_PACKAGES = {"zstd": "zstandard", "lz4": "lz4"}
+
+SOURCE_BUCKET = "bench-source"
+DESTINATION_BUCKET = "bench-destination"
+
+Scenario = collections.namedtuple("Scenario", ["source", "size", "compression"])
+
+
+def scenario_name(scenario):
+    return "%s/%s/%s" % scenario
+
+
+def generate_files(folder, count, size, seed=0):
+    """
+    Writes CSV-like files, compressible about as much as real exports. Their
+    content never repeats within a file, so no algorithm gets a free ride
+    """
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    for i in range(count):
+        with open(os.path.join(folder, "file_%05d.csv" % i), "wb") as f:
+            written = 0
+            while written < size:
+                rows = "".join(
+                    "%d,%s,%.4f,%d\n"
+                    % (
+                        rng.randrange(10 ** 9),
+                        rng.choice(("alpha", "beta", "gamma", "delta")),
+                        rng.random() * 1000,
+                        rng.randrange(100),
+                    )
+                    for _ in range(1000)
+                ).encode("utf-8")
+                rows = rows[: size - written]
+                f.write(rows)
+                written += len(rows)
+
+
+def source_connection_string(source, ports, folder):
+    credentials = "?username=bench&password=bench"
+    if source in ("ftp", "ftps", "sftp"):
+        return "%s://127.0.0.1:%s/%s/*%s" % (source, ports[source], folder, credentials)
+    return "%s://%s/%s/*" % (source, SOURCE_BUCKET, folder)
+
+
+def run_scenario(scenario, ports, object_root, log_level):
+    """Runs in a process of its own, returning the measurements"""
+    logging.basicConfig(level=log_level)
+    os.environ["BENCH_OBJECT_ROOT"] = object_root
+
+    import main
+    import metrics
+
+    # both object stores are served from the local folder
+    main.TRANSFER_TYPES.register("gs", "fakes:LocalObjectStore")
+    main.TRANSFER_TYPES.register("s3", "fakes:LocalObjectStore")
+    sink = metrics.InMemorySink()
+    metrics.SINKS[:] = [sink]
+
+    transfer_info = {
+        "source_connection_string": source_connection_string(
+            scenario.source, ports, scenario.size
+        ),
+        "destination_connection_string": "gs://%s/%s/"
+        % (DESTINATION_BUCKET, scenario_name(scenario)),
+        "event_date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "checkpoint": False,
+    }
+    if scenario.compression != "none":
+        transfer_info["compress_algorithm"] = scenario.compression
+    event = {"data": base64.b64encode(json.dumps(transfer_info).encode("utf-8"))}
+    context = types.SimpleNamespace(event_id="benchmark")
+
+    started = time.perf_counter()
+    main.transfer_file(event, context)
+    seconds = time.perf_counter() - started
+
+    latencies = sorted(
+        record["seconds"] for record in sink.records if record["type"] == "file"
+    )
+    summary = [record for record in sink.records if record["type"] == "invocation"][0]
+    count, size = SIZES[scenario.size]
+
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+    return {
+        "name": scenario_name(scenario),
+        "files": count,
+        "bytes": count * size,
+        "seconds": round(seconds, 3),
+        "throughput_mb_s": round(count * size / seconds / MB, 2),
+        "latency_p50": round(percentile(0.5), 4),
+        "latency_p95": round(percentile(0.95), 4),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024),
+        "phases": summary["phases"],
+    }
+
+
+def compare(results, baseline, tolerance):
+    # returns the descriptions of the regressions against the baseline
+    previous = {result["name"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(result["name"])
+        if old is None:
+            continue
+        if result["throughput_mb_s"] < old["throughput_mb_s"] * (1 - tolerance):
+            regressions.append(
+                "%s throughput %s MB/s, was %s MB/s"
+                % (result["name"], result["throughput_mb_s"], old["throughput_mb_s"])
+            )
+        if result["peak_rss_mb"] > old["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                "%s peak RSS %s MB, was %s MB"
+                % (result["name"], result["peak_rss_mb"], old["peak_rss_mb"])
+            )
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sources", nargs="+", default=SOURCES, choices=SOURCES)
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES), choices=SIZES)
+    parser.add_argument(
+        "--compressions", nargs="+", default=COMPRESSIONS, choices=COMPRESSIONS
+    )
+    parser.add_argument("--quick", action="store_true", help="a smaller matrix")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    if args.quick:
+        for key, value in QUICK.items():
+            setattr(args, key, value)
+    return args
+
+
+def main():
+    import servers
+
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="transfer-benchmark-")
+    object_root = os.path.join(workdir, "objects")
+    source_root = os.path.join(object_root, SOURCE_BUCKET)
+    for size in args.sizes:
+        generate_files(os.path.join(source_root, size), *SIZES[size])
+
+    # every server exposes the same files as the source bucket
+    ftp = servers.FtpServer(source_root)
+    ftps = servers.FtpServer(
+        source_root,
+        servers.self_signed_certificate(os.path.join(workdir, "cert.pem")),
+    )
+    sftp = servers.SftpServer(source_root)
+    ports = {"ftp": ftp.port, "ftps": ftps.port, "sftp": sftp.port}
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    try:
+        for source in args.sources:
+            for size in args.sizes:
+                for compression in args.compressions:
+                    package = OPTIONAL_PACKAGES.get(compression)
+                    if package and importlib.util.find_spec(package) is None:
+                        continue
+                    scenario = Scenario(source, size, compression)
+                    with context.Pool(1) as pool:
+                        result = pool.apply(
+                            run_scenario,
+                            (scenario, ports, object_root, args.log_level),
+                        )
+                    results.append(result)
+                    print(
+                        "%-28s %8.2f MB/s  p50 %7.4fs  p95 %7.4fs  %5s MB RSS"
+                        % (
+                            result["name"],
+                            result["throughput_mb_s"],
+                            result["latency_p50"],
+                            result["latency_p95"],
+                            result["peak_rss_mb"],
+                        )
+                    )
+                    shutil.rmtree(
+                        os.path.join(object_root, DESTINATION_BUCKET),
+                        ignore_errors=True,
+                    )
+    finally:
+        ftp.close()
+        ftps.close()
+        sftp.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+import os
+import posixpath
+import socket
+import threading
+
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler, TLS_FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+import paramiko
+
+# credentials accepted by every local server
+USERNAME = "bench"
+PASSWORD = "bench"
+
+
+class ImplicitTLSHandler(TLS_FTPHandler):
+    """Negotiates TLS as soon as the client connects, as implicit FTPS does"""
+
+    def handle(self):
+        self.secure_connection(self.ssl_context)
+
+    def handle_ssl_established(self):
+        # the welcome message is only sent over the secure channel
+        TLS_FTPHandler.handle(self)
+
+
+def self_signed_certificate(path):
+    # key and certificate in a single PEM, as pyftpdlib expects
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(datetime.utcnow() - timedelta(days=1))
+        .not_valid_after(datetime.utcnow() + timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    with open(path, "wb") as f:
+        f.write(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.TraditionalOpenSSL,
+                serialization.NoEncryption(),
+            )
+        )
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    return path
+
+
+class FtpServer(object):
+    """FTP, or implicit FTPS when given a certificate, serving the root folder"""
+
+    def __init__(self, root, certfile=None):
+        authorizer = DummyAuthorizer()
+        authorizer.add_user(USERNAME, PASSWORD, root, perm="elradfmwMT")
+        base = ImplicitTLSHandler if certfile else FTPHandler
+        handler = type("BenchmarkHandler", (base,), {"authorizer": authorizer})
+        if certfile:
+            handler.certfile = certfile
+            handler.tls_data_required = True
+
+        self.server = ThreadedFTPServer(("127.0.0.1", 0), handler)
+        self.port = self.server.address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.close_all()
+
+
+class PasswordServer(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        if (username, password) == (USERNAME, PASSWORD):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class LocalSftpHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class LocalSftpServer(paramiko.SFTPServerInterface):
+    """SFTP subsystem over a local folder"""
+
+    def __init__(self, server, root, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _local(self, path):
+        return os.path.join(self.root, self.canonicalize(path).lstrip("/"))
+
+    def canonicalize(self, path):
+        return posixpath.normpath(posixpath.join("/", path))
+
+    def list_folder(self, path):
+        local = self._local(path)
+        try:
+            return [
+                paramiko.SFTPAttributes.from_stat(
+                    os.stat(os.path.join(local, name)), name
+                )
+                for name in os.listdir(local)
+            ]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(self._local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(self._local(path), flags, 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        handle = LocalSftpHandle(flags)
+        handle.filename = self._local(path)
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def _call(self, function, *paths):
+        try:
+            function(*[self._local(path) for path in paths])
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def remove(self, path):
+        return self._call(os.remove, path)
+
+    def rename(self, oldpath, newpath):
+        return self._call(os.rename, oldpath, newpath)
+
+    def posix_rename(self, oldpath, newpath):
+        return self._call(os.replace, oldpath, newpath)
+
+    def mkdir(self, path, attr):
+        return self._call(os.mkdir, path)
+
+    def rmdir(self, path):
+        return self._call(os.rmdir, path)
+
+
+class SftpServer(object):
+    """In-process SFTP server serving the root folder, one thread per session"""
+
+    def __init__(self, root):
+        self.root = root
+        self.key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.transports = []
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.key)
+            transport.set_subsystem_handler(
+                "sftp", paramiko.SFTPServer, LocalSftpServer, self.root
+            )
+            self.transports.append(transport)
+            try:
+                # the transport serves the session in its own thread
+                transport.start_server(server=PasswordServer())
+            except paramiko.SSHException:
+                transport.close()
+
+    def close(self):
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
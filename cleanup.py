@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import logging
+import posixpath
+import threading
+
+import retry
+
+# files removed, or archived, in each round of the deferred cleanup
+CLEANUP_BATCH = 1000
+
+
+class DeferredCleanup(object):
+    """
+    Collects the source files already delivered to every destination and
+    removes them, or moves them under archive_path, in bulk, instead of paying
+    a round trip per file. Files may be added from any thread, but flush uses
+    the source connection, so it must run in the thread owning it. on_cleaned
+    receives each file once it is gone from the source
+    """
+
+    def __init__(
+        self,
+        source,
+        archive_path=None,
+        batch_size=CLEANUP_BATCH,
+        on_cleaned=None,
+        retry_policy=None,
+    ):
+        self.source = source
+        self.archive_path = archive_path
+        self.batch_size = batch_size
+        self.on_cleaned = on_cleaned
+        self.retry_policy = retry_policy or retry.RetryPolicy()
+        self.lock = threading.Lock()
+        self.pending = []
+        self.cleaned = 0
+        self.errors = {}
+
+    def add(self, file):
+        with self.lock:
+            self.pending.append(file)
+
+    def flush(self, full_only=False):
+        """Cleans up the pending files, or only the full batches of them"""
+        while True:
+            with self.lock:
+                if not self.pending or (
+                    full_only and len(self.pending) < self.batch_size
+                ):
+                    return
+                batch = self.pending[: self.batch_size]
+                self.pending = self.pending[self.batch_size :]
+            self._clean(batch)
+
+    def check(self):
+        # raises once flushed if some of the files could not be cleaned up
+        if self.errors:
+            raise RuntimeError(
+                "Error cleaning up %s of %s files: %s"
+                % (
+                    len(self.errors),
+                    self.cleaned + len(self.errors),
+                    ", ".join(sorted(self.errors)),
+                )
+            ) from next(iter(self.errors.values()))
+
+    def _clean(self, batch):
+        paths = [file.path for file in batch]
+        try:
+            # the source may sit idle while the files are transferred, long
+            # enough for the server to drop the connection
+            self.retry_policy.call(self._reconnect)
+            if self.archive_path is None:
+                errors = self.source.remove_files(paths)
+            else:
+                errors = self.source.rename_files(
+                    [
+                        (
+                            file.path,
+                            posixpath.join(self.archive_path, file.relative_name()),
+                        )
+                        for file in batch
+                    ]
+                )
+        except Exception as error:
+            # the connection failed, so none of the batch is known to be done
+            errors = {path: error for path in paths}
+
+        for path, error in errors.items():
+            logging.error("Error cleaning up file %s: %r" % (path, error))
+        self.cleaned += len(batch) - len(errors)
+        self.errors.update(errors)
+        if self.on_cleaned is not None:
+            for file in batch:
+                if file.path not in errors:
+                    self.on_cleaned(file)
+        logging.info(
+            "%s %s files from the source"
+            % (
+                "Removed" if self.archive_path is None else "Archived",
+                len(batch) - len(errors),
+            )
+        )
+
+    def _reconnect(self):
+        try:
+            self.source.disconnect()
+        except Exception:
+            logging.exception("Error while disconnecting")
+        self.source.connect()
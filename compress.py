@@ -1,14 +1,134 @@
 # -*- coding: utf-8 -*-
+from concurrent import futures
 import abc
+import collections
 import gzip
+import io
+import shutil
+import struct
+import tarfile
+import time
 import zipfile
+import zlib
 
 import os
+import posixpath
 
+import registry
+
+# default size of the chunks read from the input streams
+BUFFER_SIZE = 1024 * 1024
+
+# zip local file header: signature, version, flags, method, time, date, crc32,
+# compressed size, uncompressed size, file name length and extra field length
+ZIP_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+ZIP_LOCAL_SIGNATURE = b"PK\x03\x04"
+ZIP_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+
+# size of the blocks compressed in parallel by pigz, and the window each block
+# borrows from the previous one as its dictionary
+PIGZ_BLOCK_SIZE = 128 * 1024
+DEFLATE_WINDOW = 32 * 1024
+# gzip header: magic, method, flags, modification time, extra flags and OS
+GZIP_HEADER = struct.Struct("<2sBBIBB")
+
+
+class ChunkStream(io.RawIOBase):
+    """Readable file-like object over an iterable of byte chunks."""
+
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = iter(chunks)
+        self.pending = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending:
+            try:
+                self.pending = memoryview(next(self.chunks))
+            except StopIteration:
+                return 0
+        size = min(len(b), len(self.pending))
+        b[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+class ChunkSink(object):
+    """Write-only, non seekable buffer whose content is drained as chunks."""
 
-class CompressClass(object, metaclass=abc.ABCMeta):
     def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class PushbackReader(object):
+    """Wraps a stream so bytes read past the end of a zip member can be returned."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = b""
+
+    def read(self, size):
+        if self.pending:
+            data, self.pending = self.pending[:size], self.pending[size:]
+            return data
+        return self.stream.read(size)
+
+    def read_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.read(size - len(data))
+            if not chunk:
+                raise EOFError("Unexpected end of stream")
+            data += chunk
+        return data
+
+    def unread(self, data):
+        self.pending = data + self.pending
+
+
+def read_chunks(stream, buffer_size=BUFFER_SIZE):
+    return iter(lambda: stream.read(buffer_size), b"")
+
+
+def write_chunks(file_path, chunks):
+    with open(file_path, "wb") as w:
+        for chunk in chunks:
+            w.write(chunk)
+
+
+def single_member(chunks, members, kind):
+    yield from chunks
+
+    # Ensuring that the archive contains only a single file
+    for _ in members:
+        raise Exception("%s file must contain a single file" % kind)
+
+
+class CompressClass(object, metaclass=abc.ABCMeta):
+    def __init__(self, level=None):
         super().__init__()
+        # None keeps the default level of each algorithm
+        self.level = level
 
     @abc.abstractmethod
     def compress_file(self, file_path):
@@ -18,16 +138,35 @@ class CompressClass(object, metaclass=abc.ABCMeta):
     def decompress_file(self, file_path, encoding):
         raise NotImplementedError("Abstract method")
 
+    @abc.abstractmethod
+    def compress_stream(self, stream, file_name, buffer_size=BUFFER_SIZE, size=None):
+        # returns the compressed file name and an iterator of compressed chunks,
+        # size being the length of the stream when the source listed it
+        raise NotImplementedError("Abstract method")
+
+    @abc.abstractmethod
+    def decompress_stream(self, stream, file_name, buffer_size=BUFFER_SIZE):
+        # returns the decompressed file name and an iterator of decompressed chunks
+        raise NotImplementedError("Abstract method")
+
+    def decompress_members(self, stream, file_name, buffer_size=BUFFER_SIZE):
+        # yields the name and the chunks of each file, archives having several
+        yield self.decompress_stream(stream, file_name, buffer_size)
+
+    def bundle(self, members, buffer_size=BUFFER_SIZE):
+        # members yields the name, size, modification time and stream of each file
+        raise NotImplementedError("%s can't bundle several files" % type(self).__name__)
+
 
 class GzipCompressClass(CompressClass):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, level=None):
+        super().__init__(9 if level is None else level)
 
     def compress_file(self, file_path):
         file = "/tmp/" + file_path.split("/")[-1]
         with open(file, "rb") as r:
-            with gzip.open(file + ".gz", "wb") as f:
-                f.write(r.read())
+            with gzip.open(file + ".gz", "wb", compresslevel=self.level) as f:
+                shutil.copyfileobj(r, f, BUFFER_SIZE)
 
         os.remove(file)
 
@@ -39,20 +178,65 @@ class GzipCompressClass(CompressClass):
         destination = file_name[:-3] if ".gz" in file_name else file_name + "01"
         with gzip.open(source, "rb") as f:
             with open("/tmp/" + destination, "wb") as w:
-                w.write(f.read())
+                shutil.copyfileobj(f, w, BUFFER_SIZE)
 
         os.remove("/tmp/" + file_name)
 
         return destination
 
+    def compress_stream(self, stream, file_name, buffer_size=BUFFER_SIZE, size=None):
+        return file_name + ".gz", self._compress_chunks(stream, buffer_size)
+
+    def decompress_stream(self, stream, file_name, buffer_size=BUFFER_SIZE):
+        destination = file_name[:-3] if ".gz" in file_name else file_name + "01"
+        return destination, self._decompress_chunks(stream, buffer_size)
+
+    def _compress_chunks(self, stream, buffer_size):
+        # wbits = 31 writes the gzip header and trailer around the deflate data
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        for chunk in read_chunks(stream, buffer_size):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def _decompress_chunks(self, stream, buffer_size):
+        decompressor = zlib.decompressobj(31)
+        # whether the current member was started but not finished
+        in_member = False
+        for chunk in read_chunks(stream, buffer_size):
+            # a gzip file may be made of several concatenated members
+            while chunk:
+                in_member = True
+                data = decompressor.decompress(chunk, buffer_size)
+                if data:
+                    yield data
+                if decompressor.eof:
+                    chunk = decompressor.unused_data
+                    decompressor = zlib.decompressobj(31)
+                    in_member = False
+                else:
+                    chunk = decompressor.unconsumed_tail
+        data = decompressor.flush()
+        if data:
+            yield data
+        if in_member and not decompressor.eof:
+            # a dropped download must not pass for the whole file
+            raise EOFError("Compressed file ended before the end-of-stream marker")
+
 
 class ZipCompressClass(CompressClass):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, level=None):
+        super().__init__(level)
 
     def compress_file(self, file_path):
         file = "/tmp/" + file_path.split("/")[-1]
-        zip = zipfile.ZipFile(file + ".zip", "w", compression=zipfile.ZIP_DEFLATED)
+        zip = zipfile.ZipFile(
+            file + ".zip",
+            "w",
+            compression=zipfile.ZIP_DEFLATED,
+            compresslevel=self.level,
+        )
         zip.write(file, arcname=file_path.split("/")[-1])
         zip.close()
 
@@ -70,13 +254,503 @@ class ZipCompressClass(CompressClass):
             raise Exception("Zip file must contain a single file")
 
         for name in zip.namelist():
-            with open("/tmp/" + name, "wb") as f:
-                f.write(zip.read(name))
+            with zip.open(name) as r:
+                with open("/tmp/" + name, "wb") as f:
+                    shutil.copyfileobj(r, f, BUFFER_SIZE)
 
+        zip.close()
         os.remove("/tmp/" + file_name)
 
         return name
 
+    def compress_stream(self, stream, file_name, buffer_size=BUFFER_SIZE, size=None):
+        return (
+            file_name + ".zip",
+            self._compress_chunks([(file_name, stream)], buffer_size),
+        )
+
+    def decompress_stream(self, stream, file_name, buffer_size=BUFFER_SIZE):
+        members = iter_zip_members(stream, buffer_size)
+        try:
+            name, chunks = next(members)
+        except StopIteration:
+            raise Exception("Zip file must contain a single file")
+
+        return name, single_member(chunks, members, "Zip")
+
+    def decompress_members(self, stream, file_name, buffer_size=BUFFER_SIZE):
+        for name, chunks in iter_zip_members(stream, buffer_size):
+            # folders are created along with the files inside them
+            if not name.endswith("/"):
+                yield name, chunks
+
+    def bundle(self, members, buffer_size=BUFFER_SIZE):
+        return self._compress_chunks(
+            ((name, stream) for name, _, _, stream in members), buffer_size
+        )
+
+    def _compress_chunks(self, members, buffer_size):
+        # the sink is not seekable, so zipfile writes sizes in data descriptors
+        sink = ChunkSink()
+        zip = zipfile.ZipFile(
+            sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=self.level
+        )
+        for file_name, stream in members:
+            # the final size is unknown up front, so zip64 must be allowed
+            member = zip.open(file_name, "w", force_zip64=True)
+            for chunk in read_chunks(stream, buffer_size):
+                member.write(chunk)
+                data = sink.drain()
+                if data:
+                    yield data
+            member.close()
+        zip.close()
+        yield sink.drain()
+
+
+class TarCompressClass(CompressClass):
+    """
+    Tar archives, read as a stream so members are handed out one at a time.
+    Reading also accepts tar.gz, tar.bz2 and tar.xz
+    """
+
+    extension = ".tar"
+
+    def __init__(self, level=None):
+        super().__init__(9 if level is None else level)
+
+    def compress_file(self, file_path):
+        file = "/tmp/" + file_path.split("/")[-1]
+        with open(file, "rb") as r:
+            name, chunks = self.compress_stream(r, file_path.split("/")[-1])
+            write_chunks("/tmp/" + name, chunks)
+
+        os.remove(file)
+
+        return file_path + self.extension
+
+    def decompress_file(self, file_path):
+        file_name = file_path.split("/")[-1]
+        with open("/tmp/" + file_name, "rb") as r:
+            members = self.decompress_members(r, file_name)
+            try:
+                name, chunks = next(members)
+            except StopIteration:
+                raise Exception("Tar file must contain a single file")
+            destination = name.split("/")[-1]
+            write_chunks("/tmp/" + destination, chunks)
+
+            # Ensuring that the tar contains only a single file
+            for _ in members:
+                raise Exception("Tar file must contain a single file")
+
+        os.remove("/tmp/" + file_name)
+
+        return destination
+
+    def compress_stream(self, stream, file_name, buffer_size=BUFFER_SIZE, size=None):
+        # tar headers carry the size, listed by the source or known to local files
+        if size is None:
+            try:
+                size = os.fstat(stream.fileno()).st_size
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                raise Exception(
+                    "Tar needs the size of the file, not listed by the source"
+                )
+
+        return file_name + self.extension, self.bundle(
+            [(file_name, size, None, stream)], buffer_size
+        )
+
+    def decompress_stream(self, stream, file_name, buffer_size=BUFFER_SIZE):
+        members = self.decompress_members(stream, file_name, buffer_size)
+        try:
+            name, chunks = next(members)
+        except StopIteration:
+            raise Exception("Tar file must contain a single file")
+
+        return name, single_member(chunks, members, "Tar")
+
+    def decompress_members(self, stream, file_name, buffer_size=BUFFER_SIZE):
+        # "r|*" reads the archive sequentially, detecting its compression
+        with tarfile.open(fileobj=stream, mode="r|*", bufsize=buffer_size) as tar:
+            for member in tar:
+                # folders are created along with the files inside them
+                if member.isfile():
+                    yield member.name, read_chunks(tar.extractfile(member), buffer_size)
+
+    def bundle(self, members, buffer_size=BUFFER_SIZE):
+        return self._tar_chunks(members, buffer_size)
+
+    def _tar_chunks(self, members, buffer_size):
+        # written by hand from the headers, since tarfile copies each file whole
+        offset = 0
+        for name, size, mtime, stream in members:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mode = 0o644
+            info.mtime = mtime if isinstance(mtime, (int, float)) else time.time()
+            # pax headers allow long names and files over 8 GB
+            header = info.tobuf(tarfile.PAX_FORMAT)
+            yield header
+
+            written = 0
+            for chunk in read_chunks(stream, buffer_size):
+                written += len(chunk)
+                if written > size:
+                    raise Exception("File %s is larger than listed" % name)
+                yield chunk
+            if written != size:
+                raise Exception("File %s is smaller than listed" % name)
+
+            padding = -size % tarfile.BLOCKSIZE
+            yield tarfile.NUL * padding
+            offset += len(header) + size + padding
+
+        # two empty blocks end the archive, padded to a whole record
+        offset += 2 * tarfile.BLOCKSIZE
+        yield tarfile.NUL * (2 * tarfile.BLOCKSIZE + -offset % tarfile.RECORDSIZE)
+
+
+class TarGzipCompressClass(TarCompressClass):
+    extension = ".tar.gz"
+
+    def _tar_chunks(self, members, buffer_size):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        for chunk in super()._tar_chunks(members, buffer_size):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class ParallelGzipCompressClass(GzipCompressClass):
+    """
+    Gzip compressed by several threads, like pigz: the input is split in blocks
+    deflated in parallel, each one primed with the end of the previous block and
+    ending on a byte boundary, so they are concatenated into a single standard
+    gzip member. Decompression is the same as gzip
+    """
+
+    def __init__(self, level=None, concurrency=None, block_size=PIGZ_BLOCK_SIZE):
+        super().__init__(level)
+        self.concurrency = concurrency or os.cpu_count() or 1
+        self.block_size = block_size
+
+    def compress_file(self, file_path):
+        file = "/tmp/" + file_path.split("/")[-1]
+        with open(file, "rb") as r:
+            write_chunks(file + ".gz", self._compress_chunks(r, BUFFER_SIZE))
+
+        os.remove(file)
+
+        return file_path + ".gz"
+
+    def _compress_block(self, block, dictionary):
+        # zlib releases the GIL while deflating, so the blocks run in parallel
+        if dictionary:
+            compressor = zlib.compressobj(
+                self.level, zlib.DEFLATED, -15, zdict=dictionary
+            )
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        # the sync flush ends the block on a byte boundary without closing the stream
+        return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def _compress_chunks(self, stream, buffer_size):
+        yield GZIP_HEADER.pack(b"\x1f\x8b", 8, 0, int(time.time()), 0, 255)
+
+        crc = 0
+        size = 0
+        dictionary = b""
+        pending = collections.deque()
+        with futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for block in read_chunks(stream, self.block_size):
+                crc = zlib.crc32(block, crc)
+                size += len(block)
+                pending.append(executor.submit(self._compress_block, block, dictionary))
+                dictionary = block[-DEFLATE_WINDOW:]
+                # bounding the blocks held in memory, yielding them in order
+                while len(pending) >= self.concurrency * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+        # an empty final block closes the deflate stream
+        yield b"\x03\x00" + struct.pack("<II", crc, size & 0xFFFFFFFF)
+
+
+class ZstdCompressClass(CompressClass):
+    """Zstandard through the optional zstandard package, using all the CPUs"""
+
+    def __init__(self, level=None):
+        super().__init__(3 if level is None else level)
+        # imported here so the package is only needed when zstd is used
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd needs zstandard, add it to requirements.txt")
+
+        self.zstandard = zstandard
+
+    def compress_file(self, file_path):
+        file = "/tmp/" + file_path.split("/")[-1]
+        with open(file, "rb") as r:
+            write_chunks(file + ".zst", self._compress_chunks(r, BUFFER_SIZE))
+
+        os.remove(file)
+
+        return file_path + ".zst"
+
+    def decompress_file(self, file_path):
+        file_name = file_path.split("/")[-1]
+        destination = self._decompressed_name(file_name)
+        with open("/tmp/" + file_name, "rb") as r:
+            write_chunks("/tmp/" + destination, self._decompress_chunks(r, BUFFER_SIZE))
+
+        os.remove("/tmp/" + file_name)
+
+        return destination
+
+    def compress_stream(self, stream, file_name, buffer_size=BUFFER_SIZE, size=None):
+        return file_name + ".zst", self._compress_chunks(stream, buffer_size)
+
+    def decompress_stream(self, stream, file_name, buffer_size=BUFFER_SIZE):
+        return (
+            self._decompressed_name(file_name),
+            self._decompress_chunks(stream, buffer_size),
+        )
+
+    def _decompressed_name(self, file_name):
+        return file_name[:-4] if file_name.endswith(".zst") else file_name + "01"
+
+    def _compress_chunks(self, stream, buffer_size):
+        # threads=-1 compresses with as many threads as there are CPUs
+        compressor = self.zstandard.ZstdCompressor(level=self.level, threads=-1)
+        compressor = compressor.compressobj()
+        for chunk in read_chunks(stream, buffer_size):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def _decompress_chunks(self, stream, buffer_size):
+        decompressor = self.zstandard.ZstdDecompressor()
+        frame = decompressor.decompressobj(write_size=buffer_size)
+        # whether the current frame was started but not finished
+        in_frame = False
+        for chunk in read_chunks(stream, buffer_size):
+            # a zstd file may be made of several concatenated frames
+            while chunk:
+                in_frame = True
+                data = frame.decompress(chunk)
+                if data:
+                    yield data
+                if frame.eof:
+                    chunk = frame.unused_data
+                    frame = decompressor.decompressobj(write_size=buffer_size)
+                    in_frame = False
+                else:
+                    chunk = b""
+        if in_frame:
+            raise EOFError("Compressed file ended before the end-of-stream marker")
+
+
+class Lz4CompressClass(CompressClass):
+    """LZ4 frames through the optional lz4 package, favouring speed over ratio"""
+
+    def __init__(self, level=None):
+        super().__init__(0 if level is None else level)
+        # imported here so the package is only needed when lz4 is used
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("lz4 needs the lz4 package, add it to requirements.txt")
+
+        self.lz4 = lz4.frame
+
+    def compress_file(self, file_path):
+        file = "/tmp/" + file_path.split("/")[-1]
+        with open(file, "rb") as r:
+            write_chunks(file + ".lz4", self._compress_chunks(r, BUFFER_SIZE))
+
+        os.remove(file)
+
+        return file_path + ".lz4"
+
+    def decompress_file(self, file_path):
+        file_name = file_path.split("/")[-1]
+        destination = self._decompressed_name(file_name)
+        with open("/tmp/" + file_name, "rb") as r:
+            write_chunks("/tmp/" + destination, self._decompress_chunks(r, BUFFER_SIZE))
+
+        os.remove("/tmp/" + file_name)
+
+        return destination
+
+    def compress_stream(self, stream, file_name, buffer_size=BUFFER_SIZE, size=None):
+        return file_name + ".lz4", self._compress_chunks(stream, buffer_size)
+
+    def decompress_stream(self, stream, file_name, buffer_size=BUFFER_SIZE):
+        return (
+            self._decompressed_name(file_name),
+            self._decompress_chunks(stream, buffer_size),
+        )
+
+    def _decompressed_name(self, file_name):
+        return file_name[:-4] if file_name.endswith(".lz4") else file_name + "01"
+
+    def _compress_chunks(self, stream, buffer_size):
+        compressor = self.lz4.LZ4FrameCompressor(compression_level=self.level)
+        yield compressor.begin()
+        for chunk in read_chunks(stream, buffer_size):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def _decompress_chunks(self, stream, buffer_size):
+        decompressor = self.lz4.LZ4FrameDecompressor()
+        # whether the current frame was started but not finished
+        in_frame = False
+        for chunk in read_chunks(stream, buffer_size):
+            in_frame = True
+            # an lz4 file may be made of several concatenated frames
+            while True:
+                data = decompressor.decompress(chunk, buffer_size)
+                if data:
+                    yield data
+                if decompressor.eof:
+                    chunk = decompressor.unused_data
+                    decompressor = self.lz4.LZ4FrameDecompressor()
+                    in_frame = bool(chunk)
+                    if not chunk:
+                        break
+                elif decompressor.needs_input:
+                    break
+                else:
+                    # output is pending in the decompressor
+                    chunk = b""
+        if in_frame:
+            raise EOFError("Compressed file ended before the end-of-stream marker")
+
+
+def member_path(folder_path, name):
+    # archive members can't be written outside of the folder of the archive
+    return posixpath.join(folder_path, posixpath.normpath("/" + name).lstrip("/"))
+
+
+def iter_zip_members(stream, buffer_size=BUFFER_SIZE):
+    """
+    Reads a zip sequentially through its local headers, yielding the name and an
+    iterator over the content of each member, so the archive never has to be
+    seekable nor fully held in memory or disk. Each iterator must be consumed
+    before advancing to the next member.
+    """
+    reader = PushbackReader(stream)
+    while True:
+        signature = reader.read(4)
+        if len(signature) < 4 or signature[:4] != ZIP_LOCAL_SIGNATURE:
+            # reached the central directory
+            return
+        header = ZIP_LOCAL_HEADER.unpack(
+            signature + reader.read_exact(ZIP_LOCAL_HEADER.size - 4)
+        )
+        _, _, flags, method, _, _, crc, csize, usize, name_len, extra_len = header
+        encoding = "utf-8" if flags & 0x800 else "cp437"
+        name = reader.read_exact(name_len).decode(encoding)
+        extra = reader.read_exact(extra_len)
+
+        if flags & 0x1:
+            raise Exception("Encrypted zip files are not supported")
+
+        zip64 = False
+        position = 0
+        while position + 4 <= len(extra):
+            tag, size = struct.unpack("<HH", extra[position : position + 4])
+            if tag == 0x0001:
+                zip64 = True
+                values = extra[position + 4 : position + 4 + size]
+                if usize == 0xFFFFFFFF and len(values) >= 8:
+                    usize = struct.unpack("<Q", values[:8])[0]
+                    values = values[8:]
+                if csize == 0xFFFFFFFF and len(values) >= 8:
+                    csize = struct.unpack("<Q", values[:8])[0]
+            position += 4 + size
+
+        chunks = _iter_zip_member_data(
+            reader, name, flags, method, (crc, csize, usize), zip64, buffer_size
+        )
+        yield name, chunks
+
+        # skipping whatever the consumer did not read
+        for _ in chunks:
+            pass
+
+
+def _iter_zip_member_data(reader, name, flags, method, sizes, zip64, buffer_size):
+    # the data is checked as it goes, the archive being never seen as a whole
+    crc = 0
+    size = 0
+    for data in _read_zip_member_data(reader, flags, method, sizes[1], buffer_size):
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+        yield data
+
+    if flags & 0x8:
+        # data descriptor with the crc and sizes, optionally signed
+        descriptor = reader.read_exact(4)
+        if descriptor != ZIP_DESCRIPTOR_SIGNATURE:
+            reader.unread(descriptor)
+        if zip64:
+            sizes = struct.unpack("<IQQ", reader.read_exact(20))
+        else:
+            sizes = struct.unpack("<III", reader.read_exact(12))
+
+    if crc != sizes[0]:
+        raise zipfile.BadZipFile("Bad CRC-32 for file %r" % name)
+    if size != sizes[2]:
+        raise zipfile.BadZipFile("Bad uncompressed size for file %r" % name)
+
+
+def _read_zip_member_data(reader, flags, method, csize, buffer_size):
+    if method == zipfile.ZIP_STORED:
+        if flags & 0x8:
+            raise Exception("Stored zip members with data descriptor not supported")
+        remaining = csize
+        while remaining > 0:
+            chunk = reader.read(min(buffer_size, remaining))
+            if not chunk:
+                raise EOFError("Unexpected end of stream")
+            remaining -= len(chunk)
+            yield chunk
+    elif method == zipfile.ZIP_DEFLATED:
+        # raw deflate data knows where it ends, so sizes are not needed
+        decompressor = zlib.decompressobj(-15)
+        while not decompressor.eof:
+            chunk = reader.read(buffer_size)
+            if not chunk:
+                raise EOFError("Unexpected end of stream")
+            while chunk and not decompressor.eof:
+                data = decompressor.decompress(chunk, buffer_size)
+                if data:
+                    yield data
+                chunk = decompressor.unconsumed_tail
+        reader.unread(decompressor.unused_data)
+    else:
+        raise Exception("Zip compression method %s not supported" % method)
+
 
 def get_compression_types():
-    return {"gzip": GzipCompressClass, "zip": ZipCompressClass}
+    # other algorithms may be added with register(name, "module:Class")
+    return registry.Registry(
+        {
+            "gzip": GzipCompressClass,
+            "zip": ZipCompressClass,
+            "pigz": ParallelGzipCompressClass,
+            "zstd": ZstdCompressClass,
+            "lz4": Lz4CompressClass,
+            "tar": TarCompressClass,
+            "tar.gz": TarGzipCompressClass,
+        }
+    )
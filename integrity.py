@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import io
+
+try:
+    # installed along with google-cloud-storage
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
+
+class IntegrityError(Exception):
+    """The file at one end does not match the bytes that went through"""
+
+
+class StreamDigest(object):
+    """Size, MD5 and CRC32C of the bytes of a stream, updated as they pass"""
+
+    def __init__(self):
+        self.size = 0
+        self.md5 = hashlib.md5()
+        # None when google_crc32c is not available
+        self.crc32c = google_crc32c.Checksum() if google_crc32c is not None else None
+
+    def update(self, data):
+        self.size += len(data)
+        self.md5.update(data)
+        if self.crc32c is not None:
+            self.crc32c.update(data)
+
+    def md5_base64(self):
+        return base64.b64encode(self.md5.digest()).decode("utf-8")
+
+    def crc32c_base64(self):
+        return base64.b64encode(self.crc32c.digest()).decode("utf-8")
+
+
+class DigestReader(io.RawIOBase):
+    """Readable stream updating a StreamDigest with everything read through it"""
+
+    def __init__(self, stream, digest):
+        super().__init__()
+        self.stream = stream
+        self.digest = digest
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.stream.read(len(b))
+        if not data:
+            return 0
+        size = len(data)
+        b[:size] = data
+        self.digest.update(data)
+        return size
+
+
+def digest_file(local_path, buffer_size=1024 * 1024):
+    # digest of a file staged in /tmp
+    digest = StreamDigest()
+    with open(local_path, "rb") as r:
+        for chunk in iter(lambda: r.read(buffer_size), b""):
+            digest.update(chunk)
+    return digest
+
+
+def check_size(path, expected, actual):
+    # expected is None when the other end doesn't report sizes
+    if expected is not None and expected != actual:
+        raise IntegrityError(
+            "File %s has %s bytes but %s went through" % (path, expected, actual)
+        )
+
+
+def check_checksum(path, algorithm, expected, actual):
+    if expected != actual:
+        raise IntegrityError(
+            "File %s has %s %s but %s went through"
+            % (path, algorithm, expected, actual)
+        )
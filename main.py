@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from concurrent import futures
 from datetime import datetime
 from dateutil import parser as dtparse
 from urllib import parse
@@ -7,8 +8,19 @@ import os
 import base64
 import json
 import logging
+import posixpath
+import shutil
+import threading
 
+import cleanup
 import compress
+import integrity
+import manifest
+import metrics
+import pipeline
+import planner
+import retry
+import throttle
 import transfer
 
 # Map of the URI scheme to their respective classes
@@ -28,6 +40,465 @@ def prevent_infinite_retry(timestamp):
         return False
 
 
+def parse_destinations(transfer_info):
+    """
+    Reads the destinations of the message, either a single connection string or
+    a list of them, each optionally an object with its own compress_algorithm
+    and compression_level. Returns the parsed URI, transfer class and compression
+    of each one
+    """
+    destinations = transfer_info["destination_connection_string"]
+    if not isinstance(destinations, list):
+        destinations = [destinations]
+
+    parsed = []
+    for destination in destinations:
+        if not isinstance(destination, dict):
+            destination = {"connection_string": destination}
+
+        dest_conn_str = parse.urlparse(destination["connection_string"])
+        destination_type = TRANSFER_TYPES.get(dest_conn_str.scheme)
+        if destination_type is None:
+            raise LookupError("Type %s not supported" % dest_conn_str.scheme)
+
+        # the message level compression applies unless the destination overrides it
+        compression = destination.get(
+            "compress_algorithm", transfer_info.get("compress_algorithm")
+        )
+        compress_type = COMPRESSION_TYPES.get(compression)
+        if compression is not None and compress_type is None:
+            raise LookupError("Type %s not supported" % compression)
+
+        if compress_type is not None:
+            compression = compress_type(
+                destination.get(
+                    "compression_level", transfer_info.get("compression_level")
+                )
+            )
+
+        parsed.append((dest_conn_str, destination_type, compression))
+
+    return parsed
+
+
+def write_stream(
+    stream,
+    destinations,
+    file_path,
+    compressions=None,
+    buffer_size=transfer.CHUNK_SIZE,
+    verify=True,
+    depth=pipeline.QUEUE_DEPTH,
+    size=None,
+):
+    # writes the stream to every destination, compressing it for each one, size
+    # being its length when known, as tar needs it up front
+    compressions = compressions or [None] * len(destinations)
+    folder_path, file_name = posixpath.split(file_path)
+
+    def consumer(destination, compression):
+        def consume(chunks):
+            name = file_name
+            # without compression there is nothing to overlap the writes with
+            stage_depth = 0
+            if compression is not None:
+                name, chunks = compression.compress_stream(
+                    compress.ChunkStream(chunks), name, buffer_size, size=size
+                )
+                stage_depth = depth
+
+            # compressing the next chunks while the current ones are written
+            with pipeline.Stage(chunks, stage_depth) as chunks:
+                stream = compress.ChunkStream(chunks)
+                digest = integrity.StreamDigest()
+                if verify:
+                    # checksummed as the bytes are sent, without reading them again
+                    stream = integrity.DigestReader(stream, digest)
+
+                path = posixpath.join(folder_path, name)
+                with destination.open_write(path) as writer:
+                    shutil.copyfileobj(stream, writer, buffer_size)
+
+            if verify:
+                destination.verify_file(path, digest)
+
+        return consume
+
+    consumers = [
+        consumer(destination, compression)
+        for destination, compression in zip(destinations, compressions)
+    ]
+    if len(consumers) == 1:
+        consumers[0](compress.read_chunks(stream, buffer_size))
+        return
+
+    # the stream is read once and each chunk handed to every destination
+    errors = pipeline.tee(stream, consumers, buffer_size)
+    failed = [error for error in errors if error is not None]
+    if failed:
+        raise RuntimeError(
+            "Error writing file %s to %s of %s destinations"
+            % (file_name, len(failed), len(destinations))
+        ) from failed[0]
+
+
+def stream_file(
+    source,
+    destinations,
+    file,
+    compressions=None,
+    decompression=None,
+    buffer_size=transfer.CHUNK_SIZE,
+    verify=True,
+    depth=pipeline.QUEUE_DEPTH,
+):
+    # copies the file in bounded chunks, (de)compressing it on the fly,
+    # without staging it in /tmp
+    # recursive transfers keep the subfolder the file was in
+    folder_path, file_name = posixpath.split(file.relative_name())
+    source_digest = integrity.StreamDigest()
+    with source.open_read(file.path) as reader:
+        if verify:
+            reader = integrity.DigestReader(reader, source_digest)
+
+        # downloading the next chunks while the current ones are processed
+        with pipeline.Stage(compress.read_chunks(reader, buffer_size), depth) as chunks:
+            reader = compress.ChunkStream(chunks)
+            if decompression is None:
+                write_stream(
+                    reader,
+                    destinations,
+                    posixpath.join(folder_path, file_name),
+                    compressions,
+                    buffer_size,
+                    verify,
+                    depth,
+                    file.size,
+                )
+                logging.info("File %s streamed successfully" % file_name)
+            else:
+                # archives hand out their files one at a time
+                for name, chunks in decompression.decompress_members(
+                    reader, file_name, buffer_size
+                ):
+                    # decompressing the next chunks while the current ones are written
+                    with pipeline.Stage(chunks, depth) as chunks:
+                        write_stream(
+                            compress.ChunkStream(chunks),
+                            destinations,
+                            compress.member_path(folder_path, name),
+                            compressions,
+                            buffer_size,
+                            verify,
+                            depth,
+                        )
+                    logging.info("File %s streamed successfully" % name)
+
+            if verify:
+                # archives are left unread past their last file, as the zip index
+                for _ in compress.read_chunks(reader, buffer_size):
+                    pass
+                # a connection dropped halfway may look like the end of the file
+                integrity.check_size(file.path, file.size, source_digest.size)
+
+
+def compress_copy(compression, file_name, buffer_size=transfer.CHUNK_SIZE):
+    # unlike compress_file keeps the original, still needed by other destinations
+    with open("/tmp/" + file_name, "rb") as reader:
+        name, chunks = compression.compress_stream(reader, file_name, buffer_size)
+        compress.write_chunks("/tmp/" + name, chunks)
+    return name
+
+
+def upload_file(
+    destinations,
+    file_path,
+    compressions=None,
+    buffer_size=transfer.CHUNK_SIZE,
+    verify=True,
+):
+    # uploads the file staged in /tmp to every destination
+    compressions = compressions or [None] * len(destinations)
+    folder_path, file_name = posixpath.split(file_path)
+
+    if len(destinations) == 1 and compressions[0] is not None:
+        file_name = compressions[0].compress_file(file_name).split("/")[-1]
+        compressions = [None]
+
+    uploaded = []
+    try:
+        for destination, compression in zip(destinations, compressions):
+            upload_name = file_name
+            if compression is not None:
+                upload_name = compress_copy(compression, file_name, buffer_size)
+                uploaded.append(upload_name)
+            path = posixpath.join(folder_path, upload_name)
+            destination.upload_file(upload_name, path)
+            if verify:
+                destination.verify_file(
+                    path, integrity.digest_file("/tmp/" + upload_name, buffer_size)
+                )
+    finally:
+        for name in [file_name] + uploaded:
+            if os.path.exists("/tmp/" + name):
+                os.remove("/tmp/" + name)
+
+
+def download_file(
+    source,
+    destinations,
+    file,
+    compressions=None,
+    decompression=None,
+    buffer_size=transfer.CHUNK_SIZE,
+    verify=True,
+):
+    # stages the file in /tmp once, uploading it to every destination
+    file_name = source.download_file(file.path).split("/")[-1]
+    # recursive transfers keep the subfolder the file was in
+    folder_path = posixpath.dirname(file.relative_name())
+
+    try:
+        if verify:
+            integrity.check_size(
+                file.path, file.size, os.path.getsize("/tmp/" + file_name)
+            )
+
+        if decompression is None:
+            upload_file(
+                destinations,
+                posixpath.join(folder_path, file_name),
+                compressions,
+                buffer_size,
+                verify,
+            )
+            return
+
+        # archives are extracted one file at a time, so /tmp holds a single one
+        with open("/tmp/" + file_name, "rb") as reader:
+            for name, chunks in decompression.decompress_members(
+                reader, file_name, buffer_size
+            ):
+                path = compress.member_path(folder_path, name)
+                member_name = posixpath.basename(path)
+                if member_name == file_name:
+                    raise Exception("File %s can't replace its archive" % name)
+                compress.write_chunks("/tmp/" + member_name, chunks)
+                upload_file(destinations, path, compressions, buffer_size, verify)
+    finally:
+        if os.path.exists("/tmp/" + file_name):
+            os.remove("/tmp/" + file_name)
+
+
+def move_file(
+    source,
+    destinations,
+    file,
+    compressions=None,
+    decompression=None,
+    streaming=True,
+    buffer_size=transfer.CHUNK_SIZE,
+    remove_file=False,
+    verify=True,
+    pipeline_depth=pipeline.QUEUE_DEPTH,
+):
+    compressions = compressions or [None] * len(destinations)
+    pending = []
+    for destination, compression in zip(destinations, compressions):
+        if (
+            compression is None
+            and decompression is None
+            and source.can_copy_to(destination)
+        ):
+            # same provider on both ends, so the bytes never leave it
+            source.copy_to(file.path, destination, file.relative_name())
+        else:
+            pending.append((destination, compression))
+
+    if pending:
+        destinations, compressions = zip(*pending)
+        if streaming:
+            stream_file(
+                source,
+                destinations,
+                file,
+                compressions,
+                decompression,
+                buffer_size,
+                verify,
+                pipeline_depth,
+            )
+        else:
+            download_file(
+                source,
+                destinations,
+                file,
+                compressions,
+                decompression,
+                buffer_size,
+                verify,
+            )
+
+    # reached only once every destination was written and verified
+    if remove_file:
+        source.remove_file(file.path)
+
+
+def bundle_files(
+    source,
+    destinations,
+    files,
+    bundler,
+    bundle_name,
+    buffer_size=transfer.CHUNK_SIZE,
+    on_success=None,
+    remove_file=False,
+    verify=True,
+    depth=pipeline.QUEUE_DEPTH,
+):
+    # packs the files into a single archive, built on the fly as they are read
+    bundled = []
+
+    def members():
+        for file in files:
+            size = file.size
+            if size is None:
+                # tar headers need the size before the content
+                size = source.file_metadata(file.path).size
+            digest = integrity.StreamDigest()
+            with source.open_read(file.path) as reader:
+                reader = integrity.DigestReader(reader, digest)
+                yield file.relative_name(), size, file.mtime, reader
+            if verify:
+                integrity.check_size(file.path, size, digest.size)
+            bundled.append(file)
+
+    # reading and packing the next files while the archive is written
+    with pipeline.Stage(bundler.bundle(members(), buffer_size), depth) as chunks:
+        write_stream(
+            compress.ChunkStream(chunks),
+            destinations,
+            bundle_name,
+            None,
+            buffer_size,
+            verify,
+            depth,
+        )
+    logging.info("Bundled %s files into %s" % (len(bundled), bundle_name))
+
+    # the files only count as transferred once the whole archive is written
+    for file in bundled:
+        if on_success is not None:
+            on_success(file)
+        if remove_file:
+            source.remove_file(file.path)
+
+
+class WorkerConnections(object):
+    """
+    Keeps a source/destinations connection pair per worker thread, since FTP and
+    SFTP sessions can't be shared between threads
+    """
+
+    def __init__(self, make_source, make_destinations):
+        self.make_source = make_source
+        self.make_destinations = make_destinations
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.opened = []
+
+    def get(self):
+        if getattr(self.local, "pair", None) is None:
+            pair = (self.make_source(), self.make_destinations())
+            # registering before connecting so a half open pair is still closed
+            with self.lock:
+                self.opened.append(pair)
+            pair[0].connect()
+            for destination in pair[1]:
+                destination.connect()
+            self.local.pair = pair
+
+        return self.local.pair
+
+    def reset(self):
+        # drops the pair of the current worker, which may be in a broken state
+        pair = getattr(self.local, "pair", None)
+        self.local.pair = None
+        if pair is not None:
+            with self.lock:
+                self.opened.remove(pair)
+            self._disconnect(pair)
+
+    def close(self):
+        with self.lock:
+            opened, self.opened = self.opened, []
+        for pair in opened:
+            self._disconnect(pair)
+
+    def _disconnect(self, pair):
+        for conn in [pair[0]] + list(pair[1]):
+            try:
+                conn.disconnect()
+            except Exception:
+                logging.exception("Error while disconnecting worker connection")
+
+
+def transfer_concurrently(
+    files,
+    make_source,
+    make_destinations,
+    max_workers,
+    on_success=None,
+    retry_policy=None,
+    transfer_metrics=None,
+    on_completed=None,
+    **kwargs
+):
+    connections = WorkerConnections(make_source, make_destinations)
+    retry_policy = retry_policy or retry.RetryPolicy(attempts=1)
+    transfer_metrics = transfer_metrics or metrics.Metrics(sinks=[])
+    errors = {}
+
+    def attempt(file):
+        source, destinations = connections.get()
+        try:
+            move_file(source, destinations, file, **kwargs)
+        except Exception:
+            # the next attempt opens new connections
+            connections.reset()
+            raise
+
+    def work(file):
+        with transfer_metrics.file(file.path):
+            retry_policy.call(lambda: attempt(file))
+
+        if on_success is not None:
+            on_success(file)
+
+    try:
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            tasks = {executor.submit(work, file): file for file in files}
+            for task in futures.as_completed(tasks):
+                file = tasks[task]
+                try:
+                    task.result()
+                    logging.info("File %s transferred successfully" % file.path)
+                except Exception as error:
+                    logging.exception("Error transferring file %s" % file.path)
+                    errors[file.path] = error
+                # called from this thread, which owns the initial connections
+                if on_completed is not None:
+                    on_completed()
+    finally:
+        connections.close()
+
+    if errors:
+        raise RuntimeError(
+            "Error transferring %s of %s files: %s"
+            % (len(errors), len(tasks), ", ".join(sorted(errors)))
+        ) from next(iter(errors.values()))
+
+
 def transfer_file(event, context):
     # parsing the message
     pubsub_message = base64.b64decode(event["data"]).decode("utf-8")
@@ -44,12 +515,7 @@ def transfer_file(event, context):
     source_conn_str = parse.urlparse(
         transfer_info["source_connection_string"], allow_fragments=False
     )
-    dest_conn_str = parse.urlparse(transfer_info["destination_connection_string"])
-    compression = (
-        transfer_info["compress_algorithm"]
-        if "compress_algorithm" in transfer_info
-        else None
-    )
+    destinations_info = parse_destinations(transfer_info)
     decompression = (
         transfer_info["decompress_algorithm"]
         if "decompress_algorithm" in transfer_info
@@ -58,58 +524,321 @@ def transfer_file(event, context):
 
     # deciding which class to instantiate from the scheme of the URI
     source_type = TRANSFER_TYPES.get(source_conn_str.scheme)
-    destination_type = TRANSFER_TYPES.get(dest_conn_str.scheme)
-    compress_type = COMPRESSION_TYPES.get(compression)
     decompress_type = COMPRESSION_TYPES.get(decompression)
 
     if source_type is None:
         raise LookupError("Type %s not supported" % source_conn_str.scheme)
 
-    if destination_type is None:
-        raise LookupError("Type %s not supported" % dest_conn_str.scheme)
-
-    if "compress_algorithm" in transfer_info and compress_type is None:
-        raise LookupError("Type %s not supported" % compression)
-
     if "decompress_algorithm" in transfer_info and decompress_type is None:
         raise LookupError("Type %s not supported" % decompression)
 
-    source = source_type(source_conn_str, transfer_info.get("service_account"))
-    destination = destination_type(dest_conn_str)
-    compression = compress_type() if compress_type is not None else None
-    decompression = decompress_type() if decompress_type is not None else None
+    bundler = None
+    if "bundle" in transfer_info:
+        bundle_type = COMPRESSION_TYPES.get(transfer_info.get("compress_algorithm"))
+        # only archive formats pack several files, the others can't bundle
+        if (
+            bundle_type is None
+            or bundle_type.bundle is compress.CompressClass.bundle
+            or decompress_type is not None
+        ):
+            raise ValueError(
+                "Bundles need a compress_algorithm of zip, tar or tar.gz"
+                " and no decompress_algorithm"
+            )
+        bundler = bundle_type(transfer_info.get("compression_level"))
+
+    if (
+        decompress_type is not None
+        and transfer_info.get("streaming", True)
+        and transfer_info.get("engine", "sync") != "async"
+        and any(
+            isinstance(compression, compress.TarCompressClass)
+            for _, _, compression in destinations_info
+        )
+    ):
+        # the files of an archive are streamed without a size for the tar header
+        raise ValueError(
+            "tar compression of decompressed files needs streaming set to false"
+        )
+
+    if transfer_info.get("plan", False):
+        if transfer_info.get("incremental", False):
+            # the children would overwrite each other's manifest
+            raise ValueError("plan can't be combined with incremental")
+        if not transfer_info.get("topic", os.environ.get("TOPIC")):
+            raise ValueError("plan needs a topic attribute or a TOPIC variable")
+
+    if transfer_info.get("engine", "sync") == "async" and bundler is None:
+        # imported only by the messages using it, as asyncio alone slows down
+        # the cold start of the others
+        import async_transfer
+
+        async_transfer.check_schemes(
+            [source_conn_str] + [info[0] for info in destinations_info]
+        )
+
+    transfer_metrics = metrics.Metrics(
+        event_id=getattr(context, "event_id", None),
+        source=source_conn_str.scheme,
+        destinations=[info[0].scheme for info in destinations_info],
+    )
+
+    def instrument(compression):
+        if compression is None:
+            return None
+        return metrics.InstrumentedCompression(compression, transfer_metrics)
+
+    def make_source():
+        return metrics.InstrumentedTransfer(
+            source_type(
+                source_conn_str, transfer_info.get("service_account"), transfer_info
+            ),
+            transfer_metrics,
+        )
+
+    def make_destinations():
+        return [
+            metrics.InstrumentedTransfer(
+                destination_type(dest_conn_str, None, transfer_info), transfer_metrics
+            )
+            for dest_conn_str, destination_type, _ in destinations_info
+        ]
+
+    source = make_source()
+    destinations = make_destinations()
+    compressions = [instrument(compression) for _, _, compression in destinations_info]
+    decompression = instrument(
+        decompress_type() if decompress_type is not None else None
+    )
+    bundler = instrument(bundler)
+    options = {
+        "compressions": compressions,
+        "decompression": decompression,
+        "streaming": transfer_info.get("streaming", True),
+        "buffer_size": transfer_info.get("buffer_size", transfer.CHUNK_SIZE),
+        "verify": bool(transfer_info.get("verify", True)),
+        "pipeline_depth": transfer_info.get("pipeline_depth", pipeline.QUEUE_DEPTH),
+    }
+    max_workers = transfer_info.get("max_workers", 1)
+
+    incremental_manifest = None
+    if transfer_info.get("incremental", False):
+        manifest_conn_str = (
+            parse.urlparse(transfer_info["manifest"])
+            if "manifest" in transfer_info
+            else manifest.default_location(destinations_info[0][0])
+        )
+        manifest_type = TRANSFER_TYPES.get(manifest_conn_str.scheme)
+        if manifest_type is None:
+            raise LookupError("Type %s not supported" % manifest_conn_str.scheme)
+        incremental_manifest = manifest.TransferManifest(
+            manifest_conn_str, manifest_type
+        )
+        incremental_manifest.load()
+
+    checkpoint = None
+    event_id = getattr(context, "event_id", None)
+    if (
+        event_id
+        and transfer_info.get("checkpoint", False)
+        and not transfer_info.get("plan", False)
+    ):
+        # redeliveries of the same event skip the files it already delivered
+        checkpoint_folder = (
+            parse.urlparse(transfer_info["checkpoint_folder"])
+            if "checkpoint_folder" in transfer_info
+            else destinations_info[0][0]
+        )
+        checkpoint_type = TRANSFER_TYPES.get(checkpoint_folder.scheme)
+        if checkpoint_type is None:
+            raise LookupError("Type %s not supported" % checkpoint_folder.scheme)
+        checkpoint = manifest.TransferManifest(
+            manifest.checkpoint_location(checkpoint_folder, event_id), checkpoint_type
+        )
+        checkpoint.load()
+    checkpoint_interval = transfer_info.get(
+        "checkpoint_interval", manifest.CHECKPOINT_INTERVAL
+    )
+    retry_policy = retry.RetryPolicy.from_options(transfer_info)
+    # only as many workers as the max_sessions of the hosts allow, besides the
+    # connections kept open by the invocation itself
+    pair = [source_conn_str] + [info[0] for info in destinations_info]
+    reserved = [
+        saved.location
+        for saved in (incremental_manifest, checkpoint)
+        if saved is not None
+    ]
+    max_workers = throttle.session_workers(max_workers, pair, reserved, transfer_info)
+    # delivered files are removed, or archived, in bulk instead of one by one
+    source_cleanup = None
+
+    def record(file):
+        if incremental_manifest is not None:
+            incremental_manifest.record(file)
+        if checkpoint is not None:
+            checkpoint.record(file)
+            checkpoint.save_periodically(checkpoint_interval)
+
+    if transfer_info.get("remove_file", False) or "archive_path" in transfer_info:
+        # files are only recorded once cleaned up, so those left at the source
+        # after a failed cleanup are transferred, and cleaned up, again
+        source_cleanup = cleanup.DeferredCleanup(
+            source,
+            transfer_info.get("archive_path"),
+            transfer_info.get("cleanup_batch", cleanup.CLEANUP_BATCH),
+            record,
+            retry_policy,
+        )
+
+    def flush_cleanup():
+        if source_cleanup is not None:
+            source_cleanup.flush(full_only=True)
+
+    completed = False
 
     try:
         source.connect()
-        destination.connect()
+        for destination in destinations:
+            destination.connect()
+
+        if "files" in transfer_info:
+            # messages published by a planner already carry their files
+            files = (transfer.FileEntry(**entry) for entry in transfer_info["files"])
+        else:
+            files = source.list_files()
 
-        # list files and transfer them one by one
-        for file in source.list_files():
-            logging.info(
-                "Transferring file %s to destination %s" % (file, dest_conn_str)
+        if incremental_manifest is not None:
+            # only new or changed files are transferred
+            files = (
+                file for file in files if not incremental_manifest.is_transferred(file)
             )
-            file_name = source.download_file(file)
 
-            try:
-                if decompression is not None:
-                    file_name = decompression.decompress_file(file_name)
+        if checkpoint is not None:
+            files = (file for file in files if not checkpoint.is_transferred(file))
+
+        if transfer_info.get("plan", False):
+            # spreading the files across child messages instead of transferring
+            publisher = planner.PubSubPublisher(
+                transfer_info.get("topic", os.environ.get("TOPIC"))
+            )
+            planner.plan(files, transfer_info, publisher)
+            completed = True
+            return
+
+        def on_success(file):
+            if source_cleanup is not None:
+                source_cleanup.add(file)
+            else:
+                record(file)
+
+        if bundler is not None:
+            # a single archive at the destinations instead of one file each
+            bundle_files(
+                source,
+                destinations,
+                files,
+                bundler,
+                transfer_info["bundle"],
+                options["buffer_size"],
+                on_success,
+                verify=options["verify"],
+                depth=options["pipeline_depth"],
+            )
+        elif transfer_info.get("engine", "sync") == "async":
+            import async_transfer
+
+            # the FTP/FTPS sessions of the engine take the place of the workers
+            async_sessions = throttle.session_workers(
+                transfer_info.get("async_sessions", async_transfer.ASYNC_SESSIONS),
+                pair,
+                reserved,
+                transfer_info,
+            )
+            if async_sessions < 1:
+                raise ValueError("max_sessions leaves no session to the async engine")
+            async_transfer.transfer_files(
+                files,
+                source_conn_str,
+                [info[0] for info in destinations_info],
+                dict(transfer_info, async_sessions=async_sessions),
+                on_success,
+                retry_policy,
+                transfer_metrics,
+                flush_cleanup,
+                **options
+            )
+        elif max_workers > 1:
+            # each worker opens its own connections to the source and destinations
+            transfer_concurrently(
+                files,
+                make_source,
+                make_destinations,
+                max_workers,
+                on_success,
+                retry_policy,
+                transfer_metrics,
+                flush_cleanup,
+                **options
+            )
+        else:
+            # list files and transfer them one by one
+            connections = [source] + destinations
+            broken = []
+
+            def attempt(file):
+                if broken:
+                    # connecting again only now, so a server still down counts
+                    # as another failed attempt
+                    for conn in connections:
+                        conn.connect()
+                    broken.clear()
+                move_file(source, destinations, file, **options)
 
-                if compression is not None:
-                    file_name = compression.compress_file(file_name)
+            def reconnect(error):
+                for conn in connections:
+                    try:
+                        conn.disconnect()
+                    except Exception:
+                        logging.exception("Error while disconnecting")
+                broken.append(error)
 
-                destination.upload_file(file_name)
+            for file in files:
+                logging.info(
+                    "Transferring file %s to destinations %s"
+                    % (file.path, [info[0].geturl() for info in destinations_info])
+                )
+                with transfer_metrics.file(file.path):
+                    retry_policy.call(lambda: attempt(file), reconnect)
+                on_success(file)
+                flush_cleanup()
 
-                if "remove_file" in transfer_info and transfer_info["remove_file"]:
-                    source.remove_file(file)
-            except Exception as error:
-                raise RuntimeError("Error during execution") from error
-            finally:
-                os.remove("/tmp/" + file_name.split("/")[-1])
+        if source_cleanup is not None:
+            source_cleanup.flush()
+            source_cleanup.check()
+        completed = True
     except Exception as error:
         raise RuntimeError("Error during execution") from error
     finally:
+        if source_cleanup is not None and not completed:
+            # the files delivered before the failure are cleaned up all the same
+            source_cleanup.flush()
         source.disconnect()
-        destination.disconnect()
+        for destination in destinations:
+            destination.disconnect()
+        # saving even after a failure, so the files already delivered are kept
+        if incremental_manifest is not None:
+            incremental_manifest.save()
+        if checkpoint is not None:
+            if completed:
+                # a finished event won't be redelivered
+                try:
+                    checkpoint.remove()
+                except Exception:
+                    logging.warning("Checkpoint could not be removed", exc_info=True)
+            else:
+                checkpoint.save()
+        # a single structured summary of where the time went
+        transfer_metrics.emit(completed=completed)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import ftplib
+import json
+import logging
+import posixpath
+import threading
+import time
+
+# name of the manifest kept at the destination when no location is given
+MANIFEST_NAME = ".transfer_manifest.json"
+# name of the checkpoint of an event, kept at the destination until it succeeds
+CHECKPOINT_NAME = ".transfer_checkpoint_{}.json"
+# default seconds between saves of a checkpoint while the event runs
+CHECKPOINT_INTERVAL = 30
+
+
+class TransferManifest(object):
+    """
+    Record of the files already transferred, with the metadata they had at the
+    source, so following runs only transfer new or changed files
+    """
+
+    def __init__(self, location, transfer_type, options=None):
+        # location is the parsed URI of the manifest file itself
+        self.location = location
+        self.name = posixpath.basename(location.path)
+        folder = posixpath.dirname(location.path).rstrip("/") + "/"
+        self.storage = transfer_type(location._replace(path=folder), None, options)
+        self.files = {}
+        self.lock = threading.Lock()
+        self.saved_at = time.time()
+
+    def load(self):
+        self.storage.connect()
+        try:
+            with self.storage.open_read(self.location.path) as reader:
+                self.files = json.load(reader)["files"]
+            logging.info(
+                "Loaded manifest %s with %s files"
+                % (self.location.geturl(), len(self.files))
+            )
+        except Exception as error:
+            # a manifest that exists but can't be read must not be replaced by
+            # an empty one, which would transfer every file again
+            if not is_missing(error):
+                raise
+            # the first run, or a checkpoint of a new event
+            logging.info(
+                "Manifest %s not found, starting a new one" % self.location.geturl()
+            )
+            self.files = {}
+        finally:
+            self.storage.disconnect()
+
+    def save(self):
+        with self.lock:
+            content = json.dumps({"files": self.files}, sort_keys=True)
+
+        self.storage.connect()
+        try:
+            with self.storage.open_write(self.name) as writer:
+                writer.write(content.encode("utf-8"))
+        finally:
+            self.storage.disconnect()
+        logging.info("Saved manifest %s" % self.location.geturl())
+
+    def save_periodically(self, interval):
+        # saves at most once per interval, in seconds, so a run killed by a
+        # timeout still leaves the files it delivered recorded
+        with self.lock:
+            if time.time() - self.saved_at < interval:
+                return
+            self.saved_at = time.time()
+        self.save()
+
+    def remove(self):
+        self.storage.connect()
+        try:
+            self.storage.remove_file(self.location.path)
+        except Exception as error:
+            # never saved, as the event finished before the first save
+            if not is_missing(error):
+                raise
+        finally:
+            self.storage.disconnect()
+        logging.info("Removed manifest %s" % self.location.geturl())
+
+    def is_transferred(self, entry):
+        # entry is the FileEntry listed at the source
+        with self.lock:
+            return self.files.get(entry.path) == entry.metadata()
+
+    def record(self, entry):
+        with self.lock:
+            self.files[entry.path] = entry.metadata()
+
+
+def is_missing(error):
+    # each backend fails differently for a missing file
+    if isinstance(error, FileNotFoundError):
+        return True
+    if isinstance(error, ftplib.error_perm):
+        return str(error).startswith("550")
+    name = type(error).__name__
+    if name == "NotFound":
+        # google.api_core
+        return True
+    if name == "ClientError" and hasattr(error, "response"):
+        return error.response.get("Error", {}).get("Code") in ("NoSuchKey", "404")
+    return False
+
+
+def default_location(dest_conn_str, name=MANIFEST_NAME):
+    # the manifest lives in the destination folder
+    return dest_conn_str._replace(path=posixpath.join(dest_conn_str.path or "/", name))
+
+
+def checkpoint_location(folder_conn_str, event_id):
+    # one checkpoint per event, so redeliveries of the message find it again
+    return default_location(folder_conn_str, CHECKPOINT_NAME.format(event_id))
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+# file being transferred by the current thread, as (metrics, stats), carried
+# over to the threads of a tee
+CURRENT_FILE = contextvars.ContextVar("current_file", default=None)
+
+# phases whose bytes were read from the source or written to the destinations
+READ_PHASES = ("read", "download")
+WRITE_PHASES = ("write", "upload")
+
+
+class LoggingSink(object):
+    """Logs each record as a JSON line, the invocation summary at INFO level"""
+
+    def emit(self, record):
+        level = logging.INFO if record["type"] == "invocation" else logging.DEBUG
+        logging.log(level, json.dumps(record, sort_keys=True, default=str))
+
+
+class InMemorySink(object):
+    """Keeps the records, for testing"""
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+# sinks used by the Metrics created without explicit ones
+SINKS = [LoggingSink()]
+
+
+def new_phase():
+    return {"seconds": 0.0, "calls": 0, "bytes": 0}
+
+
+def phase_summary(phases):
+    summary = {}
+    for name, phase in phases.items():
+        summary[name] = dict(phase, seconds=round(phase["seconds"], 6))
+        if phase["bytes"] and phase["seconds"] > 0:
+            summary[name]["throughput"] = round(phase["bytes"] / phase["seconds"])
+    return summary
+
+
+class Metrics(object):
+    """
+    Latency, calls and bytes of each phase of a transfer (listing, reading,
+    compressing, writing...), both per file and for the whole invocation. Time
+    is exclusive: a phase running inside another, as the reads a compression
+    pulls, is not counted in the outer one
+    """
+
+    def __init__(self, sinks=None, **labels):
+        self.sinks = SINKS if sinks is None else sinks
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.phases = {}
+        self.files = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        stack = self.local.__dict__.setdefault("stack", [])
+        # name, start and seconds spent in nested phases
+        entry = [name, time.perf_counter(), 0.0]
+        stack.append(entry)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - entry[1]
+            if stack:
+                stack[-1][2] += elapsed
+            self.record(name, elapsed - entry[2], calls=1)
+
+    def add_bytes(self, name, size):
+        self.record(name, 0.0, calls=0, size=size)
+
+    def record(self, name, seconds, calls=1, size=0):
+        current = CURRENT_FILE.get()
+        targets = [self.phases]
+        if current is not None and current[0] is self:
+            targets.append(current[1]["phases"])
+
+        with self.lock:
+            for phases in targets:
+                phase = phases.setdefault(name, new_phase())
+                phase["seconds"] += seconds
+                phase["calls"] += calls
+                phase["bytes"] += size
+
+    @contextlib.contextmanager
+    def file(self, path):
+        stats = {"phases": {}}
+        token = CURRENT_FILE.set((self, stats))
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            CURRENT_FILE.reset(token)
+            with self.lock:
+                self.files += 1
+                self.failed += error is not None
+                record = {
+                    "type": "file",
+                    "path": path,
+                    "seconds": round(time.perf_counter() - started, 6),
+                    "phases": phase_summary(stats["phases"]),
+                }
+            if error is not None:
+                record["error"] = repr(error)
+            self._emit(record)
+
+    def summary(self, **extra):
+        seconds = time.perf_counter() - self.started
+        with self.lock:
+            read = self._bytes(READ_PHASES)
+            written = self._bytes(WRITE_PHASES)
+            summary = dict(
+                self.labels,
+                type="invocation",
+                files=self.files,
+                failed=self.failed,
+                seconds=round(seconds, 6),
+                bytes_read=read,
+                bytes_written=written,
+                # over the wall time, so it reflects the concurrency used
+                throughput=round(read / seconds) if seconds > 0 else 0,
+                phases=phase_summary(self.phases),
+            )
+        summary.update(extra)
+        return summary
+
+    def emit(self, **extra):
+        self._emit(self.summary(**extra))
+
+    def _bytes(self, names):
+        return sum(self.phases[name]["bytes"] for name in names if name in self.phases)
+
+    def _emit(self, record):
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception:
+                # metrics never fail a transfer
+                logging.exception("Error emitting metrics")
+
+
+def timed_iter(metrics, name, iterator, size=len):
+    # times the production of each item, counting size(item) bytes
+    iterator = iter(iterator)
+    while True:
+        with metrics.phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        metrics.add_bytes(name, size(item))
+        yield item
+
+
+class TimedStream(object):
+    """
+    Proxy of a readable or writable stream timing its calls. Entering and
+    leaving it is delegated, so writers that abort on errors still do
+    """
+
+    def __init__(self, stream, metrics, name):
+        self.stream = stream
+        self.metrics = metrics
+        self.name = name
+
+    def read(self, size=-1):
+        with self.metrics.phase(self.name):
+            data = self.stream.read(size)
+        self.metrics.add_bytes(self.name, len(data))
+        return data
+
+    def write(self, b):
+        with self.metrics.phase(self.name):
+            written = self.stream.write(b)
+        self.metrics.add_bytes(self.name, len(b))
+        return written
+
+    def close(self):
+        with self.metrics.phase(self.name):
+            self.stream.close()
+
+    def __enter__(self):
+        self.stream.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # writers commit the file on exit
+        with self.metrics.phase(self.name):
+            return self.stream.__exit__(exc_type, exc_value, traceback)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def unwrap(transfer):
+    return transfer.transfer if isinstance(transfer, InstrumentedTransfer) else transfer
+
+
+class InstrumentedTransfer(object):
+    """Proxy of a FileTransfer recording the time and bytes of its calls"""
+
+    def __init__(self, transfer, metrics):
+        self.transfer = transfer
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self.transfer, name)
+
+    def connect(self):
+        with self.metrics.phase("connect"):
+            return self.transfer.connect()
+
+    def disconnect(self):
+        with self.metrics.phase("disconnect"):
+            return self.transfer.disconnect()
+
+    def download_file(self, file_path):
+        with self.metrics.phase("download"):
+            file_name = self.transfer.download_file(file_path)
+        self.metrics.add_bytes(
+            "download", os.path.getsize("/tmp/" + file_name.split("/")[-1])
+        )
+        return file_name
+
+    def upload_file(self, file_path, remote_name=None):
+        self.metrics.add_bytes("upload", os.path.getsize("/tmp/" + file_path))
+        with self.metrics.phase("upload"):
+            return self.transfer.upload_file(file_path, remote_name)
+
+    def list_files(self):
+        return timed_iter(
+            self.metrics, "list", self.transfer.list_files(), lambda entry: 0
+        )
+
+    def list_folder(self, folder_path):
+        with self.metrics.phase("list"):
+            return self.transfer.list_folder(folder_path)
+
+    def remove_file(self, file_path):
+        with self.metrics.phase("remove"):
+            return self.transfer.remove_file(file_path)
+
+    def remove_files(self, file_paths):
+        with self.metrics.phase("remove"):
+            return self.transfer.remove_files(file_paths)
+
+    def rename_files(self, renames):
+        with self.metrics.phase("archive"):
+            return self.transfer.rename_files(renames)
+
+    def open_read(self, file_path):
+        with self.metrics.phase("read"):
+            stream = self.transfer.open_read(file_path)
+        return TimedStream(stream, self.metrics, "read")
+
+    def open_write(self, file_name):
+        with self.metrics.phase("write"):
+            stream = self.transfer.open_write(file_name)
+        return TimedStream(stream, self.metrics, "write")
+
+    def file_metadata(self, file_path):
+        with self.metrics.phase("metadata"):
+            return self.transfer.file_metadata(file_path)
+
+    def verify_file(self, file_name, digest):
+        with self.metrics.phase("verify"):
+            return self.transfer.verify_file(file_name, digest)
+
+    def can_copy_to(self, destination):
+        return self.transfer.can_copy_to(unwrap(destination))
+
+    def copy_to(self, file_path, destination, file_name):
+        with self.metrics.phase("copy"):
+            return self.transfer.copy_to(file_path, unwrap(destination), file_name)
+
+
+class InstrumentedCompression(object):
+    """Proxy of a CompressClass timing the (de)compression of the chunks"""
+
+    def __init__(self, compression, metrics):
+        self.compression = compression
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self.compression, name)
+
+    def compress_file(self, file_path):
+        with self.metrics.phase("compress"):
+            return self.compression.compress_file(file_path)
+
+    def decompress_file(self, file_path):
+        with self.metrics.phase("decompress"):
+            return self.compression.decompress_file(file_path)
+
+    def compress_stream(self, stream, file_name, *args, **kwargs):
+        name, chunks = self.compression.compress_stream(
+            stream, file_name, *args, **kwargs
+        )
+        return name, timed_iter(self.metrics, "compress", chunks)
+
+    def decompress_stream(self, stream, file_name, *args):
+        name, chunks = self.compression.decompress_stream(stream, file_name, *args)
+        return name, timed_iter(self.metrics, "decompress", chunks)
+
+    def decompress_members(self, stream, file_name, *args):
+        members = self.compression.decompress_members(stream, file_name, *args)
+        # reading the headers of the members counts as decompression too
+        for name, chunks in timed_iter(
+            self.metrics, "decompress", members, lambda member: 0
+        ):
+            yield name, timed_iter(self.metrics, "decompress", chunks)
+
+    def bundle(self, members, *args):
+        return timed_iter(
+            self.metrics, "compress", self.compression.bundle(members, *args)
+        )
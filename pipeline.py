@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import contextvars
+import queue
+import threading
+
+import compress
+import metrics
+
+# number of chunks buffered for each consumer of a tee and between the stages of
+# a file, bounding the memory used and making the producers wait for the slowest
+# consumer
+QUEUE_DEPTH = 4
+# how often a blocked producer checks whether its consumer failed, in seconds
+POLL_INTERVAL = 0.1
+
+_END = object()
+_ABORT = object()
+
+
+class Stage(object):
+    """
+    Runs an iterator in a thread of its own, up to `depth` items ahead of its
+    consumer, so producing the next chunks (downloading, compressing) overlaps
+    with processing the current ones. Errors are raised to the consumer, and
+    closing the stage stops its thread. A depth of 0 runs the iterator in the
+    thread of the consumer instead
+    """
+
+    def __init__(self, iterator, depth=QUEUE_DEPTH):
+        self.iterator = iter(iterator)
+        self.finished = False
+        self.thread = None
+        if depth > 0:
+            self.queue = queue.Queue(maxsize=depth)
+            self.stopped = threading.Event()
+            # the producer sees the context variables of the thread creating it
+            context = contextvars.copy_context()
+            self.thread = threading.Thread(
+                target=context.run, args=(self._run,), daemon=True
+            )
+            self.thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.finished:
+            raise StopIteration
+        if self.thread is None:
+            return next(self.iterator)
+
+        item, error = self._get()
+        if error is not None or item is _END:
+            self.finished = True
+        if error is not None:
+            raise error
+        if item is _END:
+            raise StopIteration
+        return item
+
+    def close(self):
+        self.finished = True
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get(self):
+        current = metrics.CURRENT_FILE.get()
+        if current is None:
+            return self.queue.get()
+        # time spent starved by the producer, not by the phase consuming it
+        with current[0].phase("wait"):
+            return self.queue.get()
+
+    def _put(self, entry):
+        # gives up once the consumer closed the stage
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(entry, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            for item in self.iterator:
+                if not self._put((item, None)):
+                    return
+            self._put((_END, None))
+        except Exception as error:
+            self._put((None, error))
+
+
+class StreamBranch(object):
+    """
+    One consumer of a tee, running in its own thread over the chunks put in its
+    bounded queue
+    """
+
+    def __init__(self, consume, depth=QUEUE_DEPTH):
+        self.queue = queue.Queue(maxsize=depth)
+        self.error = None
+        # the consumer sees the context variables of the thread creating it
+        context = contextvars.copy_context()
+        self.thread = threading.Thread(
+            target=context.run, args=(self._run, consume), daemon=True
+        )
+        self.thread.start()
+
+    def put(self, chunk):
+        # gives up on a failed or finished consumer instead of blocking forever
+        while self.error is None and self.thread.is_alive():
+            try:
+                self.queue.put(chunk, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self, abort=False):
+        self.put(_ABORT if abort else _END)
+        self.thread.join()
+        return self.error
+
+    def _chunks(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is _END:
+                return
+            if chunk is _ABORT:
+                # raised inside the consumer so its writer is not committed
+                raise IOError("Source stream failed")
+            yield chunk
+
+    def _run(self, consume):
+        try:
+            consume(self._chunks())
+        except Exception as error:
+            self.error = error
+
+
+def tee(stream, consumers, buffer_size=compress.BUFFER_SIZE, depth=QUEUE_DEPTH):
+    """
+    Reads the stream once, handing every chunk to each consumer, which runs in
+    its own thread and receives an iterator of chunks. Returns the error raised
+    by each consumer, or None for those that succeeded
+    """
+    branches = [StreamBranch(consume, depth) for consume in consumers]
+    try:
+        for chunk in compress.read_chunks(stream, buffer_size):
+            for branch in branches:
+                branch.put(chunk)
+            if all(branch.error is not None for branch in branches):
+                break
+    except Exception:
+        for branch in branches:
+            branch.finish(abort=True)
+        raise
+
+    return [branch.finish() for branch in branches]
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+import heapq
+import json
+import logging
+import math
+import os
+import posixpath
+
+# default limits of files and bytes handled by each child message
+SHARD_FILES = 500
+SHARD_BYTES = 5 * 1024 * 1024 * 1024
+# message attributes only meaningful to the planner
+PLANNER_ATTRIBUTES = ("plan", "shard_files", "shard_bytes", "topic", "files")
+
+
+class PubSubPublisher(object):
+    """Publishes the child messages to a Pub/Sub topic"""
+
+    def __init__(self, topic):
+        # only planner runs pay for the pubsub import
+        from google.cloud import pubsub_v1
+
+        self.client = pubsub_v1.PublisherClient()
+        # accepting both the topic name and its full path
+        self.topic = (
+            topic
+            if topic.startswith("projects/")
+            else self.client.topic_path(os.environ["PROJECT"], topic)
+        )
+        self.pending = []
+
+    def publish(self, message):
+        data = json.dumps(message).encode("utf-8")
+        self.pending.append(self.client.publish(self.topic, data))
+
+    def wait(self):
+        # raises if any of the messages could not be published
+        for future in self.pending:
+            future.result()
+        self.pending = []
+
+
+class InMemoryPublisher(object):
+    """Stand-in for PubSubPublisher that keeps the messages, for testing"""
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, message):
+        self.messages.append(message)
+
+    def wait(self):
+        pass
+
+
+def partition(entries, shard_files=SHARD_FILES, shard_bytes=SHARD_BYTES):
+    """
+    Splits the entries into the fewest shards respecting both limits, the
+    number of files strictly and the bytes on average, balancing the bytes of
+    the shards (largest files first, each one to the lightest shard) and, for
+    ties, their number of files
+    """
+    entries = list(entries)
+    if not entries:
+        return []
+
+    total = sum(entry.size or 0 for entry in entries)
+    count = max(
+        math.ceil(len(entries) / shard_files), math.ceil(total / shard_bytes), 1
+    )
+    count = min(count, len(entries))
+
+    # heap of (bytes, files, shard index)
+    heap = [(0, 0, i) for i in range(count)]
+    shards = [[] for _ in range(count)]
+    for entry in sorted(entries, key=lambda entry: entry.size or 0, reverse=True):
+        size, files, i = heapq.heappop(heap)
+        shards[i].append(entry)
+        # full shards leave the heap, the others having room for the rest
+        if files + 1 < shard_files:
+            heapq.heappush(heap, (size + (entry.size or 0), files + 1, i))
+
+    return shards
+
+
+def shard_name(file_name, number):
+    # all.tar.gz becomes all-1.tar.gz, keeping every extension of the archive
+    folder_path, name = posixpath.split(file_name)
+    stem, dot, extensions = name.partition(".")
+    return posixpath.join(folder_path, "%s-%s%s%s" % (stem, number, dot, extensions))
+
+
+def plan(entries, transfer_info, publisher):
+    """
+    Publishes one child message per shard of the entries, each carrying its
+    explicit file list so the children don't list the source again
+    """
+    shards = partition(
+        entries,
+        transfer_info.get("shard_files", SHARD_FILES),
+        transfer_info.get("shard_bytes", SHARD_BYTES),
+    )
+    child_info = {
+        key: value
+        for key, value in transfer_info.items()
+        if key not in PLANNER_ATTRIBUTES
+    }
+    # the children are new events, with their own retry window
+    child_info["event_date"] = datetime.now().isoformat()
+
+    for number, shard in enumerate(shards, 1):
+        message = dict(child_info, files=[entry._asdict() for entry in shard])
+        if "bundle" in message and len(shards) > 1:
+            # each child writes an archive of its own instead of overwriting
+            # the one of the others
+            message["bundle"] = shard_name(message["bundle"], number)
+        publisher.publish(message)
+    publisher.wait()
+
+    logging.info(
+        "Published %s shards with %s files"
+        % (len(shards), sum(len(shard) for shard in shards))
+    )
+    return len(shards)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import collections.abc
+import importlib
+import threading
+
+
+class Registry(collections.abc.MutableMapping):
+    """
+    Maps names (URI schemes, compression algorithms) to the classes providing
+    them. A provider may be registered as the class itself or as its
+    "module:Class" path, imported the first time its name is looked up, so
+    providers living in other modules cost nothing until a message uses them
+    """
+
+    def __init__(self, providers=None):
+        # reentrant, as importing a provider may look up others
+        self.lock = threading.RLock()
+        self.providers = dict(providers or {})
+
+    def register(self, name, provider):
+        with self.lock:
+            self.providers[name] = provider
+
+    def __getitem__(self, name):
+        with self.lock:
+            provider = self.providers[name]
+            if isinstance(provider, str):
+                module_name, _, attribute = provider.partition(":")
+                provider = getattr(importlib.import_module(module_name), attribute)
+                self.providers[name] = provider
+            return provider
+
+    def __setitem__(self, name, provider):
+        self.register(name, provider)
+
+    def __delitem__(self, name):
+        with self.lock:
+            del self.providers[name]
+
+    def __iter__(self):
+        return iter(list(self.providers))
+
+    def __len__(self):
+        return len(self.providers)
+
+    def __contains__(self, name):
+        return name in self.providers
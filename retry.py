@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import ftplib
+import logging
+import random
+import socket
+import sys
+import time
+
+import integrity
+
+# default attempts per file and bounds of the delay between them, in seconds
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# S3 error codes meaning the request may succeed if sent again
+S3_TRANSIENT_CODES = {
+    "InternalError",
+    "RequestTimeout",
+    "RequestTimeTooSkewed",
+    "ServiceUnavailable",
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+}
+# botocore errors raised before any response was received
+BOTOCORE_TRANSIENT_ERRORS = {
+    "ConnectionClosedError",
+    "ConnectTimeoutError",
+    "EndpointConnectionError",
+    "IncompleteReadError",
+    "ReadTimeoutError",
+    "ResponseStreamingError",
+}
+# google.api_core exceptions of throttling and server side failures
+GCS_TRANSIENT_ERRORS = {
+    "BadGateway",
+    "GatewayTimeout",
+    "InternalServerError",
+    "ServiceUnavailable",
+    "TooManyRequests",
+}
+
+
+def is_transient(error):
+    """
+    Whether the error may go away by trying again, as dropped connections,
+    throttling and temporary server failures. Errors wrapping another one, as
+    those of multi-destination writes, are classified by their cause
+    """
+    if isinstance(error, RuntimeError) and error.__cause__ is not None:
+        return is_transient(error.__cause__)
+
+    # FTP replies in the 4xx range are temporary, 5xx are permanent
+    if isinstance(error, ftplib.error_temp):
+        return True
+    if isinstance(error, ftplib.error_perm):
+        return False
+    if isinstance(error, (ftplib.error_reply, ftplib.error_proto)):
+        return True
+
+    # a truncated file is worth transferring again
+    if isinstance(error, integrity.IntegrityError):
+        return True
+
+    if isinstance(error, (ConnectionError, TimeoutError, socket.timeout, EOFError)):
+        return True
+
+    # only checked when the libraries were already imported by a transfer
+    paramiko = sys.modules.get("paramiko")
+    if paramiko is not None:
+        if isinstance(error, paramiko.AuthenticationException):
+            return False
+        if isinstance(error, paramiko.SSHException):
+            return True
+
+    # the libraries of the async engine, also only when already imported
+    asyncssh = sys.modules.get("asyncssh")
+    if asyncssh is not None:
+        if isinstance(error, asyncssh.PermissionDenied):
+            return False
+        if isinstance(error, (asyncssh.DisconnectError, asyncssh.SFTPConnectionLost)):
+            return True
+    aioftp = sys.modules.get("aioftp")
+    if aioftp is not None and isinstance(error, aioftp.StatusCodeError):
+        # same split of the 4xx and 5xx replies as ftplib
+        return any(str(code).startswith("4") for code in error.received_codes)
+    aiohttp = sys.modules.get("aiohttp")
+    if aiohttp is not None:
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status == 429 or error.status >= 500
+        if isinstance(error, aiohttp.ClientConnectionError):
+            return True
+
+    name = type(error).__name__
+    if name in BOTOCORE_TRANSIENT_ERRORS:
+        return True
+    if name == "ClientError" and hasattr(error, "response"):
+        response = error.response
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        code = response.get("Error", {}).get("Code")
+        return code in S3_TRANSIENT_CODES or status == 429 or status >= 500
+
+    api_exceptions = sys.modules.get("google.api_core.exceptions")
+    if api_exceptions is not None and isinstance(
+        error, api_exceptions.GoogleAPICallError
+    ):
+        return name in GCS_TRANSIENT_ERRORS
+
+    return False
+
+
+class RetryPolicy(object):
+    """Exponential backoff with full jitter, for transient errors only"""
+
+    def __init__(
+        self,
+        attempts=RETRY_ATTEMPTS,
+        base_delay=RETRY_BASE_DELAY,
+        max_delay=RETRY_MAX_DELAY,
+        sleep=time.sleep,
+    ):
+        self.attempts = max(attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(
+            options.get("retry_attempts", RETRY_ATTEMPTS),
+            options.get("retry_base_delay", RETRY_BASE_DELAY),
+            options.get("retry_max_delay", RETRY_MAX_DELAY),
+        )
+
+    def delay(self, attempt):
+        # a random delay up to the exponential bound spreads the retries of the
+        # concurrent workers, instead of hitting the server at the same time
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+
+    def call(self, function, on_retry=None):
+        """
+        Calls the function until it succeeds, fails with a permanent error or
+        runs out of attempts. on_retry receives the error before each new
+        attempt, to reset the state the failure may have left behind
+        """
+        attempt = 1
+        while True:
+            try:
+                return function()
+            except Exception as error:
+                if attempt >= self.attempts or not is_transient(error):
+                    raise
+                delay = self.delay(attempt)
+                logging.warning(
+                    "Attempt %s of %s failed with %r, retrying in %.1fs"
+                    % (attempt, self.attempts, error, delay)
+                )
+                if on_retry is not None:
+                    on_retry(error)
+                self.sleep(delay)
+                attempt += 1
+
+    async def call_async(self, function):
+        """
+        Same as call for a function returning a coroutine, waiting between the
+        attempts without blocking the event loop
+        """
+        # only the async engine uses it, so the sync ones don't pay its import
+        import asyncio
+
+        attempt = 1
+        while True:
+            try:
+                return await function()
+            except Exception as error:
+                if attempt >= self.attempts or not is_transient(error):
+                    raise
+                delay = self.delay(attempt)
+                logging.warning(
+                    "Attempt %s of %s failed with %r, retrying in %.1fs"
+                    % (attempt, self.attempts, error, delay)
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
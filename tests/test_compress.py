@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import zipfile
+
+import pytest
+
+import compress
+
+DATA = bytes(range(256)) * 4096
+
+
+def decompress(codec, data):
+    _, chunks = codec.decompress_stream(io.BytesIO(data), "file.gz", 1024)
+    return b"".join(chunks)
+
+
+def test_gzip_members():
+    data = gzip.compress(DATA) + gzip.compress(DATA)
+    assert decompress(compress.GzipCompressClass(), data) == DATA * 2
+
+
+def test_gzip_truncated():
+    data = gzip.compress(DATA)
+    with pytest.raises(EOFError):
+        decompress(compress.GzipCompressClass(), data[:-10])
+
+
+def test_gzip_truncated_member():
+    data = gzip.compress(DATA)
+    with pytest.raises(EOFError):
+        decompress(compress.GzipCompressClass(), data + data[:100])
+
+
+def zip_archive(name, data):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(name, data)
+    return archive.getvalue()
+
+
+def test_zip_members():
+    data = zip_archive("a.bin", DATA)
+    members = [
+        (name, b"".join(chunks))
+        for name, chunks in compress.iter_zip_members(io.BytesIO(data), 1024)
+    ]
+    assert members == [("a.bin", DATA)]
+
+
+def test_zip_bad_crc():
+    data = bytearray(zip_archive("a.bin", DATA))
+    # the crc32 of the local header
+    data[14] ^= 0xFF
+    with pytest.raises(zipfile.BadZipFile):
+        for _, chunks in compress.iter_zip_members(io.BytesIO(bytes(data)), 1024):
+            b"".join(chunks)
+
+
+@pytest.mark.parametrize("codec", ["zstd", "lz4"])
+def test_frames(codec):
+    codec = compress.get_compression_types()[codec]()
+    _, chunks = codec.compress_stream(io.BytesIO(DATA), "file", 1024)
+    data = b"".join(chunks)
+    assert decompress(codec, data + data) == DATA * 2
+
+
+@pytest.mark.parametrize("codec", ["zstd", "lz4"])
+def test_frames_truncated(codec):
+    codec = compress.get_compression_types()[codec]()
+    _, chunks = codec.compress_stream(io.BytesIO(DATA), "file", 1024)
+    data = b"".join(chunks)
+    with pytest.raises(EOFError):
+        decompress(codec, data[:-4])
+    with pytest.raises(EOFError):
+        decompress(codec, data + data[:20])
+
+
+def test_tar_stream_with_size():
+    codec = compress.TarCompressClass()
+    name, chunks = codec.compress_stream(io.BytesIO(DATA), "a.bin", 1024, len(DATA))
+    assert name == "a.bin.tar"
+    _, chunks = codec.decompress_stream(io.BytesIO(b"".join(chunks)), name, 1024)
+    assert b"".join(chunks) == DATA
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import base64
+import json
+
+import pytest
+
+import main
+
+
+def event(**transfer_info):
+    message = dict(
+        source_connection_string="ftp://host/in/?username=user&password=secret",
+        destination_connection_string="gs://bucket/out/",
+        **transfer_info
+    )
+    return {"data": base64.b64encode(json.dumps(message).encode("utf-8"))}
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd", "lz4", None])
+def test_bundle_needs_archive(compression):
+    with pytest.raises(ValueError, match="Bundles"):
+        main.transfer_file(event(bundle="all.gz", compress_algorithm=compression), None)
+
+
+def test_streamed_tar_of_archive_members():
+    with pytest.raises(ValueError, match="streaming"):
+        main.transfer_file(
+            event(decompress_algorithm="zip", compress_algorithm="tar"), None
+        )
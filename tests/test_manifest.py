@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+from urllib import parse
+
+import pytest
+
+import manifest
+import transfer
+
+STORED = {}
+
+
+class FakeStorage(object):
+    # keeps the files in STORED, by their full path
+    def __init__(self, conn_str, service_account, options=None):
+        self.folder = conn_str.path
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def open_read(self, file_path):
+        if file_path not in STORED:
+            raise FileNotFoundError(file_path)
+        if isinstance(STORED[file_path], Exception):
+            raise STORED[file_path]
+        return io.BytesIO(STORED[file_path])
+
+    def open_write(self, file_name):
+        storage = self
+
+        class Writer(io.BytesIO):
+            def __exit__(self, *args):
+                STORED[storage.folder + file_name] = self.getvalue()
+
+        return Writer()
+
+
+@pytest.fixture
+def location():
+    STORED.clear()
+    return parse.urlparse("fake://bucket/out/manifest.json")
+
+
+def entry(size, modified="2020-01-01T00:00:00"):
+    return transfer.FileEntry("/src/a.csv", size, modified, "md5")
+
+
+def test_missing_starts_empty(location):
+    saved = manifest.TransferManifest(location, FakeStorage)
+    saved.load()
+    assert saved.files == {}
+    assert not saved.is_transferred(entry(1))
+
+
+def test_save_and_load(location):
+    saved = manifest.TransferManifest(location, FakeStorage)
+    saved.record(entry(1))
+    saved.save()
+    assert json.loads(STORED["/out/manifest.json"])["files"]
+
+    loaded = manifest.TransferManifest(location, FakeStorage)
+    loaded.load()
+    assert loaded.is_transferred(entry(1))
+    # changed files are transferred again
+    assert not loaded.is_transferred(entry(2))
+    assert not loaded.is_transferred(entry(1, "2021-01-01T00:00:00"))
+
+
+def test_corrupt_raises(location):
+    STORED["/out/manifest.json"] = b"{not json"
+    with pytest.raises(ValueError):
+        manifest.TransferManifest(location, FakeStorage).load()
+
+
+def test_storage_error_raises(location):
+    STORED["/out/manifest.json"] = PermissionError("forbidden")
+    with pytest.raises(PermissionError):
+        manifest.TransferManifest(location, FakeStorage).load()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+
+import metrics
+
+
+def test_file_records():
+    sink = metrics.InMemorySink()
+    transfer_metrics = metrics.Metrics([sink], source="ftp")
+    with transfer_metrics.file("/in/a.csv"):
+        reader = metrics.TimedStream(io.BytesIO(b"x" * 10), transfer_metrics, "read")
+        writer = metrics.TimedStream(io.BytesIO(), transfer_metrics, "write")
+        writer.write(reader.read())
+    with pytest.raises(IOError):
+        with transfer_metrics.file("/in/b.csv"):
+            raise IOError("failed")
+    transfer_metrics.emit(removed=0)
+
+    first, second, summary = sink.records
+    assert first["type"] == "file" and first["path"] == "/in/a.csv"
+    assert first["phases"]["read"]["bytes"] == 10
+    assert first["phases"]["write"]["calls"] == 1
+    assert "error" in second and not second["phases"]
+    assert summary["type"] == "invocation" and summary["source"] == "ftp"
+    assert summary["files"] == 2 and summary["failed"] == 1
+    assert summary["bytes_read"] == summary["bytes_written"] == 10
+    assert summary["removed"] == 0
+
+
+def test_nested_phases_are_exclusive(monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(metrics.time, "perf_counter", lambda: next(clock))
+    transfer_metrics = metrics.Metrics([])
+    # compress runs from 1 to 4, the read inside it from 2 to 3
+    with transfer_metrics.phase("compress"):
+        with transfer_metrics.phase("read"):
+            pass
+    assert transfer_metrics.phases["read"]["seconds"] == 1
+    assert transfer_metrics.phases["compress"]["seconds"] == 2
+
+
+def test_failing_sink_is_ignored():
+    class FailingSink(object):
+        def emit(self, record):
+            raise ValueError("unreachable")
+
+    sink = metrics.InMemorySink()
+    metrics.Metrics([FailingSink(), sink]).emit()
+    assert [record["type"] for record in sink.records] == ["invocation"]
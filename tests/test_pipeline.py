@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+
+import pipeline
+
+DATA = bytes(range(256)) * 64
+
+
+def collect(received):
+    def consume(chunks):
+        received.append(b"".join(chunks))
+
+    return consume
+
+
+def test_tee_copies_to_every_consumer():
+    first, second = [], []
+    errors = pipeline.tee(io.BytesIO(DATA), [collect(first), collect(second)], 100)
+    assert errors == [None, None]
+    assert first == second == [DATA]
+
+
+def test_tee_keeps_going_without_failed_consumer():
+    def fail(chunks):
+        next(chunks)
+        raise ValueError("destination failed")
+
+    received = []
+    errors = pipeline.tee(io.BytesIO(DATA), [fail, collect(received)], 100, depth=1)
+    assert isinstance(errors[0], ValueError) and errors[1] is None
+    assert received == [DATA]
+
+
+class FailingStream(io.BytesIO):
+    def read(self, size=-1):
+        if self.tell() >= 1000:
+            raise ConnectionResetError("source failed")
+        return super().read(size)
+
+
+def test_tee_aborts_consumers_when_source_fails():
+    seen = []
+
+    def consume(chunks):
+        try:
+            for _ in chunks:
+                pass
+        except IOError as error:
+            seen.append(error)
+            raise
+
+    with pytest.raises(ConnectionResetError):
+        pipeline.tee(FailingStream(DATA), [consume, consume], 100)
+    # neither consumer saw a clean end, so no writer commits
+    assert len(seen) == 2
+
+
+@pytest.mark.parametrize("depth", [0, 2])
+def test_stage_raises_to_consumer(depth):
+    def produce():
+        yield 1
+        raise ValueError("producer failed")
+
+    with pipeline.Stage(produce(), depth) as stage:
+        assert next(stage) == 1
+        with pytest.raises(ValueError):
+            next(stage)
+        assert list(stage) == []
+
+
+def test_stage_stops_producer_on_close():
+    stage = pipeline.Stage(iter(range(10**9)), 2)
+    assert next(stage) == 0
+    stage.close()
+    assert not stage.thread.is_alive()
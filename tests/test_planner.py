@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import planner
+import transfer
+
+
+def entries(sizes):
+    return [
+        transfer.FileEntry("/src/f%s.csv" % i, size, None, None)
+        for i, size in enumerate(sizes)
+    ]
+
+
+def test_partition_caps_files():
+    shards = planner.partition(entries([1] * 10 + [1000]), 3, 10**9)
+    assert max(len(shard) for shard in shards) <= 3
+    assert sum(len(shard) for shard in shards) == 11
+
+
+def test_partition_balances_bytes():
+    shards = planner.partition(entries([100, 100, 50, 50]), 10, 150)
+    assert sorted(sum(entry.size for entry in shard) for shard in shards) == [
+        150,
+        150,
+    ]
+
+
+def test_plan_publishes_shards():
+    publisher = planner.InMemoryPublisher()
+    info = {"source_connection_string": "gs://src/", "plan": True, "shard_files": 2}
+    assert planner.plan(entries([1] * 5), info, publisher) == 3
+
+    files = [
+        entry["path"] for message in publisher.messages for entry in message["files"]
+    ]
+    assert sorted(files) == ["/src/f%s.csv" % i for i in range(5)]
+    for message in publisher.messages:
+        assert "plan" not in message and "shard_files" not in message
+        assert message["source_connection_string"] == "gs://src/"
+
+
+def test_plan_names_bundles_per_shard():
+    publisher = planner.InMemoryPublisher()
+    info = {"plan": True, "shard_files": 2, "bundle": "out/all.tar.gz"}
+    planner.plan(entries([1] * 5), info, publisher)
+    assert [message["bundle"] for message in publisher.messages] == [
+        "out/all-1.tar.gz",
+        "out/all-2.tar.gz",
+        "out/all-3.tar.gz",
+    ]
+
+
+def test_plan_keeps_single_bundle():
+    publisher = planner.InMemoryPublisher()
+    planner.plan(entries([1] * 2), {"bundle": "all.zip"}, publisher)
+    assert [message["bundle"] for message in publisher.messages] == ["all.zip"]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import ftplib
+
+import pytest
+
+import integrity
+import retry
+
+
+class ClientError(Exception):
+    # named after botocore's, which is classified by its response
+    def __init__(self, code, status):
+        self.response = {
+            "Error": {"Code": code},
+            "ResponseMetadata": {"HTTPStatusCode": status},
+        }
+
+
+def wrapped(cause):
+    try:
+        raise RuntimeError("Error writing file") from cause
+    except RuntimeError as error:
+        return error
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        ftplib.error_temp("421 Service not available"),
+        ConnectionResetError(),
+        TimeoutError(),
+        EOFError(),
+        integrity.IntegrityError("size mismatch"),
+        ClientError("SlowDown", 503),
+        ClientError("Unknown", 500),
+        wrapped(ftplib.error_temp("450 busy")),
+    ],
+)
+def test_transient(error):
+    assert retry.is_transient(error)
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        ftplib.error_perm("550 Not found"),
+        FileNotFoundError(),
+        ValueError(),
+        ClientError("AccessDenied", 403),
+        wrapped(ftplib.error_perm("530 Login incorrect")),
+    ],
+)
+def test_permanent(error):
+    assert not retry.is_transient(error)
+
+
+def test_call_retries_transient_errors():
+    errors = [ConnectionResetError(), ConnectionResetError()]
+    retried = []
+
+    def function():
+        if errors:
+            raise errors.pop()
+        return "done"
+
+    policy = retry.RetryPolicy(attempts=3, sleep=lambda delay: None)
+    assert policy.call(function, retried.append) == "done"
+    assert len(retried) == 2
+
+
+def test_call_stops_on_permanent_errors():
+    calls = []
+
+    def function():
+        calls.append(1)
+        raise ftplib.error_perm("550 Not found")
+
+    policy = retry.RetryPolicy(attempts=3, sleep=lambda delay: None)
+    with pytest.raises(ftplib.error_perm):
+        policy.call(function)
+    assert len(calls) == 1
+
+
+def test_call_gives_up():
+    calls = []
+
+    def function():
+        calls.append(1)
+        raise TimeoutError()
+
+    policy = retry.RetryPolicy(attempts=2, sleep=lambda delay: None)
+    with pytest.raises(TimeoutError):
+        policy.call(function)
+    assert len(calls) == 2
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+
+import throttle
+
+
+class Clock(object):
+    # advances only when slept, so the bucket is tested without waiting
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_bucket_allows_burst():
+    clock = Clock()
+    bucket = throttle.TokenBucket(100, 200, clock, clock.sleep)
+    bucket.consume(200)
+    assert clock.now == 0
+
+
+def test_bucket_paces_to_rate():
+    clock = Clock()
+    bucket = throttle.TokenBucket(100, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        bucket.consume(100)
+    # the first second of bytes is the burst
+    assert clock.now == pytest.approx(4)
+
+
+def test_bucket_lends_large_chunks():
+    clock = Clock()
+    bucket = throttle.TokenBucket(100, clock=clock, sleep=clock.sleep)
+    assert bucket.reserve(300) == pytest.approx(2)
+    # the caller behind waits for the credit to be paid back too
+    assert bucket.reserve(100) == pytest.approx(3)
+
+
+def test_bucket_refills_up_to_burst():
+    clock = Clock()
+    bucket = throttle.TokenBucket(100, clock=clock, sleep=clock.sleep)
+    bucket.consume(100)
+    clock.now = 10
+    assert bucket.reserve(100) == 0
+    assert bucket.reserve(100) == pytest.approx(1)
+
+
+def test_throttled_stream():
+    clock = Clock()
+    bucket = throttle.TokenBucket(10, clock=clock, sleep=clock.sleep)
+    stream = throttle.throttle_stream(io.BytesIO(b"x" * 30), bucket)
+    assert stream.read() == b"x" * 30
+    assert clock.now == pytest.approx(2)
+
+
+def test_session_limit():
+    limits = throttle.HostLimits()
+    release = limits.acquire_session("host", 1)
+    with pytest.raises(TimeoutError):
+        limits.acquire_session("host", 1, timeout=0)
+    release()
+    limits.acquire_session("host", 1, timeout=0)()
+    assert limits.acquire_session("host", None) is None
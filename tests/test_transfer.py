@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import io
+from urllib import parse
+
+import pytest
+
+import transfer
+
+TREE = {
+    "/tree": (["/tree/a.csv", "/tree/b.txt"], ["/tree/sub"]),
+    "/tree/sub": (["/tree/sub/c.csv"], []),
+}
+
+
+def list_folder(folder_path):
+    files, folders = TREE.get(folder_path, ([], []))
+    return [transfer.FileEntry(path, 1, None, None) for path in files], folders
+
+
+def walk(path):
+    return sorted(
+        entry.name for entry in transfer.walk_files(path, list_folder, concurrency=0)
+    )
+
+
+def test_walk_files_pattern():
+    assert walk("/tree/**/*.csv") == ["a.csv", "sub/c.csv"]
+
+
+def test_walk_files_trailing_globstar():
+    assert walk("/tree/**") == ["a.csv", "b.txt", "sub/c.csv"]
+
+
+class FakeBlobWriter(object):
+    # mimics google.cloud.storage.fileio.BlobWriter, committing on close
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        self._upload_and_transport = None
+        self.committed = None
+
+    @property
+    def closed(self):
+        return self._buffer.closed
+
+    def write(self, b):
+        return self._buffer.write(b)
+
+    def close(self):
+        if not self._buffer.closed:
+            self.committed = self._buffer.getvalue()
+        self._buffer.close()
+
+
+def test_gcs_writer_commits():
+    writer = FakeBlobWriter()
+    with transfer.GcsUploadWriter(writer) as upload:
+        upload.write(b"data")
+    assert writer.committed == b"data"
+
+
+def test_gcs_writer_cancels_on_error():
+    writer = FakeBlobWriter()
+    with pytest.raises(IOError):
+        with transfer.GcsUploadWriter(writer) as upload:
+            upload.write(b"data")
+            raise IOError("source failed")
+    writer.close()
+    assert writer.committed is None
+
+
+KEY = ("ftp", "host", "user", "hash")
+OTHER_KEY = ("ftp", "other", "user", "hash")
+
+
+def test_pool_reuses_released_sessions():
+    pool = transfer.ConnectionPool(max_size=2)
+    closed = []
+    assert pool.acquire(KEY, lambda session: True) is None
+    pool.release(KEY, "first", closed.append)
+    pool.release(KEY, "second", closed.append)
+    pool.release(OTHER_KEY, "other", closed.append)
+    # full, so the oldest session is closed
+    assert closed == ["first"]
+    assert pool.acquire(KEY, lambda session: True) == "second"
+    assert pool.acquire(KEY, lambda session: True) is None
+
+
+def test_pool_discards_stale_sessions():
+    pool = transfer.ConnectionPool()
+    closed = []
+    pool.release(KEY, "stale", closed.append)
+    assert pool.acquire(KEY, lambda session: False) is None
+    assert closed == ["stale"]
+
+
+def test_pool_expires_idle_sessions():
+    pool = transfer.ConnectionPool(idle_ttl=-1)
+    closed = []
+    pool.release(KEY, "idle", closed.append)
+    assert closed == ["idle"]
+    assert pool.acquire(KEY, lambda session: True) is None
+
+
+class FakeFtp(object):
+    def __init__(self):
+        self.home = self.folder = "/home/user"
+
+    def cwd(self, folder_path):
+        self.folder = folder_path
+
+
+def test_release_session_returns_home(monkeypatch):
+    pool = transfer.ConnectionPool()
+    monkeypatch.setattr(transfer, "CONNECTION_POOL", pool)
+    conn_str = parse.urlparse("ftp://host/out/?username=user&password=secret")
+    ftp = FakeFtp()
+    ftp.cwd("/home/user/out")
+    transfer.release_session(conn_str, ftp, transfer.ftp_reset, transfer.ftp_close)
+    reused = pool.acquire(transfer.pool_key(conn_str), lambda session: True)
+    assert reused is ftp and ftp.folder == "/home/user"
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+import collections
+import logging
+import threading
+import time
+from urllib import parse
+
+# schemes of the connections the limits apply to
+LIMITED_SCHEMES = ("ftp", "ftps", "sftp")
+# seconds a connection waits for a free session of its host before giving up
+SESSION_TIMEOUT = 300
+
+
+class TokenBucket(object):
+    """
+    Limits the bytes per second going through it, allowing bursts of up to
+    `burst` bytes. Chunks larger than the tokens available are let through on
+    credit, and the callers behind them wait until it is paid back
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.updated = clock()
+
+    def consume(self, size):
+        wait = self.reserve(size)
+        if wait > 0:
+            self.sleep(wait)
+
+    def reserve(self, size):
+        # takes the tokens, returning the seconds to wait before using them
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= size
+            return -self.tokens / self.rate
+
+
+class ThrottledStream(object):
+    """Proxy of a readable or writable stream paced by a TokenBucket"""
+
+    def __init__(self, stream, bucket):
+        self.stream = stream
+        self.bucket = bucket
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bucket.consume(len(data))
+        return data
+
+    def write(self, b):
+        self.bucket.consume(len(b))
+        return self.stream.write(b)
+
+    def __enter__(self):
+        self.stream.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.stream.__exit__(exc_type, exc_value, traceback)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def throttle_stream(stream, bucket):
+    return stream if bucket is None else ThrottledStream(stream, bucket)
+
+
+def throttle_callback(bucket, callback):
+    # paces a callback receiving each chunk, as the ones of retrbinary
+    if bucket is None:
+        return callback
+
+    def throttled(data):
+        bucket.consume(len(data))
+        return callback(data)
+
+    return throttled
+
+
+def throttle_progress(bucket):
+    # paramiko progress callback, called with the bytes transferred so far
+    if bucket is None:
+        return None
+    done = [0]
+
+    def progress(transferred, total):
+        bucket.consume(transferred - done[0])
+        done[0] = transferred
+
+    return progress
+
+
+class HostLimits(object):
+    """
+    Bandwidth and session limits of each host, shared by all the threads of the
+    instance, so concurrent workers and warm invocations respect them together
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.sessions = {}
+
+    def bucket(self, host, rate):
+        """Returns the TokenBucket of the host, or None when it has no limit"""
+        if not rate:
+            return None
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None or bucket.rate != rate:
+                bucket = self.buckets[host] = TokenBucket(rate)
+            return bucket
+
+    def acquire_session(self, host, max_sessions, timeout=SESSION_TIMEOUT):
+        """
+        Waits for a free session of the host, returning the function releasing
+        it, or None when the host has no limit
+        """
+        if not max_sessions:
+            return None
+        with self.lock:
+            limit, semaphore = self.sessions.get(host, (None, None))
+            if limit != max_sessions:
+                # sessions taken under the previous limit are released to it
+                semaphore = threading.BoundedSemaphore(max_sessions)
+                self.sessions[host] = (max_sessions, semaphore)
+
+        if not semaphore.acquire(timeout=timeout):
+            raise TimeoutError(
+                "No free session to %s after %s seconds, limited to %s"
+                % (host, timeout, max_sessions)
+            )
+        return semaphore.release
+
+
+# module-level so the limits hold across the threads and warm invocations
+HOST_LIMITS = HostLimits()
+
+
+def host_options(conn_str, options):
+    """
+    Bandwidth limit, in bytes per second, and maximum sessions of the host of a
+    connection. The query of the connection string takes precedence over the
+    attributes of the message
+    """
+    if conn_str.scheme not in LIMITED_SCHEMES:
+        return None, None
+    query = dict(parse.parse_qs(conn_str.query))
+    values = []
+    for name in ("bandwidth_limit", "max_sessions"):
+        value = query[name][0] if name in query else options.get(name)
+        values.append(int(value) if value else None)
+    return tuple(values)
+
+
+def session_workers(max_workers, pair, reserved, options):
+    """
+    Number of workers the session limits allow, when each worker opens the
+    connections of the pair and the invocation keeps the pair and the
+    `reserved` connections (manifests) open besides them. Raises ValueError
+    when not even a sequential transfer fits in the limits
+    """
+    needed = collections.Counter()
+    limits = {}
+    for conn_str in pair:
+        needed[conn_str.hostname] += 1
+    for conn_str in pair + reserved:
+        _, max_sessions = host_options(conn_str, options)
+        if max_sessions:
+            limits[conn_str.hostname] = min(
+                max_sessions, limits.get(conn_str.hostname, max_sessions)
+            )
+
+    workers = max_workers
+    for host, max_sessions in limits.items():
+        fixed = needed[host] + sum(conn.hostname == host for conn in reserved)
+        if fixed > max_sessions:
+            raise ValueError(
+                "max_sessions of %s is %s, but a transfer needs %s sessions to it"
+                % (host, max_sessions, fixed)
+            )
+        if needed[host]:
+            workers = min(workers, (max_sessions - fixed) // needed[host])
+
+    if workers < max_workers:
+        logging.info("Limiting workers to %s by the sessions of the hosts" % workers)
+    return workers
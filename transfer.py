@@ -1,26 +1,185 @@
 # -*- coding: utf-8 -*-
 # dededed
-from google.cloud import storage
+# google-cloud-storage, boto3 and pysftp are imported where they are first
+# used, so cold starts only pay for the providers a message asks for
+from concurrent import futures
 from urllib import parse
-import boto3
-import uuid
 import ftplib
-import pysftp
 import abc
+import base64
+import collections
 import fnmatch
+import hashlib
+import io
+import json
 import os
 import logging
+import posixpath
+import re
+import shutil
 import ssl
+import stat
+import threading
+import time
+
+import integrity
+import registry
+import throttle
 
 # Parameters
 # project name
 PROJECT = os.environ["PROJECT"]
+# size of the chunks moved between source and destination streams
+CHUNK_SIZE = 1024 * 1024
+# size of the chunks sent on each request of a streaming upload to GCS/S3
+# (GCS requires a multiple of 256 KB and S3 a minimum of 5 MB per part)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# files from this size on are uploaded to GCS/S3 in parallel parts
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+# size of each part of a parallel upload (S3 requires at least 5 MB)
+PART_SIZE = 16 * 1024 * 1024
+MIN_PART_SIZE = 5 * 1024 * 1024
+# number of parts uploaded at the same time
+UPLOAD_CONCURRENCY = 4
+# maximum number of objects GCS accepts in a single compose request
+GCS_MAX_COMPOSE = 32
+# files from this size on are downloaded from GCS/S3/SFTP in parallel slices
+DOWNLOAD_THRESHOLD = 64 * 1024 * 1024
+# size of each slice of a parallel download
+SLICE_SIZE = 16 * 1024 * 1024
+# number of slices downloaded at the same time
+DOWNLOAD_CONCURRENCY = 4
+# number of folders listed at the same time when walking a tree recursively
+WALK_CONCURRENCY = 4
+# maximum number of idle FTP/FTPS/SFTP sessions kept between invocations
+POOL_MAX_SIZE = int(os.environ.get("POOL_MAX_SIZE", 8))
+# seconds an idle session is kept before being closed
+POOL_IDLE_TTL = int(os.environ.get("POOL_IDLE_TTL", 300))
+# seconds a GCS/S3 client and its credentials are kept before being rebuilt
+CLIENT_CACHE_TTL = int(os.environ.get("CLIENT_CACHE_TTL", 1800))
+# FTP commands sent before reading their replies when removing/moving files
+COMMAND_WINDOW = 16
+# maximum number of calls GCS accepts in a single batch request
+GCS_BATCH_SIZE = 100
+# maximum number of keys S3 accepts in a single delete_objects request
+S3_DELETE_BATCH = 1000
+# suffix of the FTP/FTPS/SFTP uploads in progress, renamed once complete, so a
+# later attempt can resume them
+PARTIAL_SUFFIX = ".part"
+# suffix of the segmented uploads in progress, which can't be resumed
+SEGMENTS_SUFFIX = ".segments"
+# bytes at the end of a partial upload compared with the local file before
+# resuming it
+RESUME_CHECK = 64 * 1024
+
+
+class FileEntry(
+    collections.namedtuple(
+        "FileEntry", ["path", "size", "mtime", "checksum", "name"], defaults=[None]
+    )
+):
+    """
+    Listed file with its metadata, which is None where the backend lacks it. The
+    name is the path relative to the listed folder, kept at the destination
+    """
+
+    __slots__ = ()
+
+    def metadata(self):
+        return {"size": self.size, "mtime": self.mtime, "checksum": self.checksum}
+
+    def relative_name(self):
+        return self.name or self.path.split("/")[-1]
+
+
+def split_pattern(path):
+    # splits the connection string path into its folder and the file pattern
+    return path[: path.rfind("/")], path[path.rfind("/") + 1 :]
+
+
+def match_entries(entries, path):
+    # filtering the last part of the path, like the README describes
+    pattern = "*" + path[path.rfind("/") :]
+    for entry in entries:
+        if fnmatch.fnmatch(entry.path, pattern):
+            yield entry
+
+
+def is_recursive(path, options):
+    return options.get("recursive", False) or "/**" in path
+
+
+def walk_files(path, list_folder, concurrency=WALK_CONCURRENCY):
+    """
+    Walks the tree under the folder of the path breadth-first, listing all the
+    folders of a level concurrently with list_folder(folder), which must return
+    the FileEntry of its files and the paths of its subfolders. Yields the
+    entries whose file name matches the last part of the path, named after
+    their path relative to the walked folder
+    """
+    if path.endswith("/**"):
+        # a bare trailing ** takes every file under the folder before it
+        root, pattern = path[:-3].replace("/**", ""), "*"
+    else:
+        root, pattern = split_pattern(path.replace("/**", ""))
+    level = [root]
+    with futures.ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        # a concurrency of 0 lists the folders one by one in the calling thread
+        list_level = executor.map if concurrency > 0 else map
+        while level:
+            next_level = []
+            for entries, folders in list_level(list_folder, level):
+                for entry in entries:
+                    if fnmatch.fnmatch(entry.path.split("/")[-1], pattern):
+                        yield entry._replace(name=entry.path[len(root) + 1 :])
+                next_level.extend(folders)
+            level = next_level
+
+
+def call_each(function, calls):
+    # calls the function with each tuple of arguments, collecting the errors by
+    # the first argument
+    errors = {}
+    for args in calls:
+        try:
+            function(*args)
+        except Exception as error:
+            errors[args[0]] = error
+    return errors
+
+
+def copy_and_remove(copy, remove_files, renames, concurrency=UPLOAD_CONCURRENCY):
+    """
+    Moves files on object stores, which can't rename them: each one is copied
+    server side with copy(file_path, new_path), concurrently, and the ones
+    copied are then removed in bulk. Returns the errors by file path
+    """
+    errors = {}
+    with futures.ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        tasks = {executor.submit(copy, *rename): rename[0] for rename in renames}
+        for task in futures.as_completed(tasks):
+            if task.exception() is not None:
+                errors[tasks[task]] = task.exception()
+
+    copied = [file_path for file_path, _ in renames if file_path not in errors]
+    errors.update(remove_files(copied))
+    return errors
+
+
+def literal_prefix(pattern):
+    # part of the pattern before any wildcard, usable as a server side prefix
+    return re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+
 
 # Abstract base class for the file transfers
 class FileTransfer(object, metaclass=abc.ABCMeta):
-    def __init__(self, connection_string: str, service_account: str = None):
+    def __init__(
+        self, connection_string: str, service_account: str = None, options: dict = None
+    ):
         self.connection_string = connection_string
         self.service_account = service_account
+        # transfer message attributes tuning the backend, like part_size
+        self.options = options or {}
         super().__init__()
 
     @abc.abstractmethod
@@ -32,11 +191,19 @@ class FileTransfer(object, metaclass=abc.ABCMeta):
         raise NotImplementedError("Abstract method")
 
     @abc.abstractmethod
-    def upload_file(self, file_path: str):
+    def upload_file(self, file_path: str, remote_name: str = None):
+        # remote_name, relative to the destination folder, defaults to file_path
         raise NotImplementedError("Abstract method")
 
     @abc.abstractmethod
-    def list_files(self, file_path: str):
+    def list_files(self):
+        # yields a FileEntry for each file matching the connection string path
+        raise NotImplementedError("Abstract method")
+
+    @abc.abstractmethod
+    def list_folder(self, folder_path: str):
+        # returns the FileEntry of the files in the folder and its subfolders,
+        # being safe to call from several threads at the same time
         raise NotImplementedError("Abstract method")
 
     @abc.abstractmethod
@@ -47,33 +214,982 @@ class FileTransfer(object, metaclass=abc.ABCMeta):
     def disconnect(self):
         raise NotImplementedError("Abstract method")
 
+    @abc.abstractmethod
+    def open_read(self, file_path: str):
+        raise NotImplementedError("Abstract method")
+
+    @abc.abstractmethod
+    def open_write(self, file_name: str):
+        raise NotImplementedError("Abstract method")
+
+    @abc.abstractmethod
+    def file_metadata(self, file_path: str):
+        # returns the FileEntry of a single file
+        raise NotImplementedError("Abstract method")
+
+    def can_copy_to(self, destination):
+        # whether files can be copied to the destination without passing
+        # through the function
+        return False
+
+    def copy_to(self, file_path: str, destination, file_name: str):
+        raise NotImplementedError("Server side copy not supported")
+
+    def verify_file(self, file_name: str, digest):
+        # checks the file written by open_write or upload_file, relative to the
+        # destination folder, against the StreamDigest of the bytes sent, raising
+        # IntegrityError on a mismatch. By default only the size is compared
+        entry = self.file_metadata(posixpath.join(self.conn_str.path, file_name))
+        integrity.check_size(entry.path, entry.size, digest.size)
+
+    def remove_files(self, file_paths):
+        # removes several files in as few round trips as the provider allows,
+        # returning the error of each file that could not be removed
+        return call_each(self.remove_file, [(path,) for path in file_paths])
+
+    def rename_file(self, file_path: str, new_path: str):
+        raise NotImplementedError("Renaming files not supported")
+
+    def rename_files(self, renames):
+        # moves each (file path, new path) within the connection, returning the
+        # error of each file that could not be moved
+        return call_each(self.rename_file, renames)
+
+
+class FtpDataStream(io.RawIOBase):
+    """File-like wrapper around an FTP data connection opened with transfercmd."""
+
+    def __init__(self, ftp, conn, mode):
+        super().__init__()
+        self.ftp = ftp
+        self.conn = conn
+        self.mode = mode
+
+    def readable(self):
+        return self.mode == "rb"
+
+    def writable(self):
+        return self.mode == "wb"
+
+    def readinto(self, b):
+        return self.conn.recv_into(b)
+
+    def write(self, b):
+        self.conn.sendall(b)
+        return len(b)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close()
+            # same shutdown ftplib does at the end of retrbinary/storbinary
+            if isinstance(self.conn, ssl.SSLSocket):
+                self.conn.unwrap()
+            self.conn.close()
+            self.ftp.voidresp()
+        except Exception:
+            # the control connection may be out of sync now, so it can't be reused
+            self.ftp.close()
+            raise
+        finally:
+            self.conn.close()
+
+
+class PartialWriter(object):
+    """
+    Proxy of a writer to a partial file, renamed to its final name once closed
+    cleanly and removed if the write failed, so a stream cut halfway never
+    leaves a truncated file under the final name
+    """
+
+    def __init__(self, stream, commit, discard):
+        self.stream = stream
+        self.commit = commit
+        self.discard = discard
+        self.finished = False
+
+    def write(self, b):
+        return self.stream.write(b)
+
+    def close(self):
+        if self.finished:
+            return
+        self.finished = True
+        try:
+            self.stream.close()
+        except Exception:
+            self._discard()
+            raise
+        self.commit()
+
+    def abort(self):
+        if self.finished:
+            return
+        self.finished = True
+        try:
+            self.stream.close()
+        except Exception:
+            logging.exception("Error closing the partial file")
+        self._discard()
+
+    def _discard(self):
+        try:
+            self.discard()
+        except Exception:
+            logging.exception("Error removing the partial file")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def ftp_open_read(ftp, file_path):
+    ftp.voidcmd("TYPE I")
+    conn = ftp.transfercmd("RETR " + file_path)
+    return io.BufferedReader(FtpDataStream(ftp, conn, "rb"), CHUNK_SIZE)
+
+
+def ftp_file_metadata(ftp, file_path):
+    # SIZE is only reliable in binary mode
+    ftp.voidcmd("TYPE I")
+    size = ftp.size(file_path)
+    try:
+        # the response is "213 YYYYMMDDHHMMSS"
+        mtime = ftp.sendcmd("MDTM " + file_path)[4:].strip()
+    except ftplib.error_perm:
+        mtime = None
+    return FileEntry(file_path, size, mtime, None)
+
+
+def ftp_list_folder(ftp, folder_path):
+    entries, folders = [], []
+    try:
+        for name, facts in ftp.mlsd(folder_path, facts=["type", "size", "modify"]):
+            path = "{}/{}".format(folder_path, name)
+            if facts.get("type") == "dir":
+                folders.append(path)
+            elif facts.get("type", "file") == "file":
+                size = int(facts["size"]) if "size" in facts else None
+                entries.append(FileEntry(path, size, facts.get("modify"), None))
+    except ftplib.error_perm:
+        # without MLSD, files can't be told apart from folders
+        logging.warning("MLSD not supported, not walking subfolders of " + folder_path)
+        entries = [FileEntry(name, None, None, None) for name in ftp.nlst(folder_path)]
+
+    return entries, folders
+
+
+def ftp_makedirs(ftp, folder_path):
+    # moves to the folder, creating it and its parents when missing
+    try:
+        ftp.cwd(folder_path)
+    except ftplib.error_perm:
+        parent = posixpath.dirname(folder_path.rstrip("/"))
+        if parent and parent != folder_path:
+            ftp_makedirs(ftp, parent)
+        ftp.mkd(folder_path)
+        ftp.cwd(folder_path)
+
+
+def ftp_list_files(ftp, path):
+    folder_path, _ = split_pattern(path)
+    try:
+        # MLSD returns the metadata of all files in a single listing
+        entries = [
+            FileEntry(
+                "{}/{}".format(folder_path, name),
+                int(facts["size"]) if "size" in facts else None,
+                facts.get("modify"),
+                None,
+            )
+            for name, facts in ftp.mlsd(folder_path, facts=["type", "size", "modify"])
+            if facts.get("type", "file") == "file"
+        ]
+    except ftplib.error_perm:
+        # falling back to plain names on servers without MLSD
+        entries = [FileEntry(name, None, None, None) for name in ftp.nlst(folder_path)]
+
+    return match_entries(entries, path)
+
+
+def ftp_pipeline(ftp, commands, window=COMMAND_WINDOW):
+    """
+    Sends the commands `window` at a time without waiting for each reply, then
+    reads their replies in order, as RFC 959 allows, saving a round trip per
+    command. Returns the reply, or the ftplib error, of each command
+    """
+    window = max(window, 1)
+    replies = []
+    for i in range(0, len(commands), window):
+        batch = commands[i : i + window]
+        for command in batch:
+            ftp.putcmd(command)
+        for command in batch:
+            try:
+                replies.append(ftp.getresp())
+            except ftplib.Error as error:
+                replies.append(error)
+    return replies
+
+
+def ftp_reply_error(reply, expected):
+    # error of a reply that failed or doesn't start with the expected digit
+    if isinstance(reply, Exception):
+        return reply
+    if not reply.startswith(expected):
+        return ftplib.error_reply(reply)
+    return None
+
+
+def ftp_remove_files(ftp, file_paths, window=COMMAND_WINDOW):
+    errors = {}
+    replies = ftp_pipeline(ftp, ["DELE " + path for path in file_paths], window)
+    for file_path, reply in zip(file_paths, replies):
+        error = ftp_reply_error(reply, "2")
+        if error is not None:
+            errors[file_path] = error
+    return errors
+
+
+def ftp_rename_files(ftp, renames, window=COMMAND_WINDOW):
+    for folder_path in sorted({posixpath.dirname(new_path) for _, new_path in renames}):
+        ftp_makedirs(ftp, folder_path)
+
+    commands = []
+    for file_path, new_path in renames:
+        commands += ["RNFR " + file_path, "RNTO " + new_path]
+    replies = ftp_pipeline(ftp, commands, window)
+
+    errors = {}
+    for i, (file_path, _) in enumerate(renames):
+        # a failed RNFR makes the server reject its RNTO as well
+        error = ftp_reply_error(replies[2 * i], "3") or ftp_reply_error(
+            replies[2 * i + 1], "2"
+        )
+        if error is not None:
+            errors[file_path] = error
+    return errors
+
+
+def ftp_open_write(ftp, folder_path, file_name, block_size=CHUNK_SIZE):
+    # moving to the desired path, which may be a subfolder in recursive transfers
+    ftp_makedirs(ftp, posixpath.join(folder_path, posixpath.dirname(file_name)))
+    ftp.voidcmd("TYPE I")
+    name = posixpath.basename(file_name)
+    partial_name = name + PARTIAL_SUFFIX
+    conn = ftp.transfercmd("STOR " + partial_name)
+    return PartialWriter(
+        io.BufferedWriter(FtpDataStream(ftp, conn, "wb"), block_size),
+        lambda: ftp_replace(ftp, partial_name, name),
+        lambda: ftp.delete(partial_name),
+    )
+
+
+def ftp_upload_file(ftp, local_path, remote_path, options, bucket=None, segment=None):
+    """
+    Uploads a local file in blocks of block_size. Unless resume is False, it is
+    written to a partial file renamed once complete, and the partial file left
+    by a failed attempt is appended to instead of sent again. With segment, a
+    function returning a new (connection, session) pair, files from
+    upload_threshold on are sent in upload_segments ranges at the same time
+    """
+    block_size = options.get("block_size", CHUNK_SIZE)
+    folder_path, name = posixpath.split(remote_path)
+    # moving to the desired path
+    ftp_makedirs(ftp, folder_path)
+    ftp.voidcmd("TYPE I")
+    if not options.get("resume", True):
+        with open(local_path, "rb") as f:
+            ftp.storbinary(
+                "STOR " + name, throttle.throttle_stream(f, bucket), block_size
+            )
+        return
+
+    size = os.path.getsize(local_path)
+    if is_segmented(size, options) and segment is not None:
+        partial_name = name + SEGMENTS_SUFFIX + PARTIAL_SUFFIX
+        try:
+            # REST + STOR writes over the file without truncating it
+            ftp.delete(partial_name)
+        except ftplib.error_perm:
+            pass
+
+        def upload_segment(part):
+            _, offset, length = part
+            conn, session = segment()
+            try:
+                ftp_makedirs(session, folder_path)
+                session.voidcmd("TYPE I")
+                with FileRange(local_path, offset, length) as f:
+                    session.storbinary(
+                        "STOR " + partial_name,
+                        throttle.throttle_stream(f, bucket),
+                        block_size,
+                        rest=offset,
+                    )
+            finally:
+                conn.disconnect()
+
+        upload_segments(upload_segment, size, options)
+    else:
+        partial_name = name + PARTIAL_SUFFIX
+        offset = resume_offset(
+            local_path,
+            size,
+            ftp_partial_size(ftp, partial_name),
+            lambda offset: ftp_read_from(ftp, partial_name, offset),
+        )
+        if offset < size or not size:
+            with FileRange(local_path, offset, size - offset) as f:
+                # APPE adds to the partial file, where STOR would start it over
+                ftp.storbinary(
+                    ("APPE " if offset else "STOR ") + partial_name,
+                    throttle.throttle_stream(f, bucket),
+                    block_size,
+                )
+    ftp_replace(ftp, partial_name, name)
+
+
+def ftp_partial_size(ftp, name):
+    try:
+        return ftp.size(name)
+    except ftplib.error_perm:
+        # no partial upload to resume
+        return None
+
+
+def ftp_read_from(ftp, file_path, offset):
+    data = io.BytesIO()
+    ftp.retrbinary("RETR " + file_path, data.write, rest=offset)
+    return data.getvalue()
+
+
+def ftp_replace(ftp, partial_name, name):
+    try:
+        ftp.rename(partial_name, name)
+    except ftplib.error_perm as error:
+        # some servers don't rename over an existing file
+        try:
+            ftp.delete(name)
+        except ftplib.error_perm:
+            raise error
+        ftp.rename(partial_name, name)
+
+
+class S3ReadStream(io.RawIOBase):
+    """File-like wrapper around the StreamingBody returned by get_object."""
+
+    def __init__(self, body):
+        super().__init__()
+        self.body = body
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.body.read(len(b))
+        b[: len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.body.close()
+        super().close()
+
+
+def content_md5(data):
+    # value of the Content-MD5 header, checked by S3 on arrival
+    return base64.b64encode(hashlib.md5(data).digest()).decode("utf-8")
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """
+    Writable stream that uploads to S3 in parts of part_size, with up to
+    concurrency parts being sent at the same time, so at most that many parts
+    are held in memory
+    """
+
+    def __init__(self, s3, bucket, key, part_size=UPLOAD_CHUNK_SIZE, concurrency=1):
+        super().__init__()
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.concurrency = max(concurrency, 1)
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.executor = None
+        self.parts = []
+        # parts still being uploaded, in order
+        self.pending = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.buffer.extend(b)
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+        return len(b)
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = self.s3.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key
+            )["UploadId"]
+            self.executor = futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        # waiting for a slot so memory stays bounded by the number of workers
+        while len(self.pending) >= self.concurrency:
+            self.parts.append(self.pending.pop(0).result())
+        part_number = len(self.parts) + len(self.pending) + 1
+        body, self.buffer = bytes(self.buffer), bytearray()
+        self.pending.append(self.executor.submit(self._send_part, part_number, body))
+
+    def _send_part(self, part_number, body):
+        res = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body,
+            # S3 rejects the part if it arrives corrupted
+            ContentMD5=content_md5(body),
+        )
+        return {"ETag": res["ETag"], "PartNumber": part_number}
+
+    def _shutdown(self):
+        if self.executor is not None:
+            for task in self.pending:
+                task.cancel()
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.pending = []
+
+    def abort(self):
+        self._shutdown()
+        if self.upload_id is not None:
+            self.s3.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+            self.upload_id = None
+        self.buffer = bytearray()
+        super().close()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            # small files don't need a multipart upload
+            if self.upload_id is None:
+                self.s3.put_object(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    Body=bytes(self.buffer),
+                    ContentMD5=content_md5(self.buffer),
+                )
+            else:
+                if self.buffer:
+                    self._upload_part()
+                while self.pending:
+                    self.parts.append(self.pending.pop(0).result())
+                self.s3.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    MultipartUpload={"Parts": self.parts},
+                )
+                self._shutdown()
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # never commit a partial object if the copy failed halfway
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class GcsUploadWriter(object):
+    """
+    Proxy of the BlobWriter of a GCS upload, which commits the object on close.
+    When the write fails, the resumable upload is cancelled instead, so no
+    truncated object is left under the final name
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, b):
+        return self.writer.write(b)
+
+    def close(self):
+        self.writer.close()
+
+    def abort(self):
+        if self.writer.closed:
+            return
+        # BlobWriter only uploads the rest of its buffer while it is open, so
+        # closing the buffer keeps close, and the garbage collector, from
+        # committing the object
+        self.writer._buffer.close()
+        upload = self.writer._upload_and_transport
+        if upload is not None:
+            # the session would otherwise linger until it expires
+            try:
+                upload[1].delete(upload[0].resumable_url)
+            except Exception:
+                logging.exception("Error cancelling the upload")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+
+class RangedReader(io.RawIOBase):
+    """
+    Readable stream that fetches the slices of a file concurrently, keeping up to
+    concurrency slices in flight, and returns them in order
+    """
+
+    def __init__(self, fetch, size, slice_size=SLICE_SIZE, concurrency=1):
+        super().__init__()
+        # fetch(offset, length) must return the bytes of that range
+        self.fetch = fetch
+        self.slices = iter(part_ranges(size, slice_size))
+        self.concurrency = max(concurrency, 1)
+        self.executor = futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        self.pending = []
+        self.current = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def _schedule(self):
+        while len(self.pending) < self.concurrency:
+            part = next(self.slices, None)
+            if part is None:
+                return
+            self.pending.append(self.executor.submit(self.fetch, part[1], part[2]))
+
+    def readinto(self, b):
+        if not self.current:
+            self._schedule()
+            if not self.pending:
+                return 0
+            self.current = memoryview(self.pending.pop(0).result())
+            self._schedule()
+        size = min(len(b), len(self.current))
+        b[:size] = self.current[:size]
+        self.current = self.current[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            for task in self.pending:
+                task.cancel()
+            self.executor.shutdown(wait=True)
+            self.pending = []
+        super().close()
+
+
+def download_ranges(local_path, size, fetch, slice_size=SLICE_SIZE, concurrency=1):
+    """
+    Downloads the slices of a file concurrently, writing each one at its offset
+    of a sparse local file
+    """
+    with open(local_path, "wb") as f:
+        f.truncate(size)
+
+    fd = os.open(local_path, os.O_WRONLY)
+    try:
+
+        def download_slice(part):
+            _, offset, length = part
+            os.pwrite(fd, fetch(offset, length), offset)
+
+        with futures.ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            list(executor.map(download_slice, part_ranges(size, slice_size)))
+    finally:
+        os.close(fd)
+
+
+class ConnectionPool(object):
+    """
+    Keeps authenticated sessions alive across warm invocations, so bursts of
+    messages against the same host don't pay the handshake and login every time
+    """
+
+    def __init__(self, max_size=POOL_MAX_SIZE, idle_ttl=POOL_IDLE_TTL):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.lock = threading.Lock()
+        # list of (key, session, close function, released at), oldest first
+        self.idle = []
+
+    def acquire(self, key, is_alive):
+        """Returns an idle session for the key that passes is_alive, or None"""
+        while True:
+            self._evict_expired()
+            with self.lock:
+                # reusing the most recently released session first
+                for i in range(len(self.idle) - 1, -1, -1):
+                    if self.idle[i][0] == key:
+                        _, session, close, _ = self.idle.pop(i)
+                        break
+                else:
+                    return None
+
+            if self._check(session, is_alive):
+                return session
+
+            logging.info("Discarding stale session to %s" % key[1])
+            self._close(session, close)
+
+    def release(self, key, session, close):
+        """Returns the session to the pool, closing the oldest one if it is full"""
+        evicted = []
+        with self.lock:
+            self.idle.append((key, session, close, time.monotonic()))
+            while len(self.idle) > self.max_size:
+                evicted.append(self.idle.pop(0))
+
+        for _, session, close, _ in evicted:
+            self._close(session, close)
+        self._evict_expired()
+
+    def clear(self):
+        with self.lock:
+            evicted, self.idle = self.idle, []
+
+        for _, session, close, _ in evicted:
+            self._close(session, close)
+
+    def _evict_expired(self):
+        limit = time.monotonic() - self.idle_ttl
+        with self.lock:
+            evicted = [item for item in self.idle if item[3] < limit]
+            self.idle = [item for item in self.idle if item[3] >= limit]
+
+        for _, session, close, _ in evicted:
+            self._close(session, close)
+
+    def _check(self, session, is_alive):
+        try:
+            return is_alive(session)
+        except Exception:
+            return False
+
+    def _close(self, session, close):
+        try:
+            close(session)
+        except Exception:
+            logging.exception("Error while closing pooled session")
+
+
+# module-level so sessions survive between warm invocations of the function
+CONNECTION_POOL = ConnectionPool()
+
+
+def part_ranges(size, part_size):
+    # (part number, offset, length) of each part of a file, numbered from 1
+    return [
+        (number + 1, offset, min(part_size, size - offset))
+        for number, offset in enumerate(range(0, size, part_size))
+    ]
+
+
+def read_part(file_path, offset, length):
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+class FileRange(io.RawIOBase):
+    """Reads `length` bytes of a local file from `offset` on"""
+
+    def __init__(self, file_path, offset, length):
+        super().__init__()
+        self.file = open(file_path, "rb")
+        self.file.seek(offset)
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.file.read(min(len(b), self.remaining))
+        b[: len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def resume_offset(local_path, size, partial_size, read_from):
+    """
+    Bytes of the partial upload left by a previous attempt that can be kept, as
+    long as its last bytes, read with read_from(offset), match the local file.
+    Otherwise it may belong to another version of the file and starts over
+    """
+    if not partial_size or partial_size > size:
+        return 0
+    offset = partial_size - min(partial_size, RESUME_CHECK)
+    if read_from(offset) != read_part(local_path, offset, partial_size - offset):
+        logging.warning("Partial upload of %s doesn't match, restarting" % local_path)
+        return 0
+    logging.info(
+        "Resuming upload of %s from byte %s of %s" % (local_path, partial_size, size)
+    )
+    return partial_size
+
+
+def is_segmented(size, options):
+    # uploads to FTP/FTPS/SFTP are only split for servers known to allow it
+    return options.get("upload_segments", 1) > 1 and size >= options.get(
+        "upload_threshold", MULTIPART_THRESHOLD
+    )
+
+
+def upload_segments(upload_segment, size, options):
+    # calls upload_segment with each (number, offset, length) at the same time
+    segments = options["upload_segments"]
+    parts = part_ranges(size, -(-size // segments))
+    with futures.ThreadPoolExecutor(max_workers=segments) as executor:
+        list(executor.map(upload_segment, parts))
+
+
+def pool_key(conn_str):
+    # parsing the query parameters to a dictionary for the login components
+    auth_info = dict(parse.parse_qs(conn_str.query))
+    # sessions are only shared by the same password, key file and options,
+    # hashed so the credentials aren't kept in the key
+    query = json.dumps(sorted(parse.parse_qsl(conn_str.query)))
+    return (
+        conn_str.scheme,
+        conn_str.netloc,
+        auth_info["username"][0],
+        hashlib.sha256(query.encode("utf-8")).hexdigest(),
+    )
+
+
+def acquire_host_session(transfer):
+    # waits for a free session of the host, under its max_sessions, and takes
+    # the bucket its bandwidth is shared through
+    host = transfer.conn_str.hostname
+    bandwidth_limit, max_sessions = throttle.host_options(
+        transfer.conn_str, transfer.options
+    )
+    transfer.release_session = throttle.HOST_LIMITS.acquire_session(
+        host,
+        max_sessions,
+        transfer.options.get("session_timeout", throttle.SESSION_TIMEOUT),
+    )
+    transfer.bucket = throttle.HOST_LIMITS.bucket(host, bandwidth_limit)
+
+
+def release_host_session(transfer):
+    release, transfer.release_session = transfer.release_session, None
+    if release is not None:
+        release()
+
+
+def release_session(conn_str, session, reset, close):
+    # pooled sessions go back where they logged in, as the next user of the
+    # session resolves its relative paths, like an empty root folder, there
+    try:
+        reset(session)
+    except Exception:
+        logging.warning("Closing session to %s as it can't be reset" % conn_str.netloc)
+        try:
+            close(session)
+        except Exception:
+            pass
+        return
+    CONNECTION_POOL.release(pool_key(conn_str), session, close)
+
+
+def ftp_is_alive(ftp):
+    return ftp.voidcmd("NOOP").startswith("2")
+
+
+def ftp_reset(ftp):
+    # home is the folder of the session after the login
+    ftp.cwd(ftp.home)
+
+
+def ftp_close(ftp):
+    try:
+        ftp.quit()
+    except Exception:
+        ftp.close()
+
+
+def sftp_is_alive(sftp):
+    return sftp.pwd is not None
+
+
+def sftp_reset(sftp):
+    # paramiko resolves the paths against the login folder again, without
+    # a round trip
+    sftp.chdir(None)
+
+
+def sftp_close(sftp):
+    sftp.close()
+
+
+def sftp_list_folder(sftp, folder_path):
+    entries, folders = [], []
+    for attr in sftp.listdir_attr(folder_path):
+        path = "{}/{}".format(folder_path, attr.filename)
+        if stat.S_ISDIR(attr.st_mode):
+            folders.append(path)
+        else:
+            entries.append(FileEntry(path, attr.st_size, attr.st_mtime, None))
+    return entries, folders
+
+
+class ClientCache(object):
+    """
+    Keeps GCS/S3 clients, and the credentials they were built with, between
+    warm invocations, rebuilding them once they are older than the TTL
+    """
+
+    def __init__(self, ttl=CLIENT_CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # key -> (client, expires at)
+        self.clients = {}
+
+    def get(self, key, factory):
+        with self.lock:
+            item = self.clients.get(key)
+        if item is not None and item[1] > time.monotonic():
+            return item[0]
+
+        client = factory()
+        with self.lock:
+            self.clients[key] = (client, time.monotonic() + self.ttl)
+        return client
+
+    def clear(self):
+        with self.lock:
+            self.clients = {}
+
+
+# module-level so clients survive between warm invocations of the function
+CLIENT_CACHE = ClientCache()
+
+
+def gcs_client(service_account=None):
+    """
+    Returns a GCS client for the function's own service account or, if given,
+    for the service account JSON stored at that gs:// URI
+    """
+    from google.cloud import storage
+    from google.oauth2 import service_account as gcp_service_account
+
+    if not service_account:
+        return CLIENT_CACHE.get(("gs", None), lambda: storage.Client(project=PROJECT))
+
+    def build():
+        # the key is loaded in memory instead of being written to /tmp
+        info = json.loads(read_gcs_object(service_account))
+        credentials = gcp_service_account.Credentials.from_service_account_info(info)
+        return storage.Client(project=info["project_id"], credentials=credentials)
+
+    return CLIENT_CACHE.get(("gs", service_account), build)
+
+
+def read_gcs_object(uri):
+    buffer = io.BytesIO()
+    gcs_client().download_blob_to_file(uri, buffer)
+    return buffer.getvalue()
+
+
+def s3_client(config_file=None):
+    """
+    Returns a S3 client for the access keys in the JSON stored at the config_file
+    gs:// URI or, if not given, for boto3's default credentials
+    """
+    import boto3
+
+    if not config_file:
+        return CLIENT_CACHE.get(("s3", None), lambda: boto3.client("s3"))
+
+    def build():
+        config = json.loads(read_gcs_object(config_file))
+        return boto3.client(
+            service_name="s3",
+            aws_access_key_id=config["access_key_id"],
+            aws_secret_access_key=config["secret_access_key"],
+        )
+
+    return CLIENT_CACHE.get(("s3", config_file), build)
+
+
+def rewrite_blob(source_blob, dest_blob):
+    # large objects across locations or storage classes may need more than
+    # one rewrite call to be copied
+    token, _, _ = dest_blob.rewrite(source_blob)
+    while token is not None:
+        token, _, _ = dest_blob.rewrite(source_blob, token=token)
+
 
 # Concrete type for Google Cloud Storage Transfers
 class GcsFileTransfer(FileTransfer):
-    def __init__(self, connection_string, service_account: str = None):
+    def __init__(
+        self, connection_string, service_account: str = None, options: dict = None
+    ):
         self.gcs = None
         self.bucket = None
         self.conn_str = connection_string
         self.service_account = service_account
+        self.options = options or {}
 
     def connect(self):
-        if self.service_account:
-            self.auth_file = "/tmp/{}".format(uuid.uuid4())
-            client = storage.Client(project=PROJECT)
-            with open(self.auth_file, "wb") as f:
-                client.download_blob_to_file(self.service_account, f)
-            self.gcs = storage.Client.from_service_account_json(self.auth_file)
-        else:
-            self.gcs = storage.Client(project=PROJECT)
-        self.bucket = self.gcs.get_bucket(self.conn_str.netloc)
-        logging.info("Connected to GCS on project: " + PROJECT)
+        self.gcs = gcs_client(self.service_account)
+        # a lazy handle, which doesn't fetch the bucket metadata like get_bucket
+        self.bucket = self.gcs.bucket(self.conn_str.netloc)
+        logging.info("Connected to GCS on project: " + self.gcs.project)
 
     def download_file(self, file_path):
-        # removing the leading / so as to not create a folder with it
         file_name = file_path.split("/")[-1]
-        blob = self.bucket.blob(file_path[1:])
-        # downloading to local storage
-        blob.download_to_filename("/tmp/" + file_name)
+        blob = self._get_blob(file_path)
+        if blob.size >= self.options.get("download_threshold", DOWNLOAD_THRESHOLD):
+            download_ranges(
+                "/tmp/" + file_name,
+                blob.size,
+                lambda offset, length: self._fetch(blob, offset, length),
+                self.options.get("slice_size", SLICE_SIZE),
+                self.options.get("download_concurrency", DOWNLOAD_CONCURRENCY),
+            )
+        else:
+            # downloading to local storage
+            blob.download_to_filename("/tmp/" + file_name)
         logging.info(
             "Downloaded file %s to bucket %s successfully"
             % (file_path, self.conn_str.netloc)
@@ -81,17 +1197,73 @@ class GcsFileTransfer(FileTransfer):
 
         return file_name
 
-    def upload_file(self, file_path):
+    def upload_file(self, file_path, remote_name=None):
         # creating the final file path
-        path = self.conn_str.path[1:] + file_path
+        path = self.conn_str.path[1:] + (remote_name or file_path)
         blob = self.bucket.blob(path)
-        # uploading from local storage
-        blob.upload_from_filename("/tmp/" + file_path)
+        size = os.path.getsize("/tmp/" + file_path)
+        if size >= self.options.get("upload_threshold", MULTIPART_THRESHOLD):
+            self._upload_composite("/tmp/" + file_path, blob, size)
+        else:
+            # uploading from local storage
+            blob.upload_from_filename("/tmp/" + file_path)
         logging.info(
             "Uploaded file %s to bucket %s successfully"
             % (file_path, self.conn_str.netloc)
         )
 
+    def _upload_composite(self, local_path, blob, size):
+        """
+        Uploads the parts of the file as temporary objects in parallel and then
+        composes them into the final object. Parts already uploaded by a previous
+        attempt with the same content are kept, so a retry resumes from them
+        """
+        part_size = self.options.get("part_size", PART_SIZE)
+        prefix = "{}.parts/{}/".format(blob.name, part_size)
+        existing = {
+            part.name: part.md5_hash for part in self.bucket.list_blobs(prefix=prefix)
+        }
+
+        def upload_part(part):
+            number, offset, length = part
+            data = read_part(local_path, offset, length)
+            part_blob = self.bucket.blob("{}{:05d}".format(prefix, number))
+            checksum = base64.b64encode(hashlib.md5(data).digest()).decode("utf-8")
+            if existing.get(part_blob.name) != checksum:
+                part_blob.upload_from_string(data)
+            else:
+                logging.info("Reusing part %s of %s" % (number, blob.name))
+            return part_blob
+
+        concurrency = self.options.get("upload_concurrency", UPLOAD_CONCURRENCY)
+        with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            parts = list(executor.map(upload_part, part_ranges(size, part_size)))
+
+        self._compose(blob, parts, prefix)
+
+        # removing the temporary parts, including the intermediate compositions
+        for part in self.bucket.list_blobs(prefix=prefix):
+            part.delete()
+
+    def _compose(self, blob, parts, prefix):
+        # compose accepts a limited number of sources, so big files are composed
+        # in levels of intermediate objects
+        level = 0
+        while len(parts) > GCS_MAX_COMPOSE:
+            groups = [
+                parts[i : i + GCS_MAX_COMPOSE]
+                for i in range(0, len(parts), GCS_MAX_COMPOSE)
+            ]
+            parts = []
+            for i, group in enumerate(groups):
+                name = "{}compose-{}-{:05d}".format(prefix, level, i)
+                composed = self.bucket.blob(name)
+                composed.compose(group)
+                parts.append(composed)
+            level += 1
+
+        blob.compose(parts)
+
     def remove_file(self, file_path):
         self.bucket.delete_blob(file_path[1:])
         logging.info(
@@ -99,31 +1271,207 @@ class GcsFileTransfer(FileTransfer):
             % (file_path, self.conn_str.netloc)
         )
 
+    def remove_files(self, file_paths):
+        errors = {}
+        for i in range(0, len(file_paths), GCS_BATCH_SIZE):
+            batch = file_paths[i : i + GCS_BATCH_SIZE]
+            try:
+                # the deletions are sent together in a single HTTP request
+                with self.gcs.batch():
+                    for file_path in batch:
+                        self.bucket.delete_blob(file_path[1:])
+            except Exception:
+                # a batch only reports its first failure, so its files are
+                # removed one by one to find out which ones failed
+                errors.update(
+                    call_each(self._remove_if_exists, [(path,) for path in batch])
+                )
+        logging.info(
+            "Removed %s files from bucket %s"
+            % (len(file_paths) - len(errors), self.conn_str.netloc)
+        )
+        return errors
+
+    def _remove_if_exists(self, file_path):
+        from google.api_core import exceptions
+
+        try:
+            self.remove_file(file_path)
+        except exceptions.NotFound:
+            # already removed by the failed batch
+            pass
+
+    def rename_file(self, file_path, new_path):
+        errors = self.rename_files([(file_path, new_path)])
+        if errors:
+            raise errors[file_path]
+
+    def rename_files(self, renames):
+        def copy(file_path, new_path):
+            rewrite_blob(
+                self.bucket.blob(file_path[1:]),
+                self.bucket.blob(new_path.lstrip("/")),
+            )
+
+        return copy_and_remove(
+            copy,
+            self.remove_files,
+            renames,
+            self.options.get("upload_concurrency", UPLOAD_CONCURRENCY),
+        )
+
     def list_files(self):
-        # from the blob file list return only the file names
-        files = [
-            "/" + f.name
-            for f in self.bucket.list_blobs(
-                prefix=self.conn_str.path[1 : self.conn_str.path.rfind("/")]
+        if is_recursive(self.conn_str.path, self.options):
+            return walk_files(
+                self.conn_str.path,
+                self.list_folder,
+                self.options.get("walk_concurrency", WALK_CONCURRENCY),
             )
-        ]
-        return fnmatch.filter(
-            files, "*" + self.conn_str.path[self.conn_str.path.rfind("/") :]
+
+        folder_path, pattern = split_pattern(self.conn_str.path)
+        # the literal start of the pattern is filtered by GCS itself and the
+        # delimiter keeps the listing at the level of the folder
+        prefix = (folder_path[1:] + "/" if folder_path else "") + literal_prefix(
+            pattern
         )
+        # the iterator fetches the pages as it is consumed
+        blobs = self.bucket.list_blobs(prefix=prefix, delimiter="/")
+        entries = (
+            FileEntry(
+                "/" + blob.name,
+                blob.size,
+                blob.updated.isoformat() if blob.updated else None,
+                blob.md5_hash or blob.crc32c,
+            )
+            for blob in blobs
+        )
+        return match_entries(entries, self.conn_str.path)
+
+    def list_folder(self, folder_path):
+        prefix = folder_path[1:] + "/" if folder_path else ""
+        blobs = self.bucket.list_blobs(prefix=prefix, delimiter="/")
+        entries = [
+            FileEntry(
+                "/" + blob.name,
+                blob.size,
+                blob.updated.isoformat() if blob.updated else None,
+                blob.md5_hash or blob.crc32c,
+            )
+            for blob in blobs
+        ]
+        # the prefixes are only filled after all pages are consumed
+        folders = ["/" + prefix.rstrip("/") for prefix in blobs.prefixes]
+        return entries, folders
 
     def disconnect(self):
-        # gcs client does not require an explicit disconnect
-        if self.service_account:
-            os.remove(self.auth_file)
+        # gcs client does not require an explicit disconnect and is kept cached
+        pass
+
+    def open_read(self, file_path):
+        blob = self._get_blob(file_path)
+        if blob.size >= self.options.get("download_threshold", DOWNLOAD_THRESHOLD):
+            reader = RangedReader(
+                lambda offset, length: self._fetch(blob, offset, length),
+                blob.size,
+                self.options.get("slice_size", SLICE_SIZE),
+                self.options.get("download_concurrency", DOWNLOAD_CONCURRENCY),
+            )
+            return io.BufferedReader(reader, CHUNK_SIZE)
+        return blob.open("rb", chunk_size=CHUNK_SIZE)
+
+    def _get_blob(self, file_path):
+        # removing the leading / so as to not create a folder with it
+        blob = self.bucket.get_blob(file_path[1:])
+        if blob is None:
+            raise FileNotFoundError("File %s not found" % file_path)
+        return blob
+
+    def _fetch(self, blob, offset, length):
+        return blob.download_as_bytes(
+            # the end of the range is inclusive
+            start=offset,
+            end=offset + length - 1,
+            # every slice comes from the generation listed, never from an
+            # object overwritten halfway through the download
+            if_generation_match=blob.generation,
+        )
+
+    def can_copy_to(self, destination):
+        # the copy runs with the source credentials, so they must be the ones
+        # the destination writes with too
+        return (
+            isinstance(destination, GcsFileTransfer)
+            and destination.service_account == self.service_account
+        )
+
+    def copy_to(self, file_path, destination, file_name):
+        source_blob = self.bucket.blob(file_path[1:])
+        dest_blob = self.gcs.bucket(destination.conn_str.netloc).blob(
+            destination.conn_str.path[1:] + file_name
+        )
+        rewrite_blob(source_blob, dest_blob)
+        logging.info(
+            "Copied file %s to bucket %s successfully"
+            % (file_path, destination.conn_str.netloc)
+        )
+
+    def file_metadata(self, file_path):
+        blob = self._get_blob(file_path)
+        return FileEntry(
+            file_path,
+            blob.size,
+            blob.updated.isoformat(),
+            # composite objects only have a crc32c
+            blob.md5_hash or blob.crc32c,
+        )
+
+    def open_write(self, file_name):
+        # creating the final file path
+        path = self.conn_str.path[1:] + file_name
+        blob = self.bucket.blob(path)
+        return GcsUploadWriter(blob.open("wb", chunk_size=UPLOAD_CHUNK_SIZE))
+
+    def verify_file(self, file_name, digest):
+        blob = self.bucket.get_blob(self.conn_str.path[1:] + file_name)
+        if blob is None:
+            raise integrity.IntegrityError("File %s was not written" % file_name)
+        integrity.check_size(blob.name, blob.size, digest.size)
+        # composite objects only have a crc32c
+        if blob.crc32c and digest.crc32c is not None:
+            integrity.check_checksum(
+                blob.name, "CRC32C", blob.crc32c, digest.crc32c_base64()
+            )
+        elif blob.md5_hash:
+            integrity.check_checksum(
+                blob.name, "MD5", blob.md5_hash, digest.md5_base64()
+            )
 
 
 # Concrete type for FTP transfers
 class FtpFileTransfer(FileTransfer):
-    def __init__(self, connection_string, service_account: str = None):
+    def __init__(
+        self, connection_string, service_account: str = None, options: dict = None
+    ):
         self.ftp = None
         self.conn_str = connection_string
+        self.options = options or {}
+        self.release_session = None
+        self.bucket = None
 
     def connect(self):
+        acquire_host_session(self)
+        try:
+            self._open_session()
+        except Exception:
+            release_host_session(self)
+            raise
+
+    def _open_session(self):
+        self.ftp = CONNECTION_POOL.acquire(pool_key(self.conn_str), ftp_is_alive)
+        if self.ftp is not None:
+            logging.info("Reusing FTP session: " + self.conn_str.netloc)
+            return
+
         self.ftp = ftplib.FTP()
         # checking if a port was specified to connect
         if self.conn_str.netloc.find(":") > -1:
@@ -138,26 +1486,45 @@ class FtpFileTransfer(FileTransfer):
         auth_info = dict(parse.parse_qs(self.conn_str.query))
         self.ftp.login(auth_info["username"][0], auth_info["password"][0])
         logging.info("Login successfull")
+        self.ftp.home = self.ftp.pwd()
 
     def disconnect(self):
-        self.ftp.quit()
-        logging.info("Disconnected from " + self.conn_str.netloc)
+        if self.ftp is None:
+            return
+        # keeping the session open for the next invocations
+        release_session(self.conn_str, self.ftp, ftp_reset, ftp_close)
+        self.ftp = None
+        release_host_session(self)
+        logging.info("Released session to " + self.conn_str.netloc)
 
     def download_file(self, file_path: str):
         # creating the final file path
         file_name = file_path.split("/")[-1]
-        self.ftp.retrbinary("RETR " + file_path, open("/tmp/" + file_name, "wb").write)
+        with open("/tmp/" + file_name, "wb") as local:
+            self.ftp.retrbinary(
+                "RETR " + file_path,
+                throttle.throttle_callback(self.bucket, local.write),
+                self.options.get("block_size", CHUNK_SIZE),
+            )
         logging.info("File %s downloaded successfully" % file_name)
 
         return file_name
 
-    def upload_file(self, file_path):
-        file = open("/tmp/" + file_path, "rb")
-        # moving to the desired path
-        self.ftp.cwd(self.conn_str.path)
-        # uploading file
-        self.ftp.storbinary("STOR " + file_path, file)
-        file.close()
+    def upload_file(self, file_path, remote_name=None):
+        ftp_upload_file(
+            self.ftp,
+            "/tmp/" + file_path,
+            posixpath.join(self.conn_str.path, remote_name or file_path),
+            self.options,
+            self.bucket,
+            # under a session limit, uploading over this session alone
+            self._segment_session if self.release_session is None else None,
+        )
+
+    def _segment_session(self):
+        conn = type(self)(self.conn_str, None, self.options)
+        conn.connect()
+        return conn, conn.ftp
 
     def remove_file(self, file_path):
         # creating the final file path
@@ -165,20 +1532,92 @@ class FtpFileTransfer(FileTransfer):
         self.ftp.delete(file_path)
         logging.info("File %s removed successfully" % file_name)
 
+    def remove_files(self, file_paths):
+        return ftp_remove_files(
+            self.ftp, file_paths, self.options.get("command_window", COMMAND_WINDOW)
+        )
+
+    def rename_file(self, file_path, new_path):
+        ftp_makedirs(self.ftp, posixpath.dirname(new_path))
+        self.ftp.rename(file_path, new_path)
+
+    def rename_files(self, renames):
+        return ftp_rename_files(
+            self.ftp, renames, self.options.get("command_window", COMMAND_WINDOW)
+        )
+
     def list_files(self):
-        res = self.ftp.nlst(self.conn_str.path[: self.conn_str.path.rfind("/")])
-        return fnmatch.filter(
-            res, "*" + self.conn_str.path[self.conn_str.path.rfind("/") :]
+        if is_recursive(self.conn_str.path, self.options):
+            if self.release_session is not None:
+                # under a session limit, walking over this session alone
+                return walk_files(
+                    self.conn_str.path,
+                    lambda folder_path: ftp_list_folder(self.ftp, folder_path),
+                    0,
+                )
+            return walk_files(
+                self.conn_str.path,
+                self.list_folder,
+                self.options.get("walk_concurrency", WALK_CONCURRENCY),
+            )
+
+        return ftp_list_files(self.ftp, self.conn_str.path)
+
+    def list_folder(self, folder_path):
+        # sessions can't be shared between threads, so each listing takes one
+        # from the pool through a connection of its own
+        conn = type(self)(self.conn_str, None, self.options)
+        conn.connect()
+        try:
+            return ftp_list_folder(conn.ftp, folder_path)
+        finally:
+            conn.disconnect()
+
+    def open_read(self, file_path):
+        return throttle.throttle_stream(ftp_open_read(self.ftp, file_path), self.bucket)
+
+    def file_metadata(self, file_path):
+        return ftp_file_metadata(self.ftp, file_path)
+
+    def open_write(self, file_name):
+        return throttle.throttle_stream(
+            ftp_open_write(
+                self.ftp,
+                self.conn_str.path,
+                file_name,
+                self.options.get("block_size", CHUNK_SIZE),
+            ),
+            self.bucket,
         )
 
 
 # Concrete type for SFTP transfers
 class SftpFileTransfer(FileTransfer):
-    def __init__(self, connection_string, service_account: str = None):
+    def __init__(
+        self, connection_string, service_account: str = None, options: dict = None
+    ):
         self.sftp = None
         self.conn_str = connection_string
+        self.options = options or {}
+        self.release_session = None
+        self.bucket = None
 
     def connect(self):
+        acquire_host_session(self)
+        try:
+            self._open_session()
+        except Exception:
+            release_host_session(self)
+            raise
+
+    def _open_session(self):
+        self.sftp = CONNECTION_POOL.acquire(pool_key(self.conn_str), sftp_is_alive)
+        if self.sftp is not None:
+            logging.info("Reusing SFTP session: " + self.conn_str.netloc)
+            return
+
+        import pysftp
+
         # parsing the query parameters to a dictionary for the login components
         auth_info = dict(parse.parse_qs(self.conn_str.query))
         # ignoring known_hosts
@@ -203,22 +1642,131 @@ class SftpFileTransfer(FileTransfer):
         logging.info("Connected to SFTP: " + self.conn_str.netloc)
 
     def disconnect(self):
-        self.sftp.close()
-        logging.info("Disconnected from " + self.conn_str.netloc)
+        if self.sftp is None:
+            return
+        # keeping the session open for the next invocations
+        release_session(self.conn_str, self.sftp, sftp_reset, sftp_close)
+        self.sftp = None
+        release_host_session(self)
+        logging.info("Released session to " + self.conn_str.netloc)
 
     def download_file(self, file_path: str):
         # creating the final file path
         file_name = file_path.split("/")[-1]
-        self.sftp.get(file_path, localpath="/tmp/" + file_name)
+        size = self.sftp.stat(file_path).st_size
+        if size >= self.options.get("download_threshold", DOWNLOAD_THRESHOLD):
+            self._download_slices(file_path, "/tmp/" + file_name, size)
+        else:
+            self.sftp.get(
+                file_path,
+                localpath="/tmp/" + file_name,
+                callback=throttle.throttle_progress(self.bucket),
+            )
         logging.info("File %s downloaded successfully" % file_name)
 
         return file_name
 
-    def upload_file(self, file_path):
-        # moving to the desired path
-        self.sftp.cd(self.conn_str.path)
-        # uploading file
-        self.sftp.put("/tmp/" + file_path)
+    def upload_file(self, file_path, remote_name=None):
+        """
+        Uploads the file like ftp_upload_file, resuming the partial file of a
+        previous attempt through writes at its offset
+        """
+        local_path = "/tmp/" + file_path
+        remote_path = posixpath.join(self.conn_str.path, remote_name or file_path)
+        size = os.path.getsize(local_path)
+        # creating the subfolders of recursive transfers
+        self.sftp.makedirs(posixpath.dirname(remote_path))
+        if not self.options.get("resume", True):
+            self._write_range(local_path, remote_path, 0, size, "wb")
+            return
+
+        # under a session limit, uploading over this session alone
+        if is_segmented(size, self.options) and self.release_session is None:
+            partial_path = remote_path + SEGMENTS_SUFFIX + PARTIAL_SUFFIX
+            # sized up front, so each segment writes at its offset
+            with self.sftp.open(partial_path, "wb") as remote:
+                remote.truncate(size)
+
+            def upload_segment(part):
+                _, offset, length = part
+                conn = type(self)(self.conn_str, None, self.options)
+                conn.connect()
+                try:
+                    conn._write_range(local_path, partial_path, offset, length, "r+b")
+                finally:
+                    conn.disconnect()
+
+            upload_segments(upload_segment, size, self.options)
+        else:
+            partial_path = remote_path + PARTIAL_SUFFIX
+            offset = resume_offset(
+                local_path,
+                size,
+                self._partial_size(partial_path),
+                lambda offset: self._read_from(partial_path, offset),
+            )
+            if offset < size or not size:
+                self._write_range(
+                    local_path,
+                    partial_path,
+                    offset,
+                    size - offset,
+                    "r+b" if offset else "wb",
+                )
+        self._replace(partial_path, remote_path)
+
+    def _write_range(self, local_path, remote_path, offset, length, mode):
+        block_size = self.options.get("block_size", CHUNK_SIZE)
+        with self.sftp.open(remote_path, mode, bufsize=block_size) as remote:
+            # not waiting for the server to acknowledge each write
+            remote.set_pipelined(True)
+            remote.seek(offset)
+            with FileRange(local_path, offset, length) as local:
+                shutil.copyfileobj(
+                    local, throttle.throttle_stream(remote, self.bucket), block_size
+                )
+
+    def _partial_size(self, partial_path):
+        try:
+            return self.sftp.stat(partial_path).st_size
+        except IOError:
+            # no partial upload to resume
+            return None
+
+    def _read_from(self, file_path, offset):
+        with self.sftp.open(file_path, "rb") as remote:
+            remote.seek(offset)
+            return remote.read()
+
+    def _replace(self, partial_path, remote_path):
+        try:
+            # atomic, even over an existing file, where the server supports it
+            self.sftp.sftp_client.posix_rename(partial_path, remote_path)
+            return
+        except IOError:
+            pass
+        try:
+            self.sftp.rename(partial_path, remote_path)
+        except IOError:
+            # SFTP v3 servers don't rename over an existing file
+            if not self.sftp.exists(remote_path):
+                raise
+            self.sftp.remove(remote_path)
+            self.sftp.rename(partial_path, remote_path)
+
+    def _download_slices(self, file_path, local_path, size):
+        # readv pipelines the read requests of several slices over the same
+        # channel, which is what limits a single sequential get
+        parts = part_ranges(size, self.options.get("slice_size", SLICE_SIZE))
+        concurrency = self.options.get("download_concurrency", DOWNLOAD_CONCURRENCY)
+        with self.sftp.open(file_path, "rb") as remote:
+            with open(local_path, "wb") as local:
+                write = throttle.throttle_callback(self.bucket, local.write)
+                # requesting a batch of slices at a time to bound memory usage
+                for i in range(0, len(parts), concurrency):
+                    batch = parts[i : i + concurrency]
+                    for data in remote.readv([(o, n) for _, o, n in batch]):
+                        write(data)
 
     def remove_file(self, file_path):
         # creating the final file path
@@ -226,14 +1774,76 @@ class SftpFileTransfer(FileTransfer):
         self.sftp.remove(file_path)
         logging.info("File %s removed successfully" % file_name)
 
+    def rename_file(self, file_path, new_path):
+        # SFTP has no pipelined requests in pysftp, so files are moved one by one
+        self.sftp.makedirs(posixpath.dirname(new_path))
+        self.sftp.rename(file_path, new_path)
+
     def list_files(self):
-        folder_path = self.conn_str.path[: self.conn_str.path.rfind("/")]
-        # listdir does not include the folder path, so we manually add it
-        res = ["{}/{}".format(folder_path, f) for f in self.sftp.listdir(folder_path)]
-        return fnmatch.filter(
-            res, "*" + self.conn_str.path[self.conn_str.path.rfind("/") :]
+        if is_recursive(self.conn_str.path, self.options):
+            if self.release_session is not None:
+                # under a session limit, walking over this session alone
+                return walk_files(
+                    self.conn_str.path,
+                    lambda folder_path: sftp_list_folder(self.sftp, folder_path),
+                    0,
+                )
+            return walk_files(
+                self.conn_str.path,
+                self.list_folder,
+                self.options.get("walk_concurrency", WALK_CONCURRENCY),
+            )
+
+        folder_path, _ = split_pattern(self.conn_str.path)
+        # listdir_attr does not include the folder path, so we manually add it
+        entries = (
+            FileEntry(
+                "{}/{}".format(folder_path, attr.filename),
+                attr.st_size,
+                attr.st_mtime,
+                None,
+            )
+            for attr in self.sftp.listdir_attr(folder_path)
+            if not stat.S_ISDIR(attr.st_mode)
+        )
+        return match_entries(entries, self.conn_str.path)
+
+    def open_read(self, file_path):
+        file = self.sftp.open(file_path, "rb", bufsize=CHUNK_SIZE)
+        # requesting the blocks ahead of the reads instead of one round trip each
+        file.prefetch()
+        return throttle.throttle_stream(file, self.bucket)
+
+    def list_folder(self, folder_path):
+        # sessions can't be shared between threads, so each listing takes one
+        # from the pool through a connection of its own
+        conn = type(self)(self.conn_str, None, self.options)
+        conn.connect()
+        try:
+            return sftp_list_folder(conn.sftp, folder_path)
+        finally:
+            conn.disconnect()
+
+    def open_write(self, file_name):
+        remote_path = posixpath.join(self.conn_str.path, file_name)
+        partial_path = remote_path + PARTIAL_SUFFIX
+        # creating the subfolders of recursive transfers
+        self.sftp.makedirs(posixpath.dirname(remote_path))
+        file = self.sftp.open(
+            partial_path, "wb", bufsize=self.options.get("block_size", CHUNK_SIZE)
+        )
+        # not waiting for the server to acknowledge each write
+        file.set_pipelined(True)
+        return PartialWriter(
+            throttle.throttle_stream(file, self.bucket),
+            lambda: self._replace(partial_path, remote_path),
+            lambda: self.sftp.remove(partial_path),
         )
 
+    def file_metadata(self, file_path):
+        attr = self.sftp.stat(file_path)
+        return FileEntry(file_path, attr.st_size, attr.st_mtime, None)
+
 
 class ImplicitFTP_TLS(ftplib.FTP_TLS):
     """FTP_TLS subclass that automatically wraps sockets in SSL to support implicit FTPS."""
@@ -257,11 +1867,29 @@ class ImplicitFTP_TLS(ftplib.FTP_TLS):
 
 # Concrete type for FTPS transfers
 class FtpsFileTransfer(FileTransfer):
-    def __init__(self, connection_string, service_account: str = None):
+    def __init__(
+        self, connection_string, service_account: str = None, options: dict = None
+    ):
         self.ftps = None
         self.conn_str = connection_string
+        self.options = options or {}
+        self.release_session = None
+        self.bucket = None
 
     def connect(self):
+        acquire_host_session(self)
+        try:
+            self._open_session()
+        except Exception:
+            release_host_session(self)
+            raise
+
+    def _open_session(self):
+        self.ftps = CONNECTION_POOL.acquire(pool_key(self.conn_str), ftp_is_alive)
+        if self.ftps is not None:
+            logging.info("Reusing FTPS session: " + self.conn_str.netloc)
+            return
+
         ctx = ssl._create_stdlib_context(ssl.PROTOCOL_TLSv1_2)
         self.ftps = ImplicitFTP_TLS(context=ctx)
         # checking if a port was specified to connect
@@ -279,26 +1907,45 @@ class FtpsFileTransfer(FileTransfer):
         logging.info("Login successfull")
         self.ftps.prot_p()
         logging.info("Protection level set to P successfull")
+        self.ftps.home = self.ftps.pwd()
 
     def disconnect(self):
-        self.ftps.quit()
-        logging.info("Disconnected from " + self.conn_str.netloc)
+        if self.ftps is None:
+            return
+        # keeping the session open for the next invocations
+        release_session(self.conn_str, self.ftps, ftp_reset, ftp_close)
+        self.ftps = None
+        release_host_session(self)
+        logging.info("Released session to " + self.conn_str.netloc)
 
     def download_file(self, file_path: str):
         # creating the final file path
         file_name = file_path.split("/")[-1]
-        self.ftps.retrbinary("RETR " + file_path, open("/tmp/" + file_name, "wb").write)
+        with open("/tmp/" + file_name, "wb") as local:
+            self.ftps.retrbinary(
+                "RETR " + file_path,
+                throttle.throttle_callback(self.bucket, local.write),
+                self.options.get("block_size", CHUNK_SIZE),
+            )
         logging.info("File %s downloaded successfully" % file_name)
 
         return file_name
 
-    def upload_file(self, file_path):
-        file = open("/tmp/" + file_path, "rb")
-        # moving to the desired path
-        self.ftps.cwd(self.conn_str.path)
-        # uploading file
-        self.ftps.storbinary("STOR " + file_path, file)
-        file.close()
+    def upload_file(self, file_path, remote_name=None):
+        ftp_upload_file(
+            self.ftps,
+            "/tmp/" + file_path,
+            posixpath.join(self.conn_str.path, remote_name or file_path),
+            self.options,
+            self.bucket,
+            # under a session limit, uploading over this session alone
+            self._segment_session if self.release_session is None else None,
+        )
+
+    def _segment_session(self):
+        conn = type(self)(self.conn_str, None, self.options)
+        conn.connect()
+        return conn, conn.ftps
 
     def remove_file(self, file_path):
         # creating the final file path
@@ -306,10 +1953,64 @@ class FtpsFileTransfer(FileTransfer):
         self.ftps.delete(file_path)
         logging.info("File %s removed successfully" % file_name)
 
+    def remove_files(self, file_paths):
+        return ftp_remove_files(
+            self.ftps, file_paths, self.options.get("command_window", COMMAND_WINDOW)
+        )
+
+    def rename_file(self, file_path, new_path):
+        ftp_makedirs(self.ftps, posixpath.dirname(new_path))
+        self.ftps.rename(file_path, new_path)
+
+    def rename_files(self, renames):
+        return ftp_rename_files(
+            self.ftps, renames, self.options.get("command_window", COMMAND_WINDOW)
+        )
+
     def list_files(self):
-        res = self.ftps.nlst(self.conn_str.path[: self.conn_str.path.rfind("/")])
-        return fnmatch.filter(
-            res, "*" + self.conn_str.path[self.conn_str.path.rfind("/") :]
+        if is_recursive(self.conn_str.path, self.options):
+            if self.release_session is not None:
+                # under a session limit, walking over this session alone
+                return walk_files(
+                    self.conn_str.path,
+                    lambda folder_path: ftp_list_folder(self.ftps, folder_path),
+                    0,
+                )
+            return walk_files(
+                self.conn_str.path,
+                self.list_folder,
+                self.options.get("walk_concurrency", WALK_CONCURRENCY),
+            )
+
+        return ftp_list_files(self.ftps, self.conn_str.path)
+
+    def list_folder(self, folder_path):
+        # sessions can't be shared between threads, so each listing takes one
+        # from the pool through a connection of its own
+        conn = type(self)(self.conn_str, None, self.options)
+        conn.connect()
+        try:
+            return ftp_list_folder(conn.ftps, folder_path)
+        finally:
+            conn.disconnect()
+
+    def open_read(self, file_path):
+        return throttle.throttle_stream(
+            ftp_open_read(self.ftps, file_path), self.bucket
+        )
+
+    def file_metadata(self, file_path):
+        return ftp_file_metadata(self.ftps, file_path)
+
+    def open_write(self, file_name):
+        return throttle.throttle_stream(
+            ftp_open_write(
+                self.ftps,
+                self.conn_str.path,
+                file_name,
+                self.options.get("block_size", CHUNK_SIZE),
+            ),
+            self.bucket,
         )
 
 
@@ -318,54 +2019,61 @@ class S3FileTransfer(FileTransfer):
     Concrete FileTransfer for S3 connections
     """
 
-    def __init__(self, connection_string, project, config_file):
-        FileTransfer.__init__(self, connection_string)
-        self.config_file = config_file
-        self.project = project
+    def __init__(
+        self, connection_string, service_account: str = None, options: dict = None
+    ):
+        FileTransfer.__init__(self, connection_string, service_account, options)
+        # gs:// URI of the JSON with the access keys, given as a query parameter
+        auth_info = dict(parse.parse_qs(connection_string.query))
+        self.config_file = auth_info.get("config_file", [None])[0]
         self.s3 = None
-        self.job_id = uuid.uuid4()
 
     def connect(self):
-        self.auth_file = "/tmp/{0}/{0}.json".format(self.job_id)
-        client = storage.Client(self.project)
-
-        with open(self.auth_file, "wb") as f:
-            client.download_blob_to_file(self.config_file, f)
+        self.s3 = s3_client(self.config_file)
 
-        with open(self.auth_file, "r") as fi:
-            config = json.loads(fi.read())
-
-        self.s3 = boto3.client(
-            service_name="s3",
-            aws_access_key_id=config["access_key_id"],
-            aws_secret_access_key=config["secret_access_key"],
-        )
-
-        logging.info(
-            "Connected to S3 in profile: {}".format(boto3.DEFAULT_SESSION.profile_name)
-        )
+        logging.info("Connected to S3 bucket: {}".format(self.connection_string.netloc))
 
     def disconnect(self):
+        # s3 client does not require an explicit disconnect and is kept cached
         logging.info(
-            "Disconnected from S3 in profile: {}".format(
-                boto3.DEFAULT_SESSION.profile_name
-            )
+            "Disconnected from S3 bucket: {}".format(self.connection_string.netloc)
         )
 
-    def download_file(self, file_path: str):
-        # removing the leading / so as to not create a folder with it
-        base_path = "{}/".format(
-            self.connection_string.path[1 : self.connection_string.path.rfind("/")]
+    def _source_key(self, file_path):
+        # listed paths are the keys with a leading /, which is removed so as to
+        # not create a folder with it
+        return file_path[1:]
+
+    def _fetch(self, key, etag, offset, length):
+        res = self.s3.get_object(
+            Bucket=self.connection_string.netloc,
+            Key=key,
+            # the end of the range is inclusive
+            Range="bytes={}-{}".format(offset, offset + length - 1),
+            # every slice comes from the same version of the object, never from
+            # one overwritten halfway through the download
+            IfMatch=etag,
         )
-        base_path = base_path if base_path != "/" else ""
+        return res["Body"].read()
 
+    def download_file(self, file_path: str):
+        key = self._source_key(file_path)
         file_name = file_path.split("/")[-1]
-        dest_path = "/tmp/{}/{}".format(self.job_id, file_name)
-
-        with open(dest_path, "wb") as f:
-            self.s3.download_fileobj(
-                self.connection_string.netloc, "{}{}".format(base_path, file_name), f
+        dest_path = "/tmp/{}".format(file_name)
+
+        head = self.s3.head_object(Bucket=self.connection_string.netloc, Key=key)
+        size = head["ContentLength"]
+        if size >= self.options.get("download_threshold", DOWNLOAD_THRESHOLD):
+            download_ranges(
+                dest_path,
+                size,
+                lambda offset, length: self._fetch(key, head["ETag"], offset, length),
+                self.options.get("slice_size", SLICE_SIZE),
+                self.options.get("download_concurrency", DOWNLOAD_CONCURRENCY),
             )
+        else:
+            with open(dest_path, "wb") as f:
+                self.s3.download_fileobj(self.connection_string.netloc, key, f)
 
         logging.info(
             "Downloaded file {} from S3 {} successfully".format(
@@ -373,9 +2081,9 @@ class S3FileTransfer(FileTransfer):
             )
         )
 
-        return dest_path
+        return file_name
 
-    def upload_file(self, file_path):
+    def upload_file(self, file_path, remote_name=None):
         # creating the final file path
         base_path = self.connection_string.path[1:]
         base_path = (
@@ -383,10 +2091,16 @@ class S3FileTransfer(FileTransfer):
             if base_path.endswith("/") or base_path == ""
             else "{}/".format(base_path)
         )
-        path = "{}{}".format(base_path, file_path[file_path.rfind("/") + 1 :])
+        path = "{}{}".format(
+            base_path, remote_name or file_path[file_path.rfind("/") + 1 :]
+        )
 
-        with open(file_path, "rb") as f:
-            self.s3.upload_fileobj(f, self.connection_string.netloc, path)
+        size = os.path.getsize("/tmp/" + file_path)
+        if size >= self.options.get("upload_threshold", MULTIPART_THRESHOLD):
+            self._upload_multipart("/tmp/" + file_path, path, size)
+        else:
+            with open("/tmp/" + file_path, "rb") as f:
+                self.s3.upload_fileobj(f, self.connection_string.netloc, path)
 
         logging.info(
             "Uploaded file {} to S3 {} successfully".format(
@@ -394,9 +2108,77 @@ class S3FileTransfer(FileTransfer):
             )
         )
 
+    def _upload_multipart(self, local_path, key, size):
+        """
+        Uploads the file as a multipart upload with parts sent in parallel. An
+        unfinished upload of the same key left by a previous attempt is resumed,
+        keeping the parts whose content matches the local file
+        """
+        bucket = self.connection_string.netloc
+        part_size = max(self.options.get("part_size", PART_SIZE), MIN_PART_SIZE)
+        upload_id, existing = self._find_multipart_upload(key)
+        if upload_id is None:
+            upload_id = self.s3.create_multipart_upload(Bucket=bucket, Key=key)[
+                "UploadId"
+            ]
+
+        def upload_part(part):
+            number, offset, length = part
+            data = read_part(local_path, offset, length)
+            # the etag of a part is the md5 of its content
+            etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+            if existing.get(number) != etag:
+                etag = self.s3.upload_part(
+                    Bucket=bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=data,
+                    ContentMD5=content_md5(data),
+                )["ETag"]
+            else:
+                logging.info("Reusing part {} of {}".format(number, key))
+            return {"ETag": etag, "PartNumber": number}
+
+        concurrency = self.options.get("upload_concurrency", UPLOAD_CONCURRENCY)
+        with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            parts = list(executor.map(upload_part, part_ranges(size, part_size)))
+
+        self.s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def _find_multipart_upload(self, key):
+        # returns the id and the {part number: etag} of the latest unfinished
+        # upload of the key, if there is one
+        bucket = self.connection_string.netloc
+        uploads = [
+            upload
+            for upload in self.s3.list_multipart_uploads(
+                Bucket=bucket, Prefix=key
+            ).get("Uploads", [])
+            if upload["Key"] == key
+        ]
+        if not uploads:
+            return None, {}
+
+        upload_id = max(uploads, key=lambda upload: upload["Initiated"])["UploadId"]
+        parts = {}
+        paginator = self.s3.get_paginator("list_parts")
+        for page in paginator.paginate(Bucket=bucket, Key=key, UploadId=upload_id):
+            for part in page.get("Parts", []):
+                parts[part["PartNumber"]] = part["ETag"]
+        logging.info("Resuming upload of {} with {} parts".format(key, len(parts)))
+
+        return upload_id, parts
+
     def remove_file(self, file_path):
-        # creating the final file path
-        self.s3.Object(self.connection_string.netloc, file_path).delete()
+        self.s3.delete_object(
+            Bucket=self.connection_string.netloc, Key=self._source_key(file_path)
+        )
 
         logging.info(
             "Removed file {} from S3 {} successfully".format(
@@ -404,32 +2186,194 @@ class S3FileTransfer(FileTransfer):
             )
         )
 
+    def remove_files(self, file_paths):
+        errors = {}
+        paths = {self._source_key(file_path): file_path for file_path in file_paths}
+        keys = list(paths)
+        for i in range(0, len(keys), S3_DELETE_BATCH):
+            # up to 1000 keys per request, reporting only the failed ones
+            response = self.s3.delete_objects(
+                Bucket=self.connection_string.netloc,
+                Delete={
+                    "Objects": [{"Key": key} for key in keys[i : i + S3_DELETE_BATCH]],
+                    "Quiet": True,
+                },
+            )
+            for error in response.get("Errors", []):
+                errors[paths[error["Key"]]] = IOError(
+                    "{}: {}".format(error["Code"], error["Message"])
+                )
+        logging.info(
+            "Removed {} files from S3 {}".format(
+                len(file_paths) - len(errors), self.connection_string.netloc
+            )
+        )
+        return errors
+
+    def rename_file(self, file_path, new_path):
+        errors = self.rename_files([(file_path, new_path)])
+        if errors:
+            raise errors[file_path]
+
+    def rename_files(self, renames):
+        def copy(file_path, new_path):
+            self._copy_object(
+                self._source_key(file_path),
+                self.connection_string.netloc,
+                new_path.lstrip("/"),
+            )
+
+        return copy_and_remove(
+            copy,
+            self.remove_files,
+            renames,
+            self.options.get("upload_concurrency", UPLOAD_CONCURRENCY),
+        )
+
     def list_files(self):
-        folder_path = self.connection_string.path[
-            : self.connection_string.path.rfind("/")
-        ]
-        # listdir does not include the folder path, so we manually add it
-        files = [
-            f["Key"]
-            for f in self.s3.list_objects_v2(Bucket=self.connection_string.netloc).get(
-                "Contents", []
+        if is_recursive(self.connection_string.path, self.options):
+            return walk_files(
+                self.connection_string.path,
+                self.list_folder,
+                self.options.get("walk_concurrency", WALK_CONCURRENCY),
             )
-        ]
-        res = ["{}/{}".format(folder_path, f) for f in files]
-        match = fnmatch.filter(
-            res,
-            "*" + self.connection_string.path[self.connection_string.path.rfind("/") :],
+
+        folder_path, pattern = split_pattern(self.connection_string.path)
+        prefix = (folder_path[1:] + "/" if folder_path else "") + literal_prefix(
+            pattern
+        )
+        # list_objects_v2 returns at most 1000 keys per call
+        paginator = self.s3.get_paginator("list_objects_v2")
+        pages = paginator.paginate(
+            Bucket=self.connection_string.netloc, Prefix=prefix, Delimiter="/"
+        )
+        entries = (
+            FileEntry(
+                "/" + f["Key"], f["Size"], f["LastModified"].isoformat(), f["ETag"]
+            )
+            for page in pages
+            for f in page.get("Contents", [])
+        )
+        return match_entries(entries, self.connection_string.path)
+
+    def list_folder(self, folder_path):
+        prefix = folder_path[1:] + "/" if folder_path else ""
+        paginator = self.s3.get_paginator("list_objects_v2")
+        entries, folders = [], []
+        for page in paginator.paginate(
+            Bucket=self.connection_string.netloc, Prefix=prefix, Delimiter="/"
+        ):
+            for f in page.get("Contents", []):
+                mtime = f["LastModified"].isoformat()
+                entries.append(FileEntry("/" + f["Key"], f["Size"], mtime, f["ETag"]))
+            for folder in page.get("CommonPrefixes", []):
+                folders.append("/" + folder["Prefix"].rstrip("/"))
+        return entries, folders
+
+    def open_read(self, file_path):
+        key = self._source_key(file_path)
+        res = self.s3.get_object(Bucket=self.connection_string.netloc, Key=key)
+        if res["ContentLength"] >= self.options.get(
+            "download_threshold", DOWNLOAD_THRESHOLD
+        ):
+            # the body is dropped in favor of concurrent range requests
+            res["Body"].close()
+            reader = RangedReader(
+                lambda offset, length: self._fetch(key, res["ETag"], offset, length),
+                res["ContentLength"],
+                self.options.get("slice_size", SLICE_SIZE),
+                self.options.get("download_concurrency", DOWNLOAD_CONCURRENCY),
+            )
+            return io.BufferedReader(reader, CHUNK_SIZE)
+        return io.BufferedReader(S3ReadStream(res["Body"]), CHUNK_SIZE)
+
+    def file_metadata(self, file_path):
+        res = self.s3.head_object(
+            Bucket=self.connection_string.netloc, Key=self._source_key(file_path)
+        )
+        return FileEntry(
+            file_path,
+            res["ContentLength"],
+            res["LastModified"].isoformat(),
+            res["ETag"],
+        )
+
+    def _destination_key(self, file_name):
+        base_path = self.connection_string.path[1:]
+        base_path = (
+            base_path
+            if base_path.endswith("/") or base_path == ""
+            else "{}/".format(base_path)
+        )
+        return "{}{}".format(base_path, file_name)
+
+    def can_copy_to(self, destination):
+        # the source client must be able to write to the destination too
+        return (
+            isinstance(destination, S3FileTransfer)
+            and destination.config_file == self.config_file
+        )
+
+    def copy_to(self, file_path, destination, file_name):
+        self._copy_object(
+            self._source_key(file_path),
+            destination.connection_string.netloc,
+            destination._destination_key(file_name),
+        )
+        logging.info(
+            "Copied file {} to S3 {} successfully".format(
+                file_path, destination.connection_string.netloc
+            )
+        )
+
+    def _copy_object(self, source_key, bucket, key):
+        from boto3.s3.transfer import TransferConfig
+
+        # boto3 switches to a parallel multipart copy for large objects
+        self.s3.copy(
+            CopySource={"Bucket": self.connection_string.netloc, "Key": source_key},
+            Bucket=bucket,
+            Key=key,
+            Config=TransferConfig(
+                multipart_threshold=self.options.get(
+                    "upload_threshold", MULTIPART_THRESHOLD
+                ),
+                multipart_chunksize=self.options.get("part_size", PART_SIZE),
+                max_concurrency=self.options.get(
+                    "upload_concurrency", UPLOAD_CONCURRENCY
+                ),
+            ),
+        )
+
+    def open_write(self, file_name):
+        # the writer already buffers a whole part, so it is returned unwrapped
+        return S3MultipartWriter(
+            self.s3,
+            self.connection_string.netloc,
+            self._destination_key(file_name),
+            self.options.get("part_size", UPLOAD_CHUNK_SIZE),
+            self.options.get("upload_concurrency", UPLOAD_CONCURRENCY),
         )
-        logging.info("Matched files: {}".format(", ".join(match)))
 
-        return match
+    def verify_file(self, file_name, digest):
+        key = self._destination_key(file_name)
+        head = self.s3.head_object(Bucket=self.connection_string.netloc, Key=key)
+        integrity.check_size(key, head["ContentLength"], digest.size)
+        # multipart ETags and those of KMS encrypted objects aren't the md5 of the
+        # content, their parts are checked by S3 itself through Content-MD5
+        etag = head["ETag"].strip('"')
+        if "-" not in etag and head.get("ServerSideEncryption") != "aws:kms":
+            integrity.check_checksum(key, "MD5", etag, digest.md5.hexdigest())
 
 
 def get_transfer_types():
-    return {
-        "ftp": FtpFileTransfer,
-        "ftps": FtpsFileTransfer,
-        "sftp": SftpFileTransfer,
-        "gs": GcsFileTransfer,
-        "s3": S3FileTransfer,
-    }
+    # other providers may be added with register(scheme, "module:Class")
+    return registry.Registry(
+        {
+            "ftp": FtpFileTransfer,
+            "ftps": FtpsFileTransfer,
+            "sftp": SftpFileTransfer,
+            "gs": GcsFileTransfer,
+            "s3": S3FileTransfer,
+        }
+    )